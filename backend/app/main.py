@@ -4,14 +4,21 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from fastapi.openapi.docs import get_swagger_ui_html
 from datetime import datetime
+import os
 import pandas as pd
 
 # Importar routers
 from app.routers.covid import router as covid_router
 from app.routers.weather import router as weather_router
 from app.routers.elections import router as elections_router
-from app.routers.air_quality import router as air_quality_router
+from app.routers.air_quality import router as air_quality_router, construir_snapshot_miteco, ingerir_snapshot_miteco
 from app.routers.housing import router as housing_router
+from app.routers.places import router as places_router
+from app.database import SessionLocal
+from app.services.elections_payload import ElectionsMapPayload
+from app.services.place_index import PlaceIndex
+from app.services.air_quality_snapshot import AirQualitySnapshot
+from app.services.air_quality_surface import AirQualitySurface
 
 app = FastAPI(
     root_path="/api/geo",
@@ -37,6 +44,29 @@ app.include_router(weather_router)
 app.include_router(elections_router)
 app.include_router(air_quality_router)
 app.include_router(housing_router)
+app.include_router(places_router)
+
+# Precalcular payloads en memoria al arrancar cada worker
+@app.on_event("startup")
+async def warm_caches():
+    db = SessionLocal()
+    try:
+        ElectionsMapPayload.warm(db)
+        PlaceIndex.warm(db)
+    finally:
+        db.close()
+    
+    # Refresco horario del feed MITECO en segundo plano (un solo worker descarga;
+    # cada worker precalcula después la superficie IDW por defecto). Sin refresco
+    # el worker solo recoge los snapshots que escriban otros procesos
+    if os.getenv("AIR_QUALITY_REFRESH_ENABLED", "true").lower() == "true":
+        AirQualitySnapshot.start(construir_snapshot_miteco, ingerir_snapshot_miteco, AirQualitySurface.warm)
+    else:
+        AirQualitySnapshot.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await AirQualitySnapshot.stop()
 
 # Endpoints generales (comunes a todos)
 @app.get("/")
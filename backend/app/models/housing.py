@@ -1,6 +1,6 @@
 # backend/app/models/housing.py
-from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint, Index
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, Boolean, String, Float, DateTime, UniqueConstraint, Index
+from sqlalchemy.sql import func, desc
 from datetime import datetime
 from app.database import Base
 
@@ -26,7 +26,9 @@ class HousingINECache(Base):
         Index('idx_housing_periodo', 'periodo'),
         Index('idx_housing_ccaa', 'ccaa_codigo'),
         Index('idx_housing_tipo', 'tipo_vivienda'),
-        Index('idx_housing_metrica', 'metrica'),
+        # Filtro + orden de /api/housing/data con index-only scan
+        Index('idx_housing_consulta', 'metrica', 'tipo_vivienda', desc('anio'), desc('trimestre'),
+              'ccaa_codigo', 'periodo', postgresql_include=['ccaa_nombre', 'valor']),
     )
     
     class Config:
@@ -36,12 +38,52 @@ class HousingINECache(Base):
         return f"<HousingINECache({self.periodo}, {self.ccaa_codigo}, {self.tipo_vivienda})>"
 
 
+class HousingINECacheMeta(Base):
+    """Metadatos del caché actual (una sola fila, escrita en cada refresco)"""
+    
+    __tablename__ = "housing_ine_cache_meta"
+    
+    id = Column(SmallInteger, primary_key=True, default=1)
+    version = Column(Integer, nullable=False)  # version_id del historial con este contenido
+    refreshed_at = Column(DateTime, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    
+    def __repr__(self):
+        return f"<HousingINECacheMeta(v{self.version}, {self.refreshed_at}, {self.row_count} registros)>"
+
+
+class HousingINESnapshotVersion(Base):
+    """Versión del historial de vivienda: un contenido distinto publicado por el INE"""
+    
+    __tablename__ = "housing_ine_snapshot_versions"
+    
+    version_id = Column(Integer, primary_key=True)
+    snapshot_date = Column(DateTime, nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 del contenido canónico
+    row_count = Column(Integer, nullable=False)
+    changed_rows = Column(Integer, nullable=False, default=0)
+    is_base = Column(Boolean, nullable=False, default=False)  # contenido completo, no solo cambios
+    
+    __table_args__ = (
+        Index('idx_snapshot_versions_date', 'snapshot_date'),
+    )
+    
+    def __repr__(self):
+        return f"<HousingINESnapshotVersion({self.version_id}, {self.snapshot_date}, {self.changed_rows} cambios)>"
+
+
 class HousingINESnapshot(Base):
-    """Snapshots históricos de datos del INE - Índice de Precios de Vivienda"""
+    """
+    Filas del historial de vivienda: solo las que cambian en cada versión
+    (deleted=True marca las que desaparecen). Tabla particionada por mes de
+    snapshot_date (docker/init-db.sql)
+    """
     
     __tablename__ = "housing_ine_snapshots"
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger, primary_key=True)
+    version_id = Column(Integer, nullable=False)
     periodo = Column(String(10), nullable=False)
     anio = Column(Integer, nullable=False)
     trimestre = Column(Integer, nullable=False)
@@ -50,19 +92,17 @@ class HousingINESnapshot(Base):
     tipo_vivienda = Column(String(100), nullable=False)
     metrica = Column(String(100), nullable=False)
     valor = Column(Float, nullable=True)
-    snapshot_date = Column(DateTime, server_default=func.now(), default=datetime.utcnow)
+    deleted = Column(Boolean, nullable=False, default=False)
+    snapshot_date = Column(DateTime, primary_key=True)
     
     __table_args__ = (
-        # No unique constraint aquí: queremos múltiples snapshots de la misma combinación
-        Index('idx_snapshot_periodo', 'periodo'),
-        Index('idx_snapshot_ccaa', 'ccaa_codigo'),
-        Index('idx_snapshot_tipo', 'tipo_vivienda'),
-        Index('idx_snapshot_metrica', 'metrica'),
-        Index('idx_snapshot_date', 'snapshot_date'),
+        # Sin unique: la misma combinación aparece en cada versión en la que cambia
+        Index('idx_snapshot_estado', 'metrica', 'tipo_vivienda', 'ccaa_codigo', 'periodo', 'version_id'),
+        Index('idx_snapshot_version', 'version_id'),
     )
     
     class Config:
         from_attributes = True
     
     def __repr__(self):
-        return f"<HousingINESnapshot({self.periodo}, {self.ccaa_codigo}, {self.snapshot_date})>"
\ No newline at end of file
+        return f"<HousingINESnapshot(v{self.version_id}, {self.periodo}, {self.ccaa_codigo}, {self.snapshot_date})>"
@@ -4,11 +4,13 @@ from .weather import router as weather_router
 from .elections import router as elections_router
 from .air_quality import router as air_quality_router
 from .housing import router as housing_router
+from .places import router as places_router
 
 __all__ = [
     "covid_router", 
     "weather_router", 
     "elections_router",
     "air_quality_router",
-    "housing_router"
+    "housing_router",
+    "places_router"
 ]
\ No newline at end of file
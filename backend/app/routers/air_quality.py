@@ -3,22 +3,42 @@ Módulo para calidad del aire - Datos REALES del Gobierno de España (MITECO)
 API: Índice Nacional de Calidad del Aire (ICA)
 URLs: https://ica.miteco.es/datos/
 """
-import requests
-import csv
-from io import StringIO
+import asyncio
+import os
+import time
+import httpx
 from typing import List, Dict, Optional
 from datetime import datetime
 import random
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Depends, Response
+from sqlalchemy.orm import Session
+from app.database import get_db, SessionLocal
+from app.utils.wire_format import validar_formato, dicts_a_columnas, a_columnar, respuesta_arrow
+from app.utils.miteco_csv import ICA_TO_AQI, fila_columnas, filas_columnas, parsear_csv_miteco_columnas
+from app.services.air_quality_snapshot import AirQualitySnapshot
+from app.services.air_quality_history import AirQualityHistoryService
+from app.services.air_quality_store import StationStore, obtener_calidad_texto, VENTANAS
+from app.services.air_quality_surface import AirQualitySurface, BBOX_DEFECTO, RESOLUCION_DEFECTO, RESOLUCIONES, MAX_CELDAS, IDW_POTENCIA
 
 router = APIRouter(prefix="/api", tags=["air-quality"])
 
-# URLs de datos REALES del MITECO
+# URLs de datos REALES del MITECO (MITECO_BASE_URL permite apuntar a un servidor local de pruebas)
+MITECO_BASE_URL = os.getenv("MITECO_BASE_URL", "https://ica.miteco.es/datos").rstrip("/")
 MITECO_CSV_URLS = {
-    'last_hour': 'https://ica.miteco.es/datos/ica-ultima-hora.csv',
-    'last_24h': 'https://ica.miteco.es/datos/ica-ultimas-24-horas.csv',
-    'forecast': 'https://ica.miteco.es/datos/ica-previsto.csv'
+    'last_hour': f'{MITECO_BASE_URL}/ica-ultima-hora.csv',
+    'last_24h': f'{MITECO_BASE_URL}/ica-ultimas-24-horas.csv',
+    'forecast': f'{MITECO_BASE_URL}/ica-previsto.csv'
 }
+# Ventana de /stations que sirve cada feed
+FEED_VENTANA = {'last_hour': '1h', 'last_24h': '24h', 'forecast': 'forecast'}
+FUENTE_VENTANA = {
+    '1h': "MITECO ICA - Última hora",
+    '24h': "MITECO ICA - Últimas 24 horas",
+    'forecast': "MITECO ICA - Previsión"
+}
+# La cadena de certificados de ica.miteco.es no valida en todos los entornos
+MITECO_VERIFY_SSL = os.getenv("MITECO_VERIFY_SSL", "false").lower() == "true"
+MITECO_TIMEOUT_SECONDS = 15
 
 # Diccionario de contaminantes
 CONTAMINANTES = {
@@ -31,296 +51,145 @@ CONTAMINANTES = {
     'BaP': 'Benzo(a)pyrene'
 }
 
-# Mapeo de índice ICA (1-6) a nuestro AQI (1-5)
-ICA_TO_AQI = {
-    1: 1,  # Buena
-    2: 2,  # Razonablemente buena
-    3: 3,  # Regular
-    4: 4,  # Desfavorable
-    5: 5,  # Muy desfavorable
-    6: 5   # Extremadamente desfavorable
-}
+# Columnas del modo light y cuáles se codifican como diccionario en format=columnar/arrow
+COLUMNAS_LIGHT = [
+    'id', 'name', 'lat', 'lon', 'last_aqi', 'quality_color',
+    'pollutant', 'station_code', 'is_active'
+]
+COLUMNAS_DICCIONARIO = ('quality_color', 'pollutant')
 
-# ✅ NUEVO: Mapeo de tipo MITECO a station_class
-TIPO_TO_CLASS = {
-    'FONDO': 1,        # Urbana de fondo
-    'TRAFICO': 4,      # Tráfico
-    'INDUSTRIAL': 2,   # Suburbana/Industrial
-    'RURAL': 3         # Rural
-}
+# Máximo de puntos por petición en /nearest?puntos=
+MAX_PUNTOS_NEAREST = 500
 
 
-def descargar_datos_miteco(tipo: str = 'last_hour') -> List[Dict]:
-    """Descarga y parsea datos del MITECO (con manejo robusto de errores)"""
+async def descargar_feed_miteco(client: httpx.AsyncClient, tipo: str) -> Optional[Dict[str, list]]:
+    """Descarga un CSV MITECO y lo parsea en un hilo (arrays por campo); None si falla"""
+    url = MITECO_CSV_URLS[tipo]
+    inicio = time.perf_counter()
     try:
-        url = MITECO_CSV_URLS.get(tipo)
-        if not url:
-            print(f"URL no encontrada para tipo: {tipo}")
-            return []
-        
         print(f"📡 Descargando CSV MITECO: {url}")
-        response = requests.get(url, verify=False, timeout=15)
-        response.encoding = 'utf-8'  # ← FORZAR UTF-8
-        
-        # Parsear CSV
-        csv_content = response.content.decode('utf-8')
-        csv_data = StringIO(csv_content)
-        reader = csv.DictReader(csv_data)
-        
-        datos = []
-        errores_parseo = 0
-        estaciones_inactivas = 0
-        estaciones_sin_indice = 0
-        
-        # ===== VARIABLES DE DEBUG =====
-        debug_total = 0
-        debug_activas = 0
-        debug_inactivas = 0
-        debug_filtradas_coords = 0
-        debug_filtradas_otras = 0
-        debug_inactivas_filtradas = []
-        
-        for i, row in enumerate(reader):
-            debug_total += 1
-            
-            try:
-                # ===== EXTRACCIÓN Y LIMPIEZA DE CAMPOS =====
-                cod_estacion = row.get('cod_estacion', '').strip()
-                nombre = row.get('nombre', '').strip()
-                tipo_estacion = row.get('tipo', '').strip()
-                latitud_str = row.get('latitud', '').strip()
-                longitud_str = row.get('longitud', '').strip()
-                activa_str = row.get('activa', '').strip().lower()
-                fecha = row.get('fecha', '').strip()
-                indice_str = row.get('indice', '').strip()
-                debido_a = row.get('debido_a', '').strip()
-                
-                # ===== VALIDACIONES MÍNIMAS =====
-                if not cod_estacion or not nombre:
-                    errores_parseo += 1
-                    debug_filtradas_otras += 1
-                    continue
-                
-                # Verificar si está activa
-                activa = activa_str == 'true'
-                if not activa:
-                    estaciones_inactivas += 1
-                    debug_inactivas += 1
-                    # DEBUG: Registrar inactiva
-                    print(f"📝 DEBUG INACTIVA #{debug_inactivas}: {nombre}")
-                
-                # ===== PARSEAR COORDENADAS =====
-                try:
-                    lat = float(latitud_str) if latitud_str else None
-                    lon = float(longitud_str) if longitud_str else None
-                    
-                    # DEBUG: Mostrar coordenadas de inactivas
-                    if not activa:
-                        print(f"  📍 Coordenadas: {lat}, {lon}")
-                    
-                    # ✅ CORREGIDO: Solo validar que sean números, no el rango
-                    # (Las estaciones de MITECO están todas en España)
-                    if not lat or not lon:
-                        errores_parseo += 1
-                        debug_filtradas_coords += 1
-                        if not activa:
-                            debug_inactivas_filtradas.append(f"{nombre} - sin coordenadas")
-                        continue
-                    
-                    # ✅ OPCIÓN: Solo advertencia si están muy fuera
-                    # Pero NO excluir - MITECO solo tiene estaciones españolas
-                    if lat < 20 or lat > 45 or lon < -20 or lon > 5:
-                        print(f"⚠️  Coordenadas sospechosas (pero aceptadas): {lat}, {lon} - {nombre}")
-                    
-                except (ValueError, TypeError):
-                    errores_parseo += 1
-                    debug_filtradas_coords += 1
-                    if not activa:
-                        debug_inactivas_filtradas.append(f"{nombre} - error parseo coordenadas")
-                    continue
-                
-                # ===== PARSEAR ÍNDICE =====
-                indice_ica = None
-                tiene_indice = False
-                
-                if indice_str:  
-                    try:
-                        indice_ica = int(indice_str)
-                        tiene_indice = True
-                    except ValueError:
-                        estaciones_sin_indice += 1
-                else:
-                    estaciones_sin_indice += 1
-                
-                # ===== CONSTRUIR DATO =====
-                dato = {
-                    'cod_estacion': cod_estacion,
-                    'nombre': nombre,
-                    'tipo': tipo_estacion,
-                    'lat': lat,
-                    'lon': lon,
-                    'activa': activa,
-                    'fecha': fecha if fecha else datetime.now().isoformat(),
-                    'indice_ica': indice_ica,
-                    'tiene_indice': tiene_indice,
-                    'debido_a': debido_a if debido_a else None,
-                    'aqi': ICA_TO_AQI.get(indice_ica, 0) if tiene_indice and indice_ica else 0,
-                }
-                
-                datos.append(dato)
-                if activa:
-                    debug_activas += 1
-                
-            except Exception as e:
-                errores_parseo += 1
-                debug_filtradas_otras += 1
-                if not activa:
-                    debug_inactivas_filtradas.append(f"{nombre} - error general: {str(e)}")
-                    
-                if errores_parseo <= 3:
-                    print(f"⚠️ Error fila {i+2}: {e}")
-                continue
-        
-        # ===== ESTADÍSTICAS FINALES =====
-        print(f"\n{'='*50}")
-        print(f"✅ {len(datos)} estaciones parseadas correctamente")
-        print(f"   - Activas: {sum(1 for d in datos if d['activa'])}")
-        print(f"   - Inactivas: {sum(1 for d in datos if not d['activa'])}")
-        print(f"   - Estaciones sin índice: {estaciones_sin_indice}")
-        print(f"   - Errores de parseo: {errores_parseo}")
-        
-        # ===== DEBUG RESUMEN =====
-        print(f"\n📊 DEBUG DETALLADO:")
-        print(f"   Total filas CSV procesadas: {debug_total}")
-        print(f"   Activas encontradas: {debug_activas}")
-        print(f"   Inactivas encontradas: {debug_inactivas}")
-        print(f"   Filtradas por coordenadas: {debug_filtradas_coords}")
-        print(f"   Filtradas por otros errores: {debug_filtradas_otras}")
-        
-        if debug_inactivas_filtradas:
-            print(f"\n⚠️  Inactivas filtradas ({len(debug_inactivas_filtradas)}):")
-            for item in debug_inactivas_filtradas:
-                print(f"   - {item}")
-        
-        print(f"{'='*50}\n")
+        response = await client.get(url)
+        response.raise_for_status()
         
+        # Parseo vectorizado (app/utils/miteco_csv.py), en paralelo con las otras descargas
+        datos = await asyncio.to_thread(parsear_csv_miteco_columnas, response.content)
+        print(f"✅ Feed MITECO {tipo}: {filas_columnas(datos)} filas ({time.perf_counter() - inicio:.1f}s)")
         return datos
         
     except Exception as e:
-        print(f"❌ Error descargando datos MITECO: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        print(f"❌ Error descargando datos MITECO ({tipo}): {e}")
+        return None
 
 
-def convertir_a_estaciones(datos: List[Dict]) -> List[Dict]:
-    """Convierte datos MITECO a formato estaciones unificado"""
+async def descargar_feeds_miteco() -> Dict[str, Optional[Dict[str, list]]]:
+    """Descarga los tres feeds a la vez con un único cliente (pool de conexiones compartido)"""
+    async with httpx.AsyncClient(
+        verify=MITECO_VERIFY_SSL,
+        timeout=MITECO_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_connections=len(MITECO_CSV_URLS))
+    ) as client:
+        resultados = await asyncio.gather(*(descargar_feed_miteco(client, tipo) for tipo in MITECO_CSV_URLS))
+    return dict(zip(MITECO_CSV_URLS, resultados))
+
+
+def construir_snapshot_miteco() -> Optional[Dict]:
+    """
+    Descarga los feeds MITECO (solo desde el refresco en segundo plano, que
+    corre en un hilo sin event loop propio); el StationStore de cada ventana
+    se construye al cargar el snapshot en cada worker.
+    
+    Sin la última hora no hay snapshot; si falla 24h o previsión, el snapshot
+    se publica sin esa ventana.
+    """
+    inicio = time.perf_counter()
+    feeds = asyncio.run(descargar_feeds_miteco())
+    print(f"📡 Feeds MITECO descargados en {time.perf_counter() - inicio:.1f}s")
+    if not feeds['last_hour'] or not filas_columnas(feeds['last_hour']):
+        return None
+    return {
+        'datos': feeds['last_hour'],
+        'ventanas': {
+            FEED_VENTANA[tipo]: datos
+            for tipo, datos in feeds.items()
+            if tipo != 'last_hour' and datos and filas_columnas(datos)
+        }
+    }
+
+
+def ingerir_snapshot_miteco(snapshot: Dict) -> None:
+    """Guarda el snapshot recién descargado en el histórico (air_quality_readings)"""
+    db = SessionLocal()
     try:
-        estaciones = []
-        
-        for dato in datos:
-            try:
-                # Generar ID único
-                station_id = int(dato['cod_estacion']) if dato['cod_estacion'].isdigit() else abs(hash(dato['cod_estacion'])) % 1000000
-                
-                # ✅ MAPEAR TIPO A STATION_CLASS
-                station_class = TIPO_TO_CLASS.get(dato['tipo'], 1)
-                
-                # Determinar si tiene datos válidos
-                tiene_datos_validos = (
-                    dato['tiene_indice'] and 
-                    dato['indice_ica'] is not None and
-                    dato['indice_ica'] > 0
-                )
-                
-                # Construir estación
-                if tiene_datos_validos:
-                    # Calcular concentración simulada basada en ICA
-                    concentracion = dato['indice_ica'] * 10
-                    
-                    calidad_info = obtener_calidad_texto(dato['aqi'])
-                    
-                    estacion = {
-                        'id': station_id,
-                        'station_code': dato['cod_estacion'],
-                        'eoi_code': f"ES{dato['cod_estacion']}",
-                        'name': dato['nombre'],
-                        'country_code': 'ES',
-                        'country': 'Spain',
-                        'station_class': station_class,  # ✅ CORREGIDO
-                        'station_type': dato['tipo'],
-                        'lat': dato['lat'],
-                        'lon': dato['lon'],
-                        'available_pollutants': [dato['debido_a']] if dato['debido_a'] else [],
-                        'last_measurement': concentracion,
-                        'last_aqi': dato['aqi'],
-                        'pollutant': dato['debido_a'],
-                        'unit': 'ICA',
-                        'quality_text': calidad_info['text'],
-                        'quality_color': calidad_info['color'],
-                        'recommendation': calidad_info['recomendacion'],
-                        'last_updated': dato['fecha'],
-                        'is_mock': False,
-                        'has_real_data': True,
-                        'is_active':  dato['activa'],  # ✅ True/False real
-                        'data_source': 'MITECO ICA',
-                        'measurement_timestamp': dato['fecha'],
-                        'ica_index': dato['indice_ica'],
-                        'ica_contaminant': dato['debido_a']
-                    }
-                else:
-                    # Estación sin datos válidos
-                    estacion = {
-                        'id': station_id,
-                        'station_code': dato['cod_estacion'],
-                        'eoi_code': f"ES{dato['cod_estacion']}",
-                        'name': dato['nombre'],
-                        'country_code': 'ES',
-                        'country': 'Spain',
-                        'station_class': station_class,  # ✅ CORREGIDO
-                        'station_type': dato['tipo'],
-                        'lat': dato['lat'],
-                        'lon': dato['lon'],
-                        'available_pollutants': [dato['debido_a']] if dato['debido_a'] else [],
-                        'last_measurement': None,
-                        'last_aqi': 0,
-                        'pollutant': dato['debido_a'],
-                        'unit': None,
-                        'quality_text': 'Sin datos',
-                        'quality_color': '#cccccc',
-                        'recommendation': 'Estación sin datos en la última medición.',
-                        'last_updated': dato['fecha'],
-                        'is_mock': False,
-                        'has_real_data': False,
-                        'is_active': dato['activa'],  # ✅ True/False real
-                        'data_source': 'MITECO ICA',
-                        'measurement_timestamp': dato['fecha']
-                    }
-                
-                estaciones.append(estacion)
-                
-            except Exception as e:
-                print(f"⚠️ Error procesando estación {dato.get('cod_estacion', 'N/A')}: {e}")
-                continue
-        
-        # Estadísticas actualizadas
-        activas_con_datos = sum(1 for e in estaciones if e['is_active'] and e['has_real_data'])
-        activas_sin_datos = sum(1 for e in estaciones if e['is_active'] and not e['has_real_data'])
-        inactivas_con_datos = sum(1 for e in estaciones if not e['is_active'] and e['has_real_data'])
-        inactivas_sin_datos = sum(1 for e in estaciones if not e['is_active'] and not e['has_real_data'])
-        
-        print(f"📊 Estaciones procesadas:")
-        print(f"   - Total: {len(estaciones)}")
-        print(f"   - Activas con datos: {activas_con_datos}")
-        print(f"   - Activas sin datos: {activas_sin_datos}")
-        print(f"   - Inactivas con datos: {inactivas_con_datos}")
-        print(f"   - Inactivas sin datos: {inactivas_sin_datos}")
-        
-        return estaciones
-        
-    except Exception as e:
-        print(f"❌ Error convirtiendo a estaciones: {e}")
-        return []
+        AirQualityHistoryService.ingest(db, snapshot)
+    finally:
+        db.close()
+
+
+def parsear_bbox(bbox: Optional[str]) -> tuple:
+    """'lon_min,lat_min,lon_max,lat_max' -> tupla de floats (HTTP 400 si no es válido)"""
+    if not bbox:
+        return BBOX_DEFECTO
+    try:
+        lon_min, lat_min, lon_max, lat_max = (float(v) for v in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser 'lon_min,lat_min,lon_max,lat_max'")
+    if not (-180 <= lon_min < lon_max <= 180 and -90 <= lat_min < lat_max <= 90):
+        raise HTTPException(status_code=400, detail="bbox fuera de rango o con mínimos >= máximos")
+    return (lon_min, lat_min, lon_max, lat_max)
+
+
+def parsear_puntos(puntos: str) -> List[tuple]:
+    """'lat,lon;lat,lon;...' -> lista de (lat, lon) (HTTP 400 si no es válido)"""
+    resultado = []
+    for punto in filter(None, (p.strip() for p in puntos.split(';'))):
+        try:
+            lat, lon = (float(v) for v in punto.split(','))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Punto no válido: '{punto}' (formato 'lat,lon;lat,lon')")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise HTTPException(status_code=400, detail=f"Punto fuera de rango: '{punto}'")
+        resultado.append((lat, lon))
+    if not resultado:
+        raise HTTPException(status_code=400, detail="'puntos' no contiene ningún punto")
+    if len(resultado) > MAX_PUNTOS_NEAREST:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_PUNTOS_NEAREST} puntos por petición")
+    return resultado
+
+
+def consultar_punto(store: StationStore, lat: float, lon: float, k: int, max_km: Optional[float]) -> Dict:
+    """k estaciones activas más cercanas a un punto y estimación IDW del índice ICA en él"""
+    vecinas = store.indice.cercanas(lat, lon, k, max_km)
+    
+    estimacion = None
+    if vecinas:
+        distancia, estacion = vecinas[0]
+        if distancia < 0.01:
+            # El punto coincide con una estación: su propio valor
+            ica = float(estacion.ica_index)
+        else:
+            pesos = [d ** -IDW_POTENCIA for d, _ in vecinas]
+            ica = sum(p * e.ica_index for p, (_, e) in zip(pesos, vecinas)) / sum(pesos)
+        aqi = ICA_TO_AQI.get(min(max(round(ica), 1), 6), 0)
+        calidad = obtener_calidad_texto(aqi)
+        estimacion = {
+            'ica_index': round(ica, 2),
+            'aqi': aqi,
+            'quality_text': calidad['text'],
+            'quality_color': calidad['color'],
+            'method': 'idw',
+            'power': IDW_POTENCIA
+        }
+    
+    return {
+        'lat': lat,
+        'lon': lon,
+        'estimate': estimacion,
+        'stations': [
+            {**e.light, 'ica_index': e.ica_index, 'distance_km': round(d, 3)}
+            for d, e in vecinas
+        ]
+    }
+
 
 def obtener_datos_mock(limite: int = 100) -> List[Dict]:
     """Datos mock para desarrollo/fallback"""
@@ -388,50 +257,48 @@ def calcular_aqi(concentracion: float, contaminante: str) -> int:
     return min(max(int(concentracion / 50), 1), 5)
 
 
-def obtener_calidad_texto(aqi: int) -> Dict:
-    """Devuelve información textual según AQI"""
-    niveles = {
-        1: {"text": "Buena", "color": "#00e400", "recomendacion": "Calidad del aire satisfactoria."},
-        2: {"text": "Moderada", "color": "#feca57", "recomendacion": "Aceptable para la mayoría."},
-        3: {"text": "Mala", "color": "#ff7e00", "recomendacion": "Grupos sensibles deben reducir actividad exterior."},
-        4: {"text": "Muy Mala", "color": "#ff0000", "recomendacion": "Todos deben reducir actividad exterior."},
-        5: {"text": "Extremadamente Mala", "color": "#8f3f97", "recomendacion": "Evitar actividad exterior."},
-        0: {"text": "Sin datos", "color": "#cccccc", "recomendacion": "No hay datos disponibles."}
-    }
-    return niveles.get(aqi, niveles[0])
-
-
 # ============= ENDPOINTS FASTAPI =============
 
 @router.get("/air-quality/stations")
 async def get_stations(
     limite: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    contaminante: Optional[str] = Query("PM2.5"),
+    contaminante: Optional[str] = Query(None, description="Contaminante que determina el índice (PM10, O3...)"),
     light: bool = Query(False),
     solo_con_datos: bool = Query(True),
-    forzar_mock: bool = Query(False)
+    forzar_mock: bool = Query(False),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
+    formato: str = Query('json', alias="format", description="json | columnar | arrow (solo light=true)"),
+    ventana: str = Query('1h', alias="window", description="1h | 24h (peor índice del día) | forecast (peor índice previsto)")
 ):
     """Obtiene estaciones de calidad del aire en España"""
     try:
+        formato = validar_formato(formato, light)
+        if contaminante and contaminante not in CONTAMINANTES:
+            raise HTTPException(status_code=400, detail=f"Contaminante no válido. Opciones: {list(CONTAMINANTES)}")
+        if ventana not in VENTANAS:
+            raise HTTPException(status_code=400, detail=f"Ventana no válida. Válidas: {', '.join(VENTANAS)}")
+        
         # Intentar datos reales
+        snapshot = None
         if forzar_mock:
             estaciones = obtener_datos_mock(limite=limite + offset)
             es_mock = True
             source = "Datos simulados"
         else:
-            # Descargar CSV MITECO
-            datos_miteco = descargar_datos_miteco(tipo='last_hour')
+            # Último snapshot MITECO (refrescado en segundo plano, sin red en la petición)
+            snapshot = AirQualitySnapshot.get()
             
-            if datos_miteco:
-                # Convertir a formato estaciones
-                estaciones = convertir_a_estaciones(datos_miteco)
-                es_mock = False
-                source = "MITECO ICA - Última hora"
+            if snapshot:
+                store = snapshot['stores'].get(ventana)
+                if store is None:
+                    raise HTTPException(status_code=503, detail=f"Ventana {ventana} no disponible en el último snapshot MITECO")
                 
-                # Filtrar solo con datos si se solicita
-                if solo_con_datos:
-                    estaciones = [e for e in estaciones if e.get('has_real_data')]
+                # Registros EstacionAire ya filtrados (con datos / CCAA / provincia / contaminante)
+                estaciones = store.filtrar(solo_con_datos, codigo_ccaa, codigo_provincia, contaminante)
+                es_mock = False
+                source = FUENTE_VENTANA[ventana]
             else:
                 # Fallback a mock
                 print("⚠️ Usando datos mock como fallback")
@@ -439,12 +306,22 @@ async def get_stations(
                 es_mock = True
                 source = "Datos simulados (fallback)"
         
+        # Filtros por código INE en los datos mock (sin códigos: no hay coincidencias)
+        if es_mock and codigo_ccaa is not None:
+            estaciones = [e for e in estaciones if e.get('codigo_ccaa') == codigo_ccaa]
+        if es_mock and codigo_provincia is not None:
+            estaciones = [e for e in estaciones if e.get('codigo_provincia') == codigo_provincia]
+        if es_mock and contaminante:
+            estaciones = [e for e in estaciones if e.get('pollutant') == contaminante]
+        
         # Paginación
         total = len(estaciones)
         estaciones_paginadas = estaciones[offset:offset + limite]
         
-        # Modo light
-        if light:
+        # Modo light: proyección precalculada en el store (solo se serializa la página)
+        if not es_mock:
+            estaciones_paginadas = [e.light if light else e.to_dict() for e in estaciones_paginadas]
+        elif light:
             estaciones_paginadas = [
                 {
                     'id': e['id'],
@@ -460,21 +337,43 @@ async def get_stations(
                 for e in estaciones_paginadas
             ]
         
+        has_more = (offset + len(estaciones_paginadas)) < total
+        if formato == 'arrow':
+            return respuesta_arrow(
+                dicts_a_columnas(estaciones_paginadas, COLUMNAS_LIGHT),
+                COLUMNAS_DICCIONARIO,
+                {"count": len(estaciones_paginadas), "total": total, "offset": offset,
+                 "has_more": has_more, "is_mock_data": es_mock, "data_source": source, "window": ventana,
+                 "snapshot": AirQualitySnapshot.metadatos(snapshot) if snapshot else None}
+            )
+        if formato == 'columnar':
+            estaciones_paginadas_salida = a_columnar(
+                dicts_a_columnas(estaciones_paginadas, COLUMNAS_LIGHT),
+                COLUMNAS_DICCIONARIO
+            )
+        else:
+            estaciones_paginadas_salida = estaciones_paginadas
+        
         return {
             "success": True,
             "count": len(estaciones_paginadas),
             "total": total,
             "offset": offset,
             "limit": limite,
-            "has_more": (offset + len(estaciones_paginadas)) < total,
+            "has_more": has_more,
             "pollutant": contaminante,
             "description": CONTAMINANTES.get(contaminante, contaminante),
             "is_mock_data": es_mock,
             "data_source": source,
+            "snapshot": AirQualitySnapshot.metadatos(snapshot) if snapshot else None,
+            "window": ventana,
             "light_mode": light,
-            "stations": estaciones_paginadas
+            "format": formato,
+            "stations": estaciones_paginadas_salida
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error en /stations: {e}")
         import traceback
@@ -486,17 +385,16 @@ async def get_stations(
 async def get_station_detail(station_id: int):
     """Obtener detalle de estación específica"""
     try:
-        # Buscar en datos reales
-        datos_miteco = descargar_datos_miteco(tipo='last_hour')
+        # Buscar en el último snapshot real
+        snapshot = AirQualitySnapshot.get()
         
-        if datos_miteco:
-            estaciones = convertir_a_estaciones(datos_miteco)
-            estacion = next((e for e in estaciones if e['id'] == station_id), None)
+        if snapshot:
+            estacion = snapshot['store'].get(station_id)
             
             if estacion:
                 return {
                     "success": True,
-                    "data": estacion,
+                    "data": estacion.to_dict(),
                     "is_mock_data": False
                 }
         
@@ -519,6 +417,75 @@ async def get_station_detail(station_id: int):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@router.get("/air-quality/station/{station_id}/history")
+async def get_station_history(
+    station_id: int,
+    desde: Optional[datetime] = Query(None, description="Inicio del rango (ISO 8601)"),
+    hasta: Optional[datetime] = Query(None, description="Fin del rango (ISO 8601)"),
+    limite: int = Query(168, ge=1, le=10000, description="Máximo de lecturas (por defecto 7 días)"),
+    db: Session = Depends(get_db)
+):
+    """Histórico horario de una estación (air_quality_readings), de la más reciente a la más antigua"""
+    try:
+        lecturas = AirQualityHistoryService.station_history(db, station_id, desde, hasta, limite)
+        if lecturas is None:
+            raise HTTPException(status_code=404, detail=f"Estación {station_id} sin histórico")
+        
+        return {
+            "success": True,
+            "station_id": station_id,
+            "count": len(lecturas),
+            "data": lecturas
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.get("/air-quality/readings")
+async def get_readings(
+    contaminante: Optional[str] = Query(None, description="Contaminante que determina el índice (PM10, O3...)"),
+    desde: Optional[datetime] = Query(None, description="Inicio del rango (ISO 8601)"),
+    hasta: Optional[datetime] = Query(None, description="Fin del rango (ISO 8601)"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
+    limite: int = Query(1000, ge=1, le=10000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Lecturas históricas filtradas por contaminante, rango temporal y región
+    
+    Sin `desde`/`hasta` devuelve las lecturas de la última hora ingerida.
+    """
+    try:
+        if contaminante and contaminante not in CONTAMINANTES:
+            raise HTTPException(status_code=400, detail=f"Contaminante no válido. Opciones: {list(CONTAMINANTES)}")
+        if desde and hasta and desde > hasta:
+            raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+        
+        resultado = AirQualityHistoryService.readings(
+            db, contaminante, desde, hasta, codigo_ccaa, codigo_provincia, limite, offset
+        )
+        
+        return {
+            "success": True,
+            "pollutant": contaminante,
+            "fecha_referencia": resultado["fecha_referencia"],
+            "count": len(resultado["data"]),
+            "offset": offset,
+            "limit": limite,
+            "data": resultado["data"]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 @router.get("/air-quality/stats")
 async def get_air_quality_stats(
     contaminante: str = Query("PM2.5"),
@@ -531,10 +498,9 @@ async def get_air_quality_stats(
             estaciones = obtener_datos_mock(limite=100)
             es_mock = True
         else:
-            datos_miteco = descargar_datos_miteco(tipo='last_hour')
-            if datos_miteco:
-                estaciones = convertir_a_estaciones(datos_miteco)
-                estaciones = [e for e in estaciones if e.get('has_real_data')]
+            snapshot = AirQualitySnapshot.get()
+            if snapshot:
+                estaciones = snapshot['store'].con_datos
                 es_mock = False
             else:
                 estaciones = obtener_datos_mock(limite=100)
@@ -547,8 +513,12 @@ async def get_air_quality_stats(
             }
         
         # Calcular stats
-        aqis = [e['last_aqi'] for e in estaciones if e.get('last_aqi')]
-        concentraciones = [e['last_measurement'] for e in estaciones if e.get('last_measurement')]
+        if es_mock:
+            aqis = [e['last_aqi'] for e in estaciones if e.get('last_aqi')]
+            concentraciones = [e['last_measurement'] for e in estaciones if e.get('last_measurement')]
+        else:
+            aqis = [e.last_aqi for e in estaciones if e.last_aqi]
+            concentraciones = [e.last_measurement for e in estaciones if e.last_measurement]
         
         calidad_dist = {}
         for aqi in aqis:
@@ -571,21 +541,118 @@ async def get_air_quality_stats(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@router.get("/air-quality/surface")
+async def get_surface(
+    bbox: Optional[str] = Query(None, description="lon_min,lat_min,lon_max,lat_max (por defecto península y Baleares)"),
+    resolucion: float = Query(RESOLUCION_DEFECTO, description=f"Tamaño de celda en grados: {', '.join(map(str, RESOLUCIONES))}"),
+    formato: str = Query('json', alias="format", description="json | png")
+):
+    """
+    Superficie interpolada (IDW) del índice ICA sobre una rejilla regular
+    
+    Se calcula con el snapshot MITECO vigente y se cachea hasta el siguiente
+    refresco; el cálculo se hace en un hilo, nunca en el event loop. El bbox
+    se amplía a la rejilla de la resolución.
+    """
+    try:
+        formato = (formato or 'json').lower()
+        if formato not in ('json', 'png'):
+            raise HTTPException(status_code=400, detail="Formato no válido. Válidos: json, png")
+        
+        if resolucion not in RESOLUCIONES:
+            raise HTTPException(status_code=400, detail=f"Resolución no válida. Válidas: {', '.join(map(str, RESOLUCIONES))}")
+        
+        caja = AirQualitySurface.ajustar_bbox(parsear_bbox(bbox), resolucion)
+        celdas = ((caja[2] - caja[0]) / resolucion) * ((caja[3] - caja[1]) / resolucion)
+        if celdas > MAX_CELDAS:
+            raise HTTPException(status_code=400, detail=f"Rejilla demasiado grande ({int(celdas)} celdas, máximo {MAX_CELDAS})")
+        
+        snapshot = AirQualitySnapshot.get()
+        if not snapshot:
+            raise HTTPException(status_code=503, detail="Snapshot MITECO no disponible todavía")
+        
+        superficie = await AirQualitySurface.obtener(snapshot, caja, resolucion)
+        headers = {
+            "Cache-Control": "public, max-age=300",
+            "X-Snapshot-Fetched-At": superficie["fetched_at"]
+        }
+        
+        if formato == 'png':
+            headers["X-Surface-Bbox"] = ",".join(str(v) for v in caja)
+            return Response(content=superficie["png"], media_type="image/png", headers=headers)
+        return Response(content=superficie["json"], media_type="application/json", headers=headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error en /surface: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@router.get("/air-quality/nearest")
+async def get_nearest(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    k: int = Query(5, ge=1, le=50, description="Número de estaciones"),
+    max_km: Optional[float] = Query(None, gt=0, description="Descartar estaciones más lejanas"),
+    puntos: Optional[str] = Query(None, description=f"Lote 'lat,lon;lat,lon;...' (máx. {MAX_PUNTOS_NEAREST}) en lugar de lat/lon")
+):
+    """
+    Estaciones activas más cercanas a uno o varios puntos, con distancia y
+    estimación IDW del índice ICA
+    
+    Usa el índice espacial del snapshot vigente (rejilla construida en cada
+    refresco); cada consulta cuesta microsegundos.
+    """
+    try:
+        if puntos:
+            consultas = parsear_puntos(puntos)
+        elif lat is not None and lon is not None:
+            consultas = [(lat, lon)]
+        else:
+            raise HTTPException(status_code=400, detail="Indica 'lat' y 'lon' o 'puntos'")
+        
+        snapshot = AirQualitySnapshot.get()
+        if not snapshot:
+            raise HTTPException(status_code=503, detail="Snapshot MITECO no disponible todavía")
+        
+        store = snapshot['store']
+        return {
+            "success": True,
+            "count": len(consultas),
+            "k": k,
+            "max_km": max_km,
+            "data_source": FUENTE_VENTANA['1h'],
+            "snapshot": AirQualitySnapshot.metadatos(snapshot),
+            "results": [consultar_punto(store, la, lo, k, max_km) for la, lo in consultas]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error en /nearest: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 @router.get("/air-quality/health")
 async def health_check():
-    """Health check del servicio"""
+    """Health check del servicio (estado del último snapshot MITECO)"""
     try:
-        datos_miteco = descargar_datos_miteco(tipo='last_hour')
+        snapshot = AirQualitySnapshot.get()
         
-        if datos_miteco and len(datos_miteco) > 0:
+        if snapshot and filas_columnas(snapshot['datos']):
+            datos_miteco = snapshot['datos']
             # Contar cuántas tienen índice
-            con_indice = sum(1 for d in datos_miteco if d['tiene_indice'])
+            con_indice = sum(datos_miteco['tiene_indice'])
+            meta = AirQualitySnapshot.metadatos(snapshot)
             
             return {
-                "status": "healthy",
-                "message": f"✅ Conectado a MITECO ICA. {len(datos_miteco)} estaciones ({con_indice} con datos).",
+                "status": "degraded" if meta['is_stale'] else "healthy",
+                "message": f"{'⚠️ Snapshot MITECO obsoleto' if meta['is_stale'] else '✅ MITECO ICA'}. "
+                           f"{filas_columnas(datos_miteco)} estaciones ({con_indice} con datos).",
                 "is_mock": False,
-                "example_data": datos_miteco[0] if datos_miteco else None,
+                "example_data": fila_columnas(datos_miteco, 0),
+                "snapshot": meta,
                 "timestamp": datetime.now().isoformat()
             }
         else:
@@ -1,13 +1,18 @@
 # backend/app/routers/covid.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, Date, TIMESTAMP, text
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, TIMESTAMP, Index, text
 from sqlalchemy.sql import func
 from typing import Optional
 from datetime import date
+import base64
 import json
 from geoalchemy2 import Geometry
 from app.database import get_db, Base
+from app.services.dataset_versions import DatasetVersionService
+from app.services.tile_cache import TileCache
+from app.utils.spatial import BBox, Near, parse_bbox, parse_near, filtros_espaciales_sql
+from app.utils.wire_format import validar_formato, filas_a_columnas, a_columnar, respuesta_arrow
 
 # MODELO COVID
 class CovidCase(Base):
@@ -17,6 +22,8 @@ class CovidCase(Base):
     fecha = Column(Date, nullable=False, index=True)
     comunidad_autonoma = Column(String(100), nullable=False, index=True)
     provincia = Column(String(100))
+    codigo_ccaa = Column(SmallInteger)
+    codigo_provincia = Column(SmallInteger)
     casos_confirmados = Column(Integer, nullable=False)
     ingresos_uci = Column(Integer)
     fallecidos = Column(Integer)
@@ -24,21 +31,117 @@ class CovidCase(Base):
     geom = Column(Geometry('POINT', srid=4326), index=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # Índice de la paginación keyset (ORDER BY fecha, comunidad_autonoma, id)
+        Index('idx_covid_keyset', 'fecha', 'comunidad_autonoma', 'id'),
+        # Filtros por código INE (igualdad entera, rellenados por trigger en la BD)
+        Index('idx_covid_codigo_ccaa', 'codigo_ccaa', 'fecha'),
+        Index('idx_covid_codigo_provincia', 'codigo_provincia', 'fecha'),
+    )
 
 # ROUTER
 router = APIRouter(prefix="/api", tags=["covid"])
 
+# Columnas de texto repetitivas que se codifican como diccionario en format=columnar/arrow
+COVID_COLUMNAS_DICCIONARIO = ("fecha", "comunidad", "provincia")
+
+# Caché de tiles MVT (por worker), invalidada por la versión del dataset 'covid'
+covid_tile_cache = TileCache()
+
+def construir_filtros_covid(
+    comunidad: Optional[str] = None,
+    provincia: Optional[str] = None,
+    fecha_inicio: Optional[date] = None,
+    fecha_fin: Optional[date] = None,
+    min_casos: Optional[int] = None,
+    max_casos: Optional[int] = None,
+    bbox: Optional[BBox] = None,
+    near: Optional[Near] = None,
+    codigo_ccaa: Optional[int] = None,
+    codigo_provincia: Optional[int] = None
+):
+    """Construye el fragmento WHERE (sin el WHERE) y sus parámetros para covid_cases"""
+    condiciones = ["1=1"]
+    params = {}
+    
+    # Códigos INE: igualdad entera sobre columnas indexadas (preferibles al ILIKE por nombre)
+    if codigo_ccaa is not None:
+        condiciones.append("codigo_ccaa = :codigo_ccaa")
+        params['codigo_ccaa'] = codigo_ccaa
+    
+    if codigo_provincia is not None:
+        condiciones.append("codigo_provincia = :codigo_provincia")
+        params['codigo_provincia'] = codigo_provincia
+    
+    if comunidad and comunidad != "todas":
+        condiciones.append("comunidad_autonoma ILIKE :comunidad")
+        params['comunidad'] = f"%{comunidad}%"
+    
+    if provincia and provincia != "todas":
+        condiciones.append("provincia ILIKE :provincia")
+        params['provincia'] = f"%{provincia}%"
+    
+    if fecha_inicio:
+        condiciones.append("fecha >= :fecha_inicio")
+        params['fecha_inicio'] = fecha_inicio
+    
+    if fecha_fin:
+        condiciones.append("fecha <= :fecha_fin")
+        params['fecha_fin'] = fecha_fin
+    
+    if min_casos is not None:
+        condiciones.append("casos_confirmados >= :min_casos")
+        params['min_casos'] = min_casos
+    
+    if max_casos is not None:
+        condiciones.append("casos_confirmados <= :max_casos")
+        params['max_casos'] = max_casos
+    
+    condiciones_espaciales, params_espaciales = filtros_espaciales_sql("geom", bbox, near)
+    condiciones.extend(condiciones_espaciales)
+    params.update(params_espaciales)
+    
+    return " AND ".join(condiciones), params
+
+
+def codificar_cursor(fecha: date, comunidad: str, case_id: int) -> str:
+    """Cursor opaco con la clave de ordenación (fecha, comunidad_autonoma, id)"""
+    payload = json.dumps([fecha.isoformat(), comunidad, case_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """Decodifica un cursor generado por codificar_cursor"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        fecha_str, comunidad, case_id = json.loads(
+            base64.urlsafe_b64decode(cursor + padding).decode("utf-8")
+        )
+        return date.fromisoformat(fecha_str), str(comunidad), int(case_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor no válido")
+
+
 @router.get("/covid/data")
 async def get_covid_data(
     comunidad: Optional[str] = Query(None, description="Comunidad autónoma"),
     provincia: Optional[str] = Query(None, description="Provincia"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
     fecha_inicio: Optional[date] = Query(None, description="Fecha inicio"),
     fecha_fin: Optional[date] = Query(None, description="Fecha fin"),
     min_casos: Optional[int] = Query(None, ge=0, description="Casos mínimos"),
     max_casos: Optional[int] = Query(None, ge=0, description="Casos máximos"),
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    near: Optional[str] = Query(None, description="lon,lat (requiere radius_km)"),
+    radius_km: Optional[float] = Query(None, gt=0, le=1000, description="Radio en km para near"),
     limit: Optional[int] = Query(100, ge=1, le=10000, description="Límite de resultados"),
-    offset: Optional[int] = Query(0, ge=0, description="Offset para paginación"),
+    offset: Optional[int] = Query(0, ge=0, description="Offset para paginación (legacy, usar cursor)"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco devuelto en next_cursor"),
+    include_total: Optional[bool] = Query(False, description="Calcular el total exacto (COUNT)"),
     light: Optional[bool] = Query(False, description="Modo ligero (solo coords + casos)"),
+    formato: str = Query('json', alias="format", description="json | columnar | arrow (solo light=true)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -46,8 +149,22 @@ async def get_covid_data(
     
     **Modo light=true**: Solo coordenadas, comunidad, casos, fecha (para mapas)
     **Modo light=false**: Todos los datos completos
+    
+    **Paginación**: keyset sobre (fecha, comunidad_autonoma, id). Pasar el
+    `next_cursor` de la respuesta anterior como `cursor`. El total exacto solo
+    se calcula con `include_total=true`.
+    
+    **Filtros espaciales**: `bbox` (viewport del mapa) y `near` + `radius_km`,
+    resueltos con el índice GIST de geom.
+    
+    **format=columnar|arrow** (con light=true): arrays paralelos por campo con
+    comunidad/provincia/fecha codificadas como diccionario, o stream Arrow IPC.
     """
     try:
+        formato = validar_formato(formato, light)
+        caja = parse_bbox(bbox)
+        cerca = parse_near(near, radius_km)
+        
         # Query base según modo
         if light:
             # Modo ligero - optimizado con ST_AsGeoJSON
@@ -61,7 +178,7 @@ async def get_covid_data(
                     ST_X(geom::geometry) as lon,
                     ST_Y(geom::geometry) as lat
                 FROM covid_cases
-                WHERE 1=1
+                WHERE 
             """
         else:
             # Modo completo
@@ -78,46 +195,50 @@ async def get_covid_data(
                     ST_X(geom::geometry) as lon,
                     ST_Y(geom::geometry) as lat
                 FROM covid_cases
-                WHERE 1=1
+                WHERE 
             """
         
-        params = {}
-        
         # Aplicar filtros
-        if comunidad and comunidad != "todas":
-            query += " AND comunidad_autonoma ILIKE :comunidad"
-            params['comunidad'] = f"%{comunidad}%"
-        
-        if provincia and provincia != "todas":
-            query += " AND provincia ILIKE :provincia"
-            params['provincia'] = f"%{provincia}%"
-        
-        if fecha_inicio:
-            query += " AND fecha >= :fecha_inicio"
-            params['fecha_inicio'] = fecha_inicio
-        
-        if fecha_fin:
-            query += " AND fecha <= :fecha_fin"
-            params['fecha_fin'] = fecha_fin
-        
-        if min_casos is not None:
-            query += " AND casos_confirmados >= :min_casos"
-            params['min_casos'] = min_casos
+        where, params = construir_filtros_covid(
+            comunidad, provincia, fecha_inicio, fecha_fin, min_casos, max_casos, caja, cerca,
+            codigo_ccaa, codigo_provincia
+        )
+        query += where
         
-        if max_casos is not None:
-            query += " AND casos_confirmados <= :max_casos"
-            params['max_casos'] = max_casos
+        # Keyset: continuar justo después de la última fila de la página anterior
+        if cursor:
+            cursor_fecha, cursor_comunidad, cursor_id = decodificar_cursor(cursor)
+            query += " AND (fecha, comunidad_autonoma, id) > (:cursor_fecha, :cursor_comunidad, :cursor_id)"
+            params['cursor_fecha'] = cursor_fecha
+            params['cursor_comunidad'] = cursor_comunidad
+            params['cursor_id'] = cursor_id
+            offset = 0
         
-        query += " ORDER BY fecha, comunidad_autonoma LIMIT :limit OFFSET :offset"
-        params['limit'] = limit
+        # Se pide una fila de más para saber si hay siguiente página sin COUNT(*)
+        query += " ORDER BY fecha, comunidad_autonoma, id LIMIT :limit OFFSET :offset"
+        params['limit'] = limit + 1
         params['offset'] = offset
         
         result = db.execute(text(query), params)
         rows = result.fetchall()
         
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = codificar_cursor(rows[-1][1], rows[-1][2], rows[-1][0]) if has_more else None
+        
         # Convertir según modo
         data = []
-        if light:
+        if formato != 'json':
+            columnas = filas_a_columnas(
+                rows,
+                ["id", "fecha", "comunidad", "provincia", "casos", "lon", "lat"],
+                {
+                    "fecha": str,
+                    "lon": lambda v: float(v) if v else None,
+                    "lat": lambda v: float(v) if v else None
+                }
+            )
+        elif light:
             for row in rows:
                 data.append({
                     "id": row[0],
@@ -143,52 +264,142 @@ async def get_covid_data(
                     "lat": float(row[9]) if row[9] else None
                 })
         
-        # Obtener total para paginación
-        count_query = "SELECT COUNT(*) FROM covid_cases WHERE 1=1"
-        count_params = {}
+        # Total exacto solo bajo demanda (COUNT sobre el mismo filtro, sin cursor)
+        total = None
+        if include_total:
+            count_where, count_params = construir_filtros_covid(
+                comunidad, provincia, fecha_inicio, fecha_fin, min_casos, max_casos, caja, cerca,
+                codigo_ccaa, codigo_provincia
+            )
+            total_result = db.execute(
+                text(f"SELECT COUNT(*) FROM covid_cases WHERE {count_where}"),
+                count_params
+            )
+            total = total_result.scalar()
         
-        if comunidad and comunidad != "todas":
-            count_query += " AND comunidad_autonoma ILIKE :comunidad"
-            count_params['comunidad'] = f"%{comunidad}%"
-        
-        if provincia and provincia != "todas":
-            count_query += " AND provincia ILIKE :provincia"
-            count_params['provincia'] = f"%{provincia}%"
-        
-        if fecha_inicio:
-            count_query += " AND fecha >= :fecha_inicio"
-            count_params['fecha_inicio'] = fecha_inicio
-        
-        if fecha_fin:
-            count_query += " AND fecha <= :fecha_fin"
-            count_params['fecha_fin'] = fecha_fin
-        
-        if min_casos is not None:
-            count_query += " AND casos_confirmados >= :min_casos"
-            count_params['min_casos'] = min_casos
-        
-        if max_casos is not None:
-            count_query += " AND casos_confirmados <= :max_casos"
-            count_params['max_casos'] = max_casos
-        
-        total_result = db.execute(text(count_query), count_params)
-        total = total_result.scalar()
+        if formato == 'arrow':
+            return respuesta_arrow(
+                columnas,
+                COVID_COLUMNAS_DICCIONARIO,
+                {"count": len(rows), "total": total, "has_more": has_more, "next_cursor": next_cursor}
+            )
+        if formato == 'columnar':
+            data = a_columnar(columnas, COVID_COLUMNAS_DICCIONARIO)
         
         return {
             "success": True,
             "data": data,
-            "count": len(data),
+            "count": len(rows),
             "total": total,
             "offset": offset,
             "limit": limit,
-            "has_more": (offset + len(data)) < total,
-            "light_mode": light
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "light_mode": light,
+            "format": formato
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos: {str(e)}")
 
 
+@router.get("/covid/tiles/{z}/{x}/{y}.mvt")
+async def get_covid_tile(
+    z: int,
+    x: int,
+    y: int,
+    comunidad: Optional[str] = Query(None, description="Comunidad autónoma"),
+    provincia: Optional[str] = Query(None, description="Provincia"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
+    fecha_inicio: Optional[date] = Query(None, description="Fecha inicio"),
+    fecha_fin: Optional[date] = Query(None, description="Fecha fin"),
+    min_casos: Optional[int] = Query(None, ge=0, description="Casos mínimos"),
+    max_casos: Optional[int] = Query(None, ge=0, description="Casos máximos"),
+    db: Session = Depends(get_db)
+):
+    """
+    Tile vectorial (Mapbox Vector Tile) con los puntos COVID del tile z/x/y
+    
+    Capa `covid`: un feature por punto con casos, UCI, fallecidos y altas
+    sumados sobre el rango de fechas filtrado. Usa el índice GIST de geom.
+    """
+    try:
+        if z < 0 or z > 22 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+            raise HTTPException(status_code=400, detail=f"Tile {z}/{x}/{y} fuera de rango")
+        
+        filtros = {
+            "comunidad": comunidad,
+            "provincia": provincia,
+            "fecha_inicio": fecha_inicio,
+            "fecha_fin": fecha_fin,
+            "min_casos": min_casos,
+            "max_casos": max_casos,
+            "codigo_ccaa": codigo_ccaa,
+            "codigo_provincia": codigo_provincia
+        }
+        version = DatasetVersionService.get_version(db, "covid")
+        cache_key = (TileCache.filter_hash(filtros), z, x, y)
+        
+        tile = covid_tile_cache.get(version, cache_key)
+        if tile is None:
+            where, params = construir_filtros_covid(**filtros)
+            params.update({"z": z, "x": x, "y": y})
+            
+            query = f"""
+                WITH limites AS (
+                    SELECT 
+                        ST_TileEnvelope(:z, :x, :y) AS env_3857,
+                        ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326) AS env_4326
+                ),
+                puntos AS (
+                    SELECT 
+                        c.geom,
+                        c.comunidad_autonoma,
+                        c.provincia,
+                        SUM(c.casos_confirmados) AS casos,
+                        SUM(c.ingresos_uci) AS ingresos_uci,
+                        SUM(c.fallecidos) AS fallecidos,
+                        SUM(c.altas) AS altas,
+                        COUNT(*) AS registros
+                    FROM covid_cases c, limites
+                    WHERE c.geom && limites.env_4326
+                      AND {where}
+                    GROUP BY c.geom, c.comunidad_autonoma, c.provincia
+                ),
+                mvt AS (
+                    SELECT 
+                        ST_AsMVTGeom(ST_Transform(p.geom, 3857), limites.env_3857, 4096, 64, true) AS geom,
+                        p.comunidad_autonoma AS comunidad,
+                        p.provincia,
+                        p.casos,
+                        p.ingresos_uci,
+                        p.fallecidos,
+                        p.altas,
+                        p.registros
+                    FROM puntos p, limites
+                )
+                SELECT ST_AsMVT(mvt.*, 'covid', 4096, 'geom') FROM mvt
+            """
+            
+            result = db.execute(text(query), params).scalar()
+            tile = bytes(result) if result else b""
+            covid_tile_cache.set(version, cache_key, tile)
+        
+        return Response(
+            content=tile,
+            media_type="application/vnd.mapbox-vector-tile",
+            headers={"Cache-Control": "public, max-age=300"}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al generar tile: {str(e)}")
+
+
 @router.get("/covid/case/{case_id}")
 async def get_covid_case_detail(
     case_id: int,
@@ -247,22 +458,68 @@ async def get_covid_case_detail(
 
 
 @router.get("/covid/stats")
-async def get_covid_stats(db: Session = Depends(get_db)):
-    """Estadísticas agregadas de COVID"""
+async def get_covid_stats(
+    fecha_inicio: Optional[date] = Query(None, description="Fecha inicio"),
+    fecha_fin: Optional[date] = Query(None, description="Fecha fin"),
+    comunidad: Optional[str] = Query(None, description="Comunidad autónoma"),
+    db: Session = Depends(get_db)
+):
+    """
+    Estadísticas agregadas de COVID
+    
+    Se leen de los rollups diarios (covid_daily_ccaa / covid_daily_provincia),
+    que se refrescan de forma incremental al ingerir nuevos días.
+    """
     try:
-        total_por_comunidad = db.query(
-            CovidCase.comunidad_autonoma,
-            func.sum(CovidCase.casos_confirmados).label("total_casos"),
-            func.sum(CovidCase.fallecidos).label("total_fallecidos"),
-            func.avg(CovidCase.casos_confirmados).label("promedio_diario")
-        ).group_by(CovidCase.comunidad_autonoma).all()
-
-        totals = db.query(
-            func.sum(CovidCase.casos_confirmados).label("total_casos"),
-            func.sum(CovidCase.fallecidos).label("total_fallecidos"),
-            func.sum(CovidCase.ingresos_uci).label("total_uci"),
-            func.count(func.distinct(CovidCase.fecha)).label("dias_registrados")
-        ).first()
+        where = "1=1"
+        params = {}
+        
+        if fecha_inicio:
+            where += " AND fecha >= :fecha_inicio"
+            params['fecha_inicio'] = fecha_inicio
+        
+        if fecha_fin:
+            where += " AND fecha <= :fecha_fin"
+            params['fecha_fin'] = fecha_fin
+        
+        if comunidad and comunidad != "todas":
+            where += " AND comunidad_autonoma ILIKE :comunidad"
+            params['comunidad'] = f"%{comunidad}%"
+        
+        total_por_comunidad = db.execute(text(f"""
+            SELECT 
+                comunidad_autonoma,
+                SUM(total_casos) as total_casos,
+                SUM(total_fallecidos) as total_fallecidos,
+                SUM(total_casos)::float / NULLIF(SUM(registros), 0) as promedio_diario
+            FROM covid_daily_ccaa
+            WHERE {where}
+            GROUP BY comunidad_autonoma
+            ORDER BY comunidad_autonoma
+        """), params).fetchall()
+        
+        total_por_provincia = db.execute(text(f"""
+            SELECT 
+                comunidad_autonoma,
+                provincia,
+                SUM(total_casos) as total_casos,
+                SUM(total_fallecidos) as total_fallecidos,
+                SUM(total_casos)::float / NULLIF(SUM(registros), 0) as promedio_diario
+            FROM covid_daily_provincia
+            WHERE {where}
+            GROUP BY comunidad_autonoma, provincia
+            ORDER BY comunidad_autonoma, provincia
+        """), params).fetchall()
+        
+        totals = db.execute(text(f"""
+            SELECT 
+                SUM(total_casos) as total_casos,
+                SUM(total_fallecidos) as total_fallecidos,
+                SUM(total_uci) as total_uci,
+                COUNT(DISTINCT fecha) as dias_registrados
+            FROM covid_daily_ccaa
+            WHERE {where}
+        """), params).first()
         
         return {
             "por_comunidad": [
@@ -270,10 +527,20 @@ async def get_covid_stats(db: Session = Depends(get_db)):
                     "comunidad": r.comunidad_autonoma,
                     "total_casos": int(r.total_casos),
                     "total_fallecidos": int(r.total_fallecidos),
-                    "promedio_diario": float(r.promedio_diario)
+                    "promedio_diario": float(r.promedio_diario) if r.promedio_diario else 0
                 }
                 for r in total_por_comunidad
             ],
+            "por_provincia": [
+                {
+                    "comunidad": r.comunidad_autonoma,
+                    "provincia": r.provincia,
+                    "total_casos": int(r.total_casos),
+                    "total_fallecidos": int(r.total_fallecidos),
+                    "promedio_diario": float(r.promedio_diario) if r.promedio_diario else 0
+                }
+                for r in total_por_provincia
+            ],
             "totales": {
                 "total_casos": int(totals.total_casos) if totals.total_casos else 0,
                 "total_fallecidos": int(totals.total_fallecidos) if totals.total_fallecidos else 0,
@@ -285,6 +552,143 @@ async def get_covid_stats(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error al calcular estadísticas: {str(e)}")
 
 
+# Mapeos de la API de series temporales -> columnas de los rollups
+TIMESERIES_NIVELES = {
+    'comunidad': ('covid_daily_ccaa', 'comunidad_autonoma'),
+    'provincia': ('covid_daily_provincia', 'provincia')
+}
+
+TIMESERIES_METRICAS = {
+    'casos': 'total_casos',
+    'uci': 'total_uci',
+    'fallecidos': 'total_fallecidos',
+    'altas': 'total_altas'
+}
+
+TIMESERIES_BUCKETS = {'day', 'week', 'month'}
+
+TIMESERIES_VENTANAS = {0, 7, 14}
+
+
+@router.get("/covid/timeseries")
+async def get_covid_timeseries(
+    nivel: str = Query('comunidad', description="comunidad | provincia"),
+    regiones: Optional[str] = Query(None, description="Regiones separadas por coma (todas si se omite)"),
+    metrica: str = Query('casos', description="casos | uci | fallecidos | altas"),
+    bucket: str = Query('day', description="day | week | month"),
+    rolling: int = Query(0, description="Suma móvil en días: 0, 7 o 14"),
+    fecha_inicio: Optional[date] = Query(None, description="Fecha inicio"),
+    fecha_fin: Optional[date] = Query(None, description="Fecha fin"),
+    db: Session = Depends(get_db)
+):
+    """
+    Series temporales alineadas para gráficos
+    
+    Devuelve un eje de fechas común y un array denso de valores por región,
+    agregados en SQL (date_trunc) sobre los rollups diarios. Con rolling=7/14
+    se aplica una suma móvil diaria; en buckets semanales/mensuales el valor es
+    el de la suma móvil al cierre del periodo.
+    """
+    try:
+        if nivel not in TIMESERIES_NIVELES:
+            raise HTTPException(status_code=400, detail=f"Nivel no válido. Válidos: {', '.join(TIMESERIES_NIVELES)}")
+        if metrica not in TIMESERIES_METRICAS:
+            raise HTTPException(status_code=400, detail=f"Métrica no válida. Válidas: {', '.join(TIMESERIES_METRICAS)}")
+        if bucket not in TIMESERIES_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"Bucket no válido. Válidos: {', '.join(sorted(TIMESERIES_BUCKETS))}")
+        if rolling not in TIMESERIES_VENTANAS:
+            raise HTTPException(status_code=400, detail="Rolling no válido. Válidos: 0, 7, 14")
+        
+        tabla, columna = TIMESERIES_NIVELES[nivel]
+        valor_col = TIMESERIES_METRICAS[metrica]
+        
+        params = {
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'bucket': bucket,
+            # Días previos necesarios para que la suma móvil del primer día sea completa
+            'margen': max(rolling - 1, 0)
+        }
+        
+        filtro_regiones = ""
+        lista_regiones = [r.strip() for r in regiones.split(",") if r.strip()] if regiones else []
+        if lista_regiones:
+            filtro_regiones = f"WHERE {columna} = ANY(:regiones)"
+            params['regiones'] = lista_regiones
+        
+        if rolling:
+            valor_diario = f"SUM(valor) OVER (PARTITION BY region ORDER BY fecha ROWS BETWEEN {rolling - 1} PRECEDING AND CURRENT ROW)"
+            valor_bucket = "(ARRAY_AGG(valor ORDER BY fecha DESC))[1]"
+        else:
+            valor_diario = "valor"
+            valor_bucket = "SUM(valor)"
+        
+        query = f"""
+            WITH rango AS (
+                SELECT 
+                    COALESCE(CAST(:fecha_inicio AS DATE), MIN(fecha)) AS desde,
+                    COALESCE(CAST(:fecha_fin AS DATE), MAX(fecha)) AS hasta
+                FROM {tabla}
+            ),
+            dias AS (
+                SELECT generate_series(desde - :margen, hasta, INTERVAL '1 day')::date AS fecha
+                FROM rango
+            ),
+            lista_regiones AS (
+                SELECT DISTINCT {columna} AS region FROM {tabla} {filtro_regiones}
+            ),
+            diario AS (
+                SELECT r.region, d.fecha, COALESCE(SUM(t.{valor_col}), 0) AS valor
+                FROM lista_regiones r
+                CROSS JOIN dias d
+                LEFT JOIN {tabla} t ON t.{columna} = r.region AND t.fecha = d.fecha
+                GROUP BY r.region, d.fecha
+            ),
+            suavizado AS (
+                SELECT region, fecha, {valor_diario} AS valor
+                FROM diario
+            )
+            SELECT 
+                s.region,
+                date_trunc(:bucket, s.fecha)::date AS periodo,
+                {valor_bucket} AS valor
+            FROM suavizado s, rango
+            WHERE s.fecha >= rango.desde
+            GROUP BY s.region, periodo
+            ORDER BY s.region, periodo
+        """
+        
+        rows = db.execute(text(query), params).fetchall()
+        
+        # Pivotar a matriz alineada: eje de fechas común + un array por región
+        fechas = sorted({row[1] for row in rows})
+        posicion = {f: i for i, f in enumerate(fechas)}
+        series = {}
+        for region, periodo, valor in rows:
+            if region not in series:
+                series[region] = [0] * len(fechas)
+            series[region][posicion[periodo]] = int(valor) if valor is not None else 0
+        
+        return {
+            "success": True,
+            "nivel": nivel,
+            "metrica": metrica,
+            "bucket": bucket,
+            "rolling": rolling,
+            "fechas": [f.isoformat() for f in fechas],
+            "series": [
+                {"region": region, "valores": valores}
+                for region, valores in series.items()
+            ],
+            "count": len(series)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al calcular series temporales: {str(e)}")
+
+
 @router.get("/covid/filter")
 async def filter_covid_data(
     db: Session = Depends(get_db),
@@ -303,12 +707,20 @@ async def filter_covid_data(
     return await get_covid_data(
         comunidad=comunidad,
         provincia=provincia,
+        codigo_ccaa=None,
+        codigo_provincia=None,
         fecha_inicio=fecha_inicio,
         fecha_fin=fecha_fin,
         min_casos=min_casos,
         max_casos=max_casos,
+        bbox=None,
+        near=None,
+        radius_km=None,
         limit=10000,
         offset=0,
+        cursor=None,
+        include_total=True,
         light=False,
+        formato='json',
         db=db
     )
\ No newline at end of file
@@ -1,24 +1,105 @@
 # /home/bbvedf/prog/geo-data/backend/app/elections.py
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request, Response
 from typing import Optional, List
 from app.database import get_db
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from fastapi import Depends
+from app.utils.spatial import BBox, Near, parse_bbox, parse_near, filtros_espaciales_sql
+from app.utils.wire_format import validar_formato, filas_a_columnas, a_columnar, respuesta_arrow
+from app.services.elections_payload import ElectionsMapPayload
 
 router = APIRouter(prefix="/api", tags=["elections"])
 
+# Columnas del modo light y cuáles se codifican como diccionario en format=columnar/arrow
+ELECCIONES_COLUMNAS_LIGHT = [
+    "codigo_ine", "nombre_municipio", "nombre_provincia", "lat", "lon",
+    "partido_ganador", "participacion", "poblacion"
+]
+ELECCIONES_COLUMNAS_DICCIONARIO = ("nombre_provincia", "partido_ganador")
+
+# Partidos con columna propia (tabla de resultados y cubo de agregados)
+PARTIDOS_VALIDOS = [
+    'pp', 'psoe', 'vox', 'sumar', 'erc', 'jxcat_junts',
+    'eh_bildu', 'eaj_pnv', 'bng', 'cca', 'upn', 'pacma', 'cup_pr', 'fo'
+]
+NIVELES_AGREGADOS = ('comunidad', 'provincia', 'nacional')
+
+
+def construir_filtros_elecciones(
+    municipio: Optional[str] = None,
+    provincia: Optional[str] = None,
+    comunidad: Optional[str] = None,
+    partido_ganador: Optional[str] = None,
+    min_participacion: Optional[float] = None,
+    max_participacion: Optional[float] = None,
+    bbox: Optional[BBox] = None,
+    near: Optional[Near] = None,
+    codigo_ccaa: Optional[int] = None,
+    codigo_provincia: Optional[int] = None
+):
+    """Construye el fragmento WHERE (sin el WHERE) y sus parámetros para municipios m JOIN elecciones e"""
+    condiciones = ["1=1"]
+    params = {}
+    
+    # Códigos INE: igualdad entera sobre columnas indexadas de municipios_espana
+    if codigo_ccaa is not None:
+        condiciones.append("m.codigo_ccaa = :codigo_ccaa")
+        params['codigo_ccaa'] = codigo_ccaa
+    
+    if codigo_provincia is not None:
+        condiciones.append("m.codigo_provincia = :codigo_provincia")
+        params['codigo_provincia'] = codigo_provincia
+    
+    if municipio:
+        condiciones.append("m.nombre_municipio ILIKE :municipio")
+        params['municipio'] = f"%{municipio}%"
+    
+    if provincia:
+        condiciones.append("m.nombre_provincia ILIKE :provincia")
+        params['provincia'] = f"%{provincia}%"
+    
+    if comunidad:
+        condiciones.append("m.nombre_comunidad ILIKE :comunidad")
+        params['comunidad'] = f"%{comunidad}%"
+    
+    if partido_ganador:
+        condiciones.append("e.partido_ganador = :partido_ganador")
+        params['partido_ganador'] = partido_ganador
+    
+    if min_participacion is not None:
+        condiciones.append("e.participacion >= :min_participacion")
+        params['min_participacion'] = min_participacion
+    
+    if max_participacion is not None:
+        condiciones.append("e.participacion <= :max_participacion")
+        params['max_participacion'] = max_participacion
+    
+    # m.geom: columna generada a partir de lat/lon con índice GIST
+    condiciones_espaciales, params_espaciales = filtros_espaciales_sql("m.geom", bbox, near)
+    condiciones.extend(condiciones_espaciales)
+    params.update(params_espaciales)
+    
+    return " AND ".join(condiciones), params
+
+
 @router.get("/elections/data")
 async def get_election_data(
     municipio: Optional[str] = Query(None, description="Nombre del municipio"),
     provincia: Optional[str] = Query(None, description="Nombre de la provincia"),
     comunidad: Optional[str] = Query(None, description="Nombre de la comunidad"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
     partido_ganador: Optional[str] = Query(None, description="Partido ganador"),
     min_participacion: Optional[float] = Query(None, ge=0, le=100, description="Participación mínima (%)"),
     max_participacion: Optional[float] = Query(None, ge=0, le=100, description="Participación máxima (%)"),
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    near: Optional[str] = Query(None, description="lon,lat (requiere radius_km)"),
+    radius_km: Optional[float] = Query(None, gt=0, le=1000, description="Radio en km para near"),
     limit: Optional[int] = Query(100, ge=1, le=10000, description="Límite de resultados"),
     offset: Optional[int] = Query(0, ge=0, description="Offset para paginación"),
     light: Optional[bool] = Query(False, description="Modo ligero (solo coords + partido)"),
+    formato: str = Query('json', alias="format", description="json | columnar | arrow (solo light=true)"),
     db: Session = Depends(get_db)
 ):
     """
@@ -26,8 +107,15 @@ async def get_election_data(
     
     **Modo light=true**: Devuelve solo coordenadas, nombre y partido ganador (para mapas)
     **Modo light=false**: Devuelve todos los datos completos
+    **Filtros espaciales**: `bbox` (viewport) y `near` + `radius_km` sobre m.geom
+    **format=columnar|arrow** (con light=true): arrays paralelos por campo, con
+    provincia y partido codificados como diccionario, o stream Arrow IPC
     """
     try:
+        formato = validar_formato(formato, light)
+        caja = parse_bbox(bbox)
+        cerca = parse_near(near, radius_km)
+        
         # Query base diferente según modo light
         if light:
             query = """
@@ -42,7 +130,7 @@ async def get_election_data(
                     m.poblacion
                 FROM municipios_espana m
                 JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
-                WHERE 1=1
+                WHERE 
             """
         else:
             query = """
@@ -82,34 +170,15 @@ async def get_election_data(
                     e.created_at
                 FROM municipios_espana m
                 JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
-                WHERE 1=1
+                WHERE 
             """
         
-        params = {}
-        
-        if municipio:
-            query += " AND m.nombre_municipio ILIKE :municipio"
-            params['municipio'] = f"%{municipio}%"
-        
-        if provincia:
-            query += " AND m.nombre_provincia ILIKE :provincia"
-            params['provincia'] = f"%{provincia}%"
-        
-        if comunidad:
-            query += " AND m.nombre_comunidad ILIKE :comunidad"
-            params['comunidad'] = f"%{comunidad}%"
-        
-        if partido_ganador:
-            query += " AND e.partido_ganador = :partido_ganador"
-            params['partido_ganador'] = partido_ganador
-        
-        if min_participacion is not None:
-            query += " AND e.participacion >= :min_participacion"
-            params['min_participacion'] = min_participacion
-        
-        if max_participacion is not None:
-            query += " AND e.participacion <= :max_participacion"
-            params['max_participacion'] = max_participacion
+        where, params = construir_filtros_elecciones(
+            municipio, provincia, comunidad, partido_ganador,
+            min_participacion, max_participacion, caja, cerca,
+            codigo_ccaa, codigo_provincia
+        )
+        query += where
         
         query += " ORDER BY m.nombre_municipio LIMIT :limit OFFSET :offset"
         params['limit'] = limit
@@ -120,7 +189,17 @@ async def get_election_data(
         
         # Convertir según modo
         data = []
-        if light:
+        if formato != 'json':
+            columnas = filas_a_columnas(
+                rows,
+                ELECCIONES_COLUMNAS_LIGHT,
+                {
+                    "lat": lambda v: float(v) if v else None,
+                    "lon": lambda v: float(v) if v else None,
+                    "participacion": lambda v: float(v) if v else None
+                }
+            )
+        elif light:
             # Modo ligero: solo lo esencial
             for row in rows:
                 data.append({
@@ -173,56 +252,96 @@ async def get_election_data(
                 })
         
         # Obtener total de registros (para paginación)
-        count_query = """
+        count_where, count_params = construir_filtros_elecciones(
+            municipio, provincia, comunidad, partido_ganador,
+            min_participacion, max_participacion, caja, cerca,
+            codigo_ccaa, codigo_provincia
+        )
+        count_query = f"""
             SELECT COUNT(*) 
             FROM municipios_espana m
             JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
-            WHERE 1=1
+            WHERE {count_where}
         """
-        count_params = {}
-        
-        if municipio:
-            count_query += " AND m.nombre_municipio ILIKE :municipio"
-            count_params['municipio'] = f"%{municipio}%"
-        
-        if provincia:
-            count_query += " AND m.nombre_provincia ILIKE :provincia"
-            count_params['provincia'] = f"%{provincia}%"
-        
-        if comunidad:
-            count_query += " AND m.nombre_comunidad ILIKE :comunidad"
-            count_params['comunidad'] = f"%{comunidad}%"
-        
-        if partido_ganador:
-            count_query += " AND e.partido_ganador = :partido_ganador"
-            count_params['partido_ganador'] = partido_ganador
-        
-        if min_participacion is not None:
-            count_query += " AND e.participacion >= :min_participacion"
-            count_params['min_participacion'] = min_participacion
-        
-        if max_participacion is not None:
-            count_query += " AND e.participacion <= :max_participacion"
-            count_params['max_participacion'] = max_participacion
         
         total_result = db.execute(text(count_query), count_params)
         total = total_result.scalar()
+        has_more = (offset + len(rows)) < total
+        
+        if formato == 'arrow':
+            return respuesta_arrow(
+                columnas,
+                ELECCIONES_COLUMNAS_DICCIONARIO,
+                {"count": len(rows), "total": total, "offset": offset, "has_more": has_more}
+            )
+        if formato == 'columnar':
+            data = a_columnar(columnas, ELECCIONES_COLUMNAS_DICCIONARIO)
         
         return {
             "success": True,
-            "count": len(data),
+            "count": len(rows),
             "total": total,
             "offset": offset,
             "limit": limit,
-            "has_more": (offset + len(data)) < total,
+            "has_more": has_more,
             "light_mode": light,
+            "format": formato,
             "data": data
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos electorales: {str(e)}")
 
 
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprueba la cabecera If-None-Match contra el ETag (admite lista y '*')"""
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == "*" or candidato == etag:
+            return True
+    return False
+
+
+@router.get("/elections/map")
+async def get_election_map(request: Request, db: Session = Depends(get_db)):
+    """
+    Proyección light de todos los municipios para el mapa.
+    
+    Precalculada en memoria (JSON serializado + gzip) y servida con ETag
+    fuerte por representación (gzip con sufijo -gz): si el cliente ya la
+    tiene responde 304 sin cuerpo. Se reconstruye automáticamente cuando
+    cambia la versión del dataset.
+    """
+    try:
+        payload = ElectionsMapPayload.get(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener mapa electoral: {str(e)}")
+    
+    # El ETag identifica la representación servida (identity o gzip)
+    usar_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    etag = payload["etag_gzip"] if usar_gzip else payload["etag"]
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache"
+    }
+    
+    if etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if usar_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload["gzip"], media_type="application/json", headers=headers)
+    
+    return Response(content=payload["json"], media_type="application/json", headers=headers)
+
+
 @router.get("/elections/municipality/{codigo_ine}")
 async def get_municipality_detail(
     codigo_ine: str,
@@ -398,49 +517,150 @@ async def get_election_stats(db: Session = Depends(get_db)):
 @router.get("/elections/party/{partido}")
 async def get_party_results(
     partido: str,
+    nivel: str = Query('comunidad', description="comunidad | provincia | nacional"),
+    comunidad: Optional[str] = Query(None, description="Restringir a una comunidad (nombre exacto)"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Restringir a una comunidad (código INE)"),
     db: Session = Depends(get_db)
 ):
     """
-    Resultados específicos de un partido por comunidad autónoma
+    Resultados específicos de un partido por comunidad autónoma, provincia o total nacional.
+    
+    Lee el cubo precalculado en la ingesta (elecciones_congreso_2023_agregados):
+    no se agrega nada por petición.
     """
     try:
-        # Validar partido
-        partidos_validos = ['pp', 'psoe', 'vox', 'sumar', 'erc', 'jxcat_junts', 
-                           'eh_bildu', 'eaj_pnv', 'bng', 'cca', 'upn', 'pacma', 'cup_pr', 'fo']
-        
-        if partido.lower() not in partidos_validos:
-            raise HTTPException(status_code=400, detail=f"Partido no válido. Válidos: {', '.join(partidos_validos)}")
+        partido = partido.lower()
+        if partido not in PARTIDOS_VALIDOS:
+            raise HTTPException(status_code=400, detail=f"Partido no válido. Válidos: {', '.join(PARTIDOS_VALIDOS)}")
+        if nivel not in NIVELES_AGREGADOS:
+            raise HTTPException(status_code=400, detail=f"Nivel no válido. Válidos: {', '.join(NIVELES_AGREGADOS)}")
         
+        # partido validado contra la lista blanca: seguro interpolarlo como columna
         query = f"""
             SELECT 
-                m.nombre_comunidad,
-                COUNT(*) as total_municipios,
-                SUM(e.{partido}) as total_votos,
-                SUM(e.censo) as censo_comunidad,
-                ROUND(SUM(e.{partido}) * 100.0 / NULLIF(SUM(e.votos_validos), 0), 2) as porcentaje_votos
-            FROM municipios_espana m
-            JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
-            GROUP BY m.nombre_comunidad
-            HAVING SUM(e.{partido}) > 0
-            ORDER BY total_votos DESC
+                comunidad,
+                provincia,
+                num_municipios,
+                {partido} AS total_votos,
+                censo,
+                ROUND({partido} * 100.0 / NULLIF(votos_validos, 0), 2) AS porcentaje_votos
+            FROM elecciones_congreso_2023_agregados
+            WHERE nivel = :nivel AND {partido} > 0
         """
+        params = {"nivel": nivel}
+        if comunidad:
+            query += " AND comunidad = :comunidad"
+            params["comunidad"] = comunidad
+        if codigo_ccaa is not None:
+            query += " AND codigo_ccaa = :codigo_ccaa"
+            params["codigo_ccaa"] = codigo_ccaa
+        query += " ORDER BY total_votos DESC"
         
-        result = db.execute(text(query))
+        result = db.execute(text(query), params)
         rows = result.fetchall()
         
+        data = []
+        for row in rows:
+            item = {
+                "comunidad": row[0] or None,
+                "total_municipios": row[2],
+                "total_votos": int(row[3]) if row[3] else 0,
+                "censo_comunidad": int(row[4]) if row[4] else 0,
+                "porcentaje_votos": float(row[5]) if row[5] else 0
+            }
+            if nivel == 'provincia':
+                item["provincia"] = row[1]
+            data.append(item)
+        
+        return {
+            "success": True,
+            "partido": partido.upper(),
+            "nivel": nivel,
+            "count": len(data),
+            "data": data
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener datos del partido: {str(e)}")
+
+
+@router.get("/elections/aggregates")
+async def get_election_aggregates(
+    nivel: str = Query('comunidad', description="comunidad | provincia | nacional"),
+    comunidad: Optional[str] = Query(None, description="Nombre exacto de la comunidad"),
+    provincia: Optional[str] = Query(None, description="Nombre exacto de la provincia"),
+    codigo_ccaa: Optional[int] = Query(None, ge=1, le=19, description="Código INE de la comunidad autónoma"),
+    codigo_provincia: Optional[int] = Query(None, ge=1, le=52, description="Código INE de la provincia"),
+    db: Session = Depends(get_db)
+):
+    """
+    Agregados electorales por nivel territorial (cubo GROUPING SETS calculado en la ingesta).
+    
+    Cada unidad incluye los votos de todos los partidos, censo, votantes,
+    votos válidos, participación y partido ganador.
+    """
+    try:
+        if nivel not in NIVELES_AGREGADOS:
+            raise HTTPException(status_code=400, detail=f"Nivel no válido. Válidos: {', '.join(NIVELES_AGREGADOS)}")
+        
+        query = f"""
+            SELECT 
+                comunidad,
+                provincia,
+                num_municipios,
+                censo,
+                votantes,
+                votos_validos,
+                participacion,
+                partido_ganador,
+                votos_ganador,
+                codigo_ccaa,
+                codigo_provincia,
+                {", ".join(PARTIDOS_VALIDOS)}
+            FROM elecciones_congreso_2023_agregados
+            WHERE nivel = :nivel
+        """
+        params = {"nivel": nivel}
+        if comunidad:
+            query += " AND comunidad = :comunidad"
+            params["comunidad"] = comunidad
+        if provincia:
+            query += " AND provincia = :provincia"
+            params["provincia"] = provincia
+        if codigo_ccaa is not None:
+            query += " AND codigo_ccaa = :codigo_ccaa"
+            params["codigo_ccaa"] = codigo_ccaa
+        if codigo_provincia is not None:
+            query += " AND codigo_provincia = :codigo_provincia"
+            params["codigo_provincia"] = codigo_provincia
+        query += " ORDER BY comunidad, provincia"
+        
+        rows = db.execute(text(query), params).fetchall()
+        
         data = []
         for row in rows:
             data.append({
-                "comunidad": row[0],
-                "total_municipios": row[1],
-                "total_votos": int(row[2]) if row[2] else 0,
-                "censo_comunidad": int(row[3]) if row[3] else 0,
-                "porcentaje_votos": float(row[4]) if row[4] else 0
+                "comunidad": row[0] or None,
+                "provincia": row[1] or None,
+                "codigo_ccaa": row[9],
+                "codigo_provincia": row[10],
+                "num_municipios": row[2],
+                "censo": int(row[3]),
+                "votantes": int(row[4]),
+                "votos_validos": int(row[5]),
+                "participacion": float(row[6]) if row[6] is not None else None,
+                "partido_ganador": row[7],
+                "votos_ganador": int(row[8]) if row[8] else 0,
+                "partidos": {
+                    p: int(v) for p, v in zip(PARTIDOS_VALIDOS, row[11:])
+                }
             })
         
         return {
             "success": True,
-            "partido": partido.upper(),
+            "nivel": nivel,
             "count": len(data),
             "data": data
         }
@@ -448,4 +668,4 @@ async def get_party_results(
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al obtener datos del partido: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error al obtener agregados electorales: {str(e)}")
@@ -2,10 +2,12 @@
 Módulo para datos de Vivienda - INE (Índice de Precios de Vivienda)
 URLs: https://www.ine.es/jaxiT3/files/t/es/csv_bdsc/25171.csv?nocab=1
 """
+import asyncio
+import time
 import requests
 import pandas as pd
 from io import StringIO
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, date
 import json
 import unicodedata
@@ -13,9 +15,10 @@ import re
 from fastapi import APIRouter, Query, HTTPException, Depends
 ## Acceso a bd.
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.housing import HousingINECache, HousingINESnapshot  
 from app.services.housing_cache import HousingCacheService
+from app.utils.geo_reference import CCAA_NOMBRES_INE
 
 # ============= FUNCIONES DE LIMPIEZA =============
 def limpiar_string(s: str) -> str:
@@ -57,27 +60,8 @@ METRICAS = {
     'Variación en lo que va de año': 'Variación porcentual acumulada en el año'
 }
 
-CCAA_CODES = {
-    '01': 'Andalucía',
-    '02': 'Aragón',
-    '03': 'Asturias, Principado de',
-    '04': 'Balears, Illes',
-    '05': 'Canarias',
-    '06': 'Cantabria',
-    '07': 'Castilla y León',
-    '08': 'Castilla - La Mancha',
-    '09': 'Cataluña',
-    '10': 'Comunitat Valenciana',
-    '11': 'Extremadura',
-    '12': 'Galicia',
-    '13': 'Madrid, Comunidad de',
-    '14': 'Murcia, Región de',
-    '15': 'Navarra, Comunidad Foral de',
-    '16': 'País Vasco',
-    '17': 'Rioja, La',
-    '18': 'Ceuta',
-    '19': 'Melilla'
-}
+# Códigos INE de CCAA con dos cifras, como los devuelve el CSV del INE
+CCAA_CODES = {f"{codigo:02d}": nombre for codigo, nombre in CCAA_NOMBRES_INE.items()}
 
 INE_DATA_CACHE = None
 INE_DATA_LAST_UPDATE = None
@@ -205,6 +189,67 @@ def crear_datos_mock() -> pd.DataFrame:
     
     return pd.DataFrame(data)
 
+# Tiempo máximo que espera una petición sin caché a que otro worker lo rellene
+ESPERA_REFRESCO_SEGUNDOS = 45
+
+def refrescar_cache_ine_bloqueante() -> Tuple[bool, Optional[pd.DataFrame]]:
+    """
+    Intenta el refresco con el advisory lock: (lock obtenido, DataFrame
+    descargado o None). Bloqueante (descarga de hasta 30 s + parseo +
+    guardado): se ejecuta en un hilo, con una sesión propia de ese hilo.
+    """
+    db = SessionLocal()
+    try:
+        with HousingCacheService.refresh_lock() as adquirido:
+            if not adquirido:
+                return False, None
+            
+            # Otro worker puede haber terminado justo antes de tomar el lock
+            if HousingCacheService.is_cache_valid(db, forzar=True):
+                return True, None
+            
+            print("🌐 Caché inválido/vacío: descargando del INE...")
+            df = descargar_datos_ine()
+            if df is None or df.empty:
+                return True, None
+            
+            try:
+                print(f"💾 Guardando {len(df)} registros del INE en caché...")
+                HousingCacheService.save_to_cache(db, df)
+            except Exception as e:
+                import traceback
+                print(f"⚠️ No se pudo guardar en caché: {e}")
+                print(f"⚠️ Traceback: {traceback.format_exc()}")
+                # Continuar igualmente, el caché es opcional
+            return True, df
+    finally:
+        db.close()
+
+async def refrescar_cache_ine(db: Session) -> Optional[pd.DataFrame]:
+    """
+    Refresco single-flight del caché de vivienda entre workers.
+    
+    Solo la petición que obtiene el advisory lock descarga del INE y guarda
+    (devuelve el DataFrame descargado), en un hilo para no bloquear el
+    event loop: el resto de peticiones del mismo worker siguen atendiéndose.
+    Las demás devuelven None y sirven el caché anterior hasta el COMMIT del
+    nuevo; si todavía no hay caché esperan a que el worker que refresca lo
+    rellene (o a poder refrescar ellas si ese refresco falla).
+    """
+    limite = time.monotonic() + ESPERA_REFRESCO_SEGUNDOS
+    while True:
+        adquirido, df = await asyncio.to_thread(refrescar_cache_ine_bloqueante)
+        if adquirido:
+            return df
+        
+        meta = HousingCacheService.cache_metadata(db, forzar=True)
+        if meta and meta["row_count"]:
+            print("⏳ Otro worker está refrescando el caché del INE: se sirven los datos anteriores")
+            return None
+        if time.monotonic() >= limite:
+            return None
+        await asyncio.sleep(0.5)
+
 @router.get("/housing/data")
 async def get_housing_data(
     metric: str = Query('indice'),
@@ -214,6 +259,7 @@ async def get_housing_data(
     anio_hasta: Optional[int] = Query(None),
     limit: int = Query(100),
     offset: int = Query(0),
+    include_total: bool = Query(True),  # COUNT del filtro completo; False = coste solo de la página
     debug: bool = Query(False),
     db: Session = Depends(get_db)  # ← AÑADE ESTO
 ):
@@ -228,35 +274,30 @@ async def get_housing_data(
         # ========== INTENTAR OBTENER DEL CACHÉ ==========
         cache_service = HousingCacheService()
         
-        if cache_service.is_cache_valid(db):
-            # Caché válido: usar datos de Postgres
+        df = None
+        if not cache_service.is_cache_valid(db):
+            # Caché caducado o vacío: un solo worker descarga del INE, el resto sirve el caché anterior
+            df = await refrescar_cache_ine(db)
+        
+        if df is None:
+            meta = cache_service.cache_metadata(db)
+            if not meta or not meta["row_count"]:
+                raise HTTPException(status_code=503, detail="Datos no disponibles")
+            
+            # Usar datos de Postgres
             print(f"📦 Usando datos del caché para {metric} - {housing_type}")
-            cached_results = cache_service.get_from_cache(
+            resultados, total = cache_service.get_from_cache(
                 db=db,
                 metric=metrica_real,
                 tipo_vivienda=tipo_real,
                 ccaa=ccaa,
                 anio_desde=anio_desde,
-                anio_hasta=anio_hasta
+                anio_hasta=anio_hasta,
+                limit=limit,
+                offset=offset,
+                include_total=include_total
             )
             
-            # Convertir resultados de SQLAlchemy a diccionarios
-            filtered = cached_results
-            total = len(filtered)
-            
-            resultados = []
-            for item in filtered[offset:offset+limit]:
-                resultados.append({
-                    'periodo': item.periodo,
-                    'anio': item.anio,
-                    'trimestre': item.trimestre,
-                    'ccaa_codigo': item.ccaa_codigo,
-                    'ccaa_nombre': item.ccaa_nombre,
-                    'tipo_vivienda': item.tipo_vivienda,
-                    'metrica': item.metrica,
-                    'valor': item.valor
-                })
-            
             return {
                 "success": True,
                 "count": len(resultados),
@@ -267,26 +308,7 @@ async def get_housing_data(
                 "source": "cache"  # ← Indicador de que viene del caché
             }
         
-        # ========== CACHÉ INVÁLIDO O VACÍO: DESCARGAR DEL INE ==========
-        print(f"🌐 Caché inválido/vacío: descargando del INE...")
-        df = descargar_datos_ine()
-        
-        if df is None or df.empty:
-            raise HTTPException(status_code=503, detail="Datos no disponibles")
-        
-        # Guardar en caché para futuras requests
-        print("🔍 DEBUG: Intentando guardar en caché...")
-        try:
-            print(f"🔍 DEBUG: df tiene {len(df)} registros")
-            print(f"🔍 DEBUG: Llamando a save_to_cache...")
-            result = cache_service.save_to_cache(db, df)
-            print(f"🔍 DEBUG: save_to_cache retornó {result}")
-        except Exception as e:
-            import traceback
-            print(f"⚠️ No se pudo guardar en caché: {e}")
-            print(f"⚠️ Traceback: {traceback.format_exc()}")
-            # Continuar igualmente, el caché es opcional
-        
+        # ========== DATOS RECIÉN DESCARGADOS DEL INE ==========
         # Filtrar como antes
         if debug:
             print(f"DEBUG: Buscando metrica='{metrica_real}', tipo='{tipo_real}'")
@@ -311,21 +333,23 @@ async def get_housing_data(
         
         total = len(filtered)
         
-        filtered = filtered.sort_values(['anio', 'trimestre'], ascending=[False, False])
-        paginated = filtered.iloc[offset:offset+limit] if offset < total else pd.DataFrame()
-        
-        resultados = []
-        for _, row in paginated.iterrows():
-            resultados.append({
-                'periodo': row['periodo'],
-                'anio': int(row['anio']),
-                'trimestre': int(row['trimestre']),
-                'ccaa_codigo': row['ccaa_codigo'] if pd.notna(row['ccaa_codigo']) else '00',
-                'ccaa_nombre': row['ccaa_nombre'] if pd.notna(row['ccaa_nombre']) else 'Nacional',
-                'tipo_vivienda': row['tipo_vivienda'],
-                'metrica': row['metrica'],
-                'valor': float(row['valor']) if pd.notna(row['valor']) else None
-            })
+        # Ordenar y paginar antes de convertir: solo se normalizan las filas de la página
+        # (mismo orden que el caché: ccaa_codigo y periodo deshacen empates entre CCAA)
+        paginated = filtered.assign(ccaa_codigo=filtered['ccaa_codigo'].fillna('00')).sort_values(
+            ['anio', 'trimestre', 'ccaa_codigo', 'periodo'], ascending=[False, False, True, True]
+        ).iloc[offset:offset+limit]
+        paginated = pd.DataFrame({
+            'periodo': paginated['periodo'],
+            'anio': paginated['anio'].astype(int),
+            'trimestre': paginated['trimestre'].astype(int),
+            'ccaa_codigo': paginated['ccaa_codigo'],
+            'ccaa_nombre': paginated['ccaa_nombre'].fillna('Nacional'),
+            'tipo_vivienda': paginated['tipo_vivienda'],
+            'metrica': paginated['metrica'],
+            'valor': pd.to_numeric(paginated['valor'], errors='coerce').astype(object)
+        })
+        paginated['valor'] = paginated['valor'].where(paginated['valor'].notna(), None)
+        resultados = paginated.to_dict('records')
         
         return {
             "success": True,
@@ -0,0 +1,44 @@
+# backend/app/routers/places.py
+from fastapi import APIRouter, Query, HTTPException, Depends
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.services.place_index import PlaceIndex, TIPOS
+
+router = APIRouter(prefix="/api", tags=["places"])
+
+
+@router.get("/places/search")
+async def search_places(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto a buscar (prefijo, sin distinguir acentos)"),
+    tipo: Optional[str] = Query(None, description="Filtrar por tipo: comunidad, provincia, municipio (CSV)"),
+    limit: int = Query(10, ge=1, le=50, description="Número máximo de resultados"),
+    db: Session = Depends(get_db)
+):
+    """
+    Autocompletado de lugares (CCAA, provincias y municipios).
+    
+    Búsqueda por prefijo sobre un índice en memoria construido una vez por
+    worker desde municipios_espana, el nomenclátor del CNIG y la referencia
+    de CCAA/provincias. Ordenado por coincidencia y población. Cada
+    resultado lleva sus códigos INE (codigo_ine, codigo_provincia,
+    codigo_ccaa) para filtrar después por clave exacta.
+    """
+    tipos = None
+    if tipo:
+        tipos = tuple(t.strip() for t in tipo.split(",") if t.strip())
+        invalidos = [t for t in tipos if t not in TIPOS]
+        if invalidos:
+            raise HTTPException(status_code=400, detail=f"Tipo no válido: {', '.join(invalidos)}. Válidos: {', '.join(TIPOS)}")
+    
+    try:
+        resultados = PlaceIndex.get(db).buscar(q, limit=limit, tipos=tipos)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda de lugares: {str(e)}")
+    
+    return {
+        "success": True,
+        "query": q,
+        "count": len(resultados),
+        "data": resultados
+    }
@@ -0,0 +1,240 @@
+# backend/app/services/air_quality_history.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime
+from typing import List, Optional
+import json
+import time
+
+DATASET = "air_quality"
+
+# Dimensión de estaciones: upsert de todo el snapshot en una sola sentencia
+UPSERT_STATIONS_SQL = """
+    INSERT INTO air_quality_stations AS s (
+        cod_estacion, station_id, nombre, tipo, station_class,
+        codigo_ine, codigo_provincia, codigo_ccaa, geom
+    )
+    SELECT
+        r.cod_estacion, r.station_id, r.nombre, r.tipo, r.station_class,
+        r.codigo_ine, r.codigo_provincia, r.codigo_ccaa,
+        ST_SetSRID(ST_MakePoint(r.lon, r.lat), 4326)
+    FROM json_to_recordset(CAST(:filas AS json)) AS r(
+        cod_estacion text, station_id integer, nombre text, tipo text, station_class smallint,
+        codigo_ine text, codigo_provincia smallint, codigo_ccaa smallint,
+        lat double precision, lon double precision
+    )
+    ON CONFLICT (cod_estacion) DO UPDATE SET
+        station_id = EXCLUDED.station_id,
+        nombre = EXCLUDED.nombre,
+        tipo = EXCLUDED.tipo,
+        station_class = EXCLUDED.station_class,
+        codigo_ine = EXCLUDED.codigo_ine,
+        codigo_provincia = EXCLUDED.codigo_provincia,
+        codigo_ccaa = EXCLUDED.codigo_ccaa,
+        geom = EXCLUDED.geom,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE (s.station_id, s.nombre, s.tipo, s.station_class, s.codigo_ine, s.codigo_provincia, s.codigo_ccaa, s.geom)
+          IS DISTINCT FROM
+          (EXCLUDED.station_id, EXCLUDED.nombre, EXCLUDED.tipo, EXCLUDED.station_class,
+           EXCLUDED.codigo_ine, EXCLUDED.codigo_provincia, EXCLUDED.codigo_ccaa, EXCLUDED.geom)
+"""
+
+# Lecturas: idempotente, una fila por (estación, hora)
+INSERT_READINGS_SQL = """
+    INSERT INTO air_quality_readings (cod_estacion, fecha, indice_ica, aqi, contaminante, activa)
+    SELECT r.cod_estacion, r.fecha, r.indice_ica, r.aqi, r.contaminante, r.activa
+    FROM json_to_recordset(CAST(:filas AS json)) AS r(
+        cod_estacion text, fecha timestamp, indice_ica smallint, aqi smallint,
+        contaminante text, activa boolean
+    )
+    ON CONFLICT (cod_estacion, fecha) DO NOTHING
+"""
+
+READINGS_SELECT = """
+    SELECT
+        s.station_id,
+        r.cod_estacion,
+        s.nombre,
+        s.codigo_provincia,
+        s.codigo_ccaa,
+        ST_Y(s.geom) AS lat,
+        ST_X(s.geom) AS lon,
+        r.fecha,
+        r.indice_ica,
+        r.aqi,
+        r.contaminante,
+        r.activa
+    FROM air_quality_readings r
+    JOIN air_quality_stations s ON s.cod_estacion = r.cod_estacion
+"""
+
+
+def _fila_lectura(row) -> dict:
+    return {
+        "id": row[0],
+        "station_code": row[1],
+        "name": row[2],
+        "codigo_provincia": row[3],
+        "codigo_ccaa": row[4],
+        "lat": row[5],
+        "lon": row[6],
+        "fecha": row[7].isoformat() if row[7] else None,
+        "ica_index": row[8],
+        "aqi": row[9],
+        "pollutant": row[10],
+        "is_active": row[11]
+    }
+
+
+class AirQualityHistoryService:
+    """Histórico horario de calidad del aire (air_quality_readings, particionada por día)"""
+
+    @staticmethod
+    def ingest(db: Session, snapshot: dict) -> int:
+        """Guarda las estaciones y lecturas de un snapshot MITECO; devuelve las lecturas nuevas"""
+        inicio = time.perf_counter()
+
+        # Una fila por código (ON CONFLICT no admite dos veces la misma clave)
+        estaciones = {
+            e.station_code: {
+                "cod_estacion": e.station_code,
+                "station_id": e.id,
+                "nombre": e.name,
+                "tipo": e.station_type,
+                "station_class": e.station_class,
+                "codigo_ine": e.codigo_ine,
+                "codigo_provincia": e.codigo_provincia,
+                "codigo_ccaa": e.codigo_ccaa,
+                "lat": e.lat,
+                "lon": e.lon
+            }
+            for e in snapshot["store"].estaciones
+        }
+
+        # La ventana de 24 horas rellena las horas que se hayan perdido (refrescos fallidos)
+        lecturas = {}
+        dias = set()
+        campos = ("cod_estacion", "fecha", "indice_ica", "tiene_indice", "aqi", "debido_a", "activa")
+        feeds = [snapshot["datos"]]
+        if "24h" in snapshot.get("ventanas", {}):
+            feeds.append(snapshot["ventanas"]["24h"])
+        for columnas in feeds:
+            for cod, fecha_txt, indice_ica, tiene_indice, aqi, debido_a, activa in zip(
+                *(columnas[campo] for campo in campos)
+            ):
+                if cod not in estaciones:
+                    continue
+                try:
+                    fecha = datetime.fromisoformat(fecha_txt)
+                except (TypeError, ValueError):
+                    continue
+                if (cod, fecha) in lecturas:
+                    continue
+                dias.add(fecha.date())
+                lecturas[(cod, fecha)] = {
+                    "cod_estacion": cod,
+                    "fecha": fecha.isoformat(),
+                    "indice_ica": indice_ica if tiene_indice else None,
+                    "aqi": aqi or None,
+                    "contaminante": debido_a,
+                    "activa": activa
+                }
+
+        try:
+            db.execute(text(UPSERT_STATIONS_SQL), {"filas": json.dumps(list(estaciones.values()))})
+            for dia in sorted(dias):
+                db.execute(text("SELECT air_quality_ensure_partition(:dia)"), {"dia": dia})
+            nuevas = db.execute(text(INSERT_READINGS_SQL), {"filas": json.dumps(list(lecturas.values()))}).rowcount
+            if nuevas:
+                db.execute(text("SELECT bump_dataset_version(:dataset)"), {"dataset": DATASET})
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        print(f"🗄️ Histórico calidad del aire: {nuevas} lecturas nuevas de {len(lecturas)} "
+              f"({len(estaciones)} estaciones, {time.perf_counter() - inicio:.2f}s)")
+        return nuevas
+
+    @staticmethod
+    def station_history(
+        db: Session,
+        station_id: int,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        limit: int = 168
+    ) -> Optional[List[dict]]:
+        """Lecturas de una estación, de la más reciente a la más antigua (None si no existe)"""
+        cod_estacion = db.execute(
+            text("SELECT cod_estacion FROM air_quality_stations WHERE station_id = :station_id LIMIT 1"),
+            {"station_id": station_id}
+        ).scalar()
+        if cod_estacion is None:
+            return None
+
+        query = READINGS_SELECT + " WHERE r.cod_estacion = :cod_estacion"
+        params = {"cod_estacion": cod_estacion, "limit": limit}
+        if desde:
+            query += " AND r.fecha >= :desde"
+            params["desde"] = desde
+        if hasta:
+            query += " AND r.fecha <= :hasta"
+            params["hasta"] = hasta
+        query += " ORDER BY r.fecha DESC LIMIT :limit"
+
+        return [_fila_lectura(row) for row in db.execute(text(query), params)]
+
+    @staticmethod
+    def readings(
+        db: Session,
+        contaminante: Optional[str] = None,
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        codigo_ccaa: Optional[int] = None,
+        codigo_provincia: Optional[int] = None,
+        limit: int = 1000,
+        offset: int = 0
+    ) -> dict:
+        """
+        Lecturas filtradas por contaminante, rango temporal y región. Sin
+        rango temporal se devuelve la última hora ingerida.
+        """
+        condiciones = ["1=1"]
+        params = {"limit": limit, "offset": offset}
+
+        if desde is None and hasta is None:
+            ultima = db.execute(text("SELECT MAX(fecha) FROM air_quality_readings")).scalar()
+            if ultima is None:
+                return {"fecha_referencia": None, "data": []}
+            condiciones.append("r.fecha = :ultima")
+            params["ultima"] = ultima
+        else:
+            ultima = None
+            if desde:
+                condiciones.append("r.fecha >= :desde")
+                params["desde"] = desde
+            if hasta:
+                condiciones.append("r.fecha <= :hasta")
+                params["hasta"] = hasta
+
+        if contaminante:
+            condiciones.append("r.contaminante = :contaminante")
+            params["contaminante"] = contaminante
+
+        if codigo_ccaa is not None:
+            condiciones.append("s.codigo_ccaa = :codigo_ccaa")
+            params["codigo_ccaa"] = codigo_ccaa
+
+        if codigo_provincia is not None:
+            condiciones.append("s.codigo_provincia = :codigo_provincia")
+            params["codigo_provincia"] = codigo_provincia
+
+        query = (
+            READINGS_SELECT
+            + " WHERE " + " AND ".join(condiciones)
+            + " ORDER BY r.fecha DESC, r.cod_estacion LIMIT :limit OFFSET :offset"
+        )
+        return {
+            "fecha_referencia": ultima.isoformat() if ultima else None,
+            "data": [_fila_lectura(row) for row in db.execute(text(query), params)]
+        }
@@ -0,0 +1,230 @@
+# backend/app/services/air_quality_snapshot.py
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+
+from app.services.air_quality_store import StationStore, peor_lectura_por_estacion
+from app.utils.miteco_csv import filas_columnas
+
+SNAPSHOT_DIR = Path(os.getenv(
+    "AIR_QUALITY_SNAPSHOT_DIR",
+    Path(__file__).resolve().parents[2] / "data" / ".cache"
+))
+SNAPSHOT_PATH = SNAPSHOT_DIR / "miteco_ultima_hora.json"
+LOCK_PATH = SNAPSHOT_DIR / "miteco_ultima_hora.lock"
+
+# MITECO publica el CSV cada hora; se descarga unos minutos después de la hora en punto
+REFRESH_OFFSET_SECONDS = int(os.getenv("AIR_QUALITY_REFRESH_OFFSET_SECONDS", "300"))
+# Reintento tras un fallo de descarga (se sigue sirviendo el último snapshot bueno)
+RETRY_SECONDS = int(os.getenv("AIR_QUALITY_RETRY_SECONDS", "300"))
+# Reintento cuando otro worker tiene el lock (si ese worker cae, otro toma el relevo)
+LOCK_RETRY_SECONDS = int(os.getenv("AIR_QUALITY_LOCK_RETRY_SECONDS", "60"))
+# Edad a partir de la cual el snapshot se marca como obsoleto en las respuestas
+STALE_AFTER_SECONDS = int(os.getenv("AIR_QUALITY_STALE_AFTER_SECONDS", "7200"))
+# Cada cuánto se comprueba si otro worker ha escrito un snapshot nuevo en disco
+DISK_RECHECK_SECONDS = 2.0
+
+
+class AirQualitySnapshot:
+    """
+    Último snapshot bueno del feed MITECO (última hora), compartido por todos los workers.
+
+    Una tarea en segundo plano por worker se despierta cada hora; solo el
+    worker que consigue el lock de fichero descarga y escribe el snapshot en
+    disco (escritura atómica). Otra tarea vigila el mtime del fichero y, si
+    cambia, lo recarga en un hilo y publica el nuevo snapshot sustituyendo la
+    referencia: las peticiones solo leen de memoria, sin disco ni red. Si la
+    descarga falla se sigue sirviendo el último snapshot (stale-while-revalidate).
+    """
+
+    _snapshot = None
+    _mtime = None
+    _lock = threading.Lock()
+    _task = None
+    _watcher = None
+
+    @classmethod
+    def get(cls) -> Optional[dict]:
+        """
+        Snapshot vigente ({'fetched_at', 'datos', 'ventanas', 'store', 'stores'})
+        o None si aún no hay ninguno; 'datos' y cada ventana son arrays por
+        campo y 'stores' tiene un StationStore por ventana ('1h' es 'store')
+        """
+        return cls._snapshot
+
+    @classmethod
+    def recargar(cls) -> Optional[dict]:
+        """
+        Recarga el snapshot del disco si cambió su mtime y lo publica de una
+        vez (cambio de referencia). Bloqueante: ejecutar fuera del event loop.
+        """
+        with cls._lock:
+            try:
+                mtime = SNAPSHOT_PATH.stat().st_mtime
+            except FileNotFoundError:
+                return cls._snapshot
+
+            if mtime != cls._mtime:
+                try:
+                    with open(SNAPSHOT_PATH, encoding="utf-8") as f:
+                        data = json.load(f)
+                    # El store se construye una vez por snapshot y lo comparten todas las peticiones
+                    store = StationStore(data["datos"])
+                    stores = {"1h": store}
+                    for ventana, columnas in data.get("ventanas", {}).items():
+                        stores[ventana] = StationStore(peor_lectura_por_estacion(columnas))
+                    cls._snapshot = {**data, "store": store, "stores": stores}
+                    print(f"🌬️ Snapshot MITECO cargado: {len(store.estaciones)} estaciones "
+                          f"({data['fetched_at']})")
+                # TypeError: snapshot con filas en lugar de columnas (formato anterior); se vuelve a descargar
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"⚠️ Snapshot MITECO ilegible, se mantiene el anterior: {e}")
+                cls._mtime = mtime
+            return cls._snapshot
+
+    @staticmethod
+    def edad_segundos(snapshot: dict) -> float:
+        return (datetime.now() - datetime.fromisoformat(snapshot["fetched_at"])).total_seconds()
+
+    @classmethod
+    def metadatos(cls, snapshot: dict) -> dict:
+        edad = cls.edad_segundos(snapshot)
+        return {
+            "fetched_at": snapshot["fetched_at"],
+            "age_seconds": int(edad),
+            "is_stale": edad > STALE_AFTER_SECONDS
+        }
+
+    @staticmethod
+    def _guardar(snapshot: dict) -> None:
+        """Escritura atómica: fichero temporal + rename en el mismo directorio"""
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = SNAPSHOT_PATH.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, SNAPSHOT_PATH)
+
+    @staticmethod
+    def _inicio_hora_actual() -> datetime:
+        """Inicio del periodo horario vigente (hora en punto + REFRESH_OFFSET_SECONDS)"""
+        ahora = datetime.now()
+        inicio = ahora.replace(minute=0, second=0, microsecond=0) + timedelta(seconds=REFRESH_OFFSET_SECONDS)
+        return inicio if inicio <= ahora else inicio - timedelta(hours=1)
+
+    @classmethod
+    def refresh(
+        cls,
+        fetch: Callable[[], Optional[dict]],
+        ingest: Optional[Callable[[dict], None]] = None
+    ) -> Optional[bool]:
+        """
+        Descarga un snapshot nuevo si el del disco es anterior al periodo horario
+        actual y lo pasa a `ingest` (histórico en BD). Bloqueante (ejecutar en un
+        hilo). Devuelve False si la descarga falló y None si otro worker tiene
+        el lock.
+        """
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        with open(LOCK_PATH, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Otro worker está descargando; se reintenta en breve por si no termina
+                return None
+
+            try:
+                actual = cls.recargar()
+                if actual is not None and datetime.fromisoformat(actual["fetched_at"]) >= cls._inicio_hora_actual():
+                    return True
+
+                inicio = time.perf_counter()
+                snapshot = fetch()
+                if not snapshot or not snapshot.get("datos") or not filas_columnas(snapshot["datos"]):
+                    print("⚠️ Descarga MITECO sin datos; se mantiene el snapshot anterior")
+                    return False
+
+                snapshot["fetched_at"] = datetime.now().isoformat(timespec="seconds")
+                cls._guardar(snapshot)
+                print(f"✅ Snapshot MITECO actualizado: {filas_columnas(snapshot['datos'])} estaciones "
+                      f"({time.perf_counter() - inicio:.1f}s)")
+                publicado = cls.recargar()
+
+                # Un fallo del histórico no invalida el snapshot ya publicado
+                if ingest is not None and publicado is not None:
+                    try:
+                        ingest(publicado)
+                    except Exception as e:
+                        print(f"⚠️ No se pudo guardar el histórico de calidad del aire: {e}")
+                return True
+            except Exception as e:
+                print(f"❌ Error refrescando snapshot MITECO: {e}")
+                return False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @classmethod
+    async def _run(
+        cls,
+        fetch: Callable[[], Optional[dict]],
+        ingest: Optional[Callable[[dict], None]],
+        warm: Optional[Callable[[Optional[dict]], None]]
+    ) -> None:
+        while True:
+            ok = await asyncio.to_thread(cls.refresh, fetch, ingest)
+            # Cálculos derivados del snapshot (superficie IDW...), también fuera del event loop
+            if warm is not None:
+                await asyncio.to_thread(warm, cls.get())
+            if ok is None:
+                espera = LOCK_RETRY_SECONDS
+            elif ok:
+                siguiente = cls._inicio_hora_actual() + timedelta(hours=1)
+                espera = max((siguiente - datetime.now()).total_seconds(), 1.0)
+            else:
+                espera = RETRY_SECONDS
+            await asyncio.sleep(espera)
+
+    @classmethod
+    async def _watch(cls) -> None:
+        """Recoge los snapshots que escriben otros workers (stat barato; la carga, en un hilo)"""
+        while True:
+            await asyncio.sleep(DISK_RECHECK_SECONDS)
+            try:
+                mtime = SNAPSHOT_PATH.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if mtime != cls._mtime:
+                await asyncio.to_thread(cls.recargar)
+
+    @classmethod
+    def start(
+        cls,
+        fetch: Optional[Callable[[], Optional[dict]]] = None,
+        ingest: Optional[Callable[[dict], None]] = None,
+        warm: Optional[Callable[[Optional[dict]], None]] = None
+    ) -> None:
+        """
+        Carga el snapshot del disco y lanza las tareas del worker (llamar en el
+        startup de la app); sin `fetch` solo se vigila el fichero
+        """
+        if cls._watcher is None or cls._watcher.done():
+            cls.recargar()
+            cls._watcher = asyncio.create_task(cls._watch())
+        if fetch is not None and (cls._task is None or cls._task.done()):
+            cls._task = asyncio.create_task(cls._run(fetch, ingest, warm))
+
+    @classmethod
+    async def stop(cls) -> None:
+        for task in (cls._task, cls._watcher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        cls._task = None
+        cls._watcher = None
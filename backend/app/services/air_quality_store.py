@@ -0,0 +1,378 @@
+# backend/app/services/air_quality_store.py
+from typing import Dict, List, Optional, Tuple
+import heapq
+import math
+import zlib
+
+import numpy as np
+
+from app.utils.geo_reference import PROVINCIAS, ccaa_de_provincia
+from app.utils.miteco_csv import CAMPOS_DATO
+
+# Mapeo de tipo MITECO a station_class
+TIPO_TO_CLASS = {
+    'FONDO': 1,        # Urbana de fondo
+    'TRAFICO': 4,      # Tráfico
+    'INDUSTRIAL': 2,   # Suburbana/Industrial
+    'RURAL': 3         # Rural
+}
+
+# Texto, color y recomendación por AQI (compartidos por todas las estaciones)
+NIVELES_CALIDAD = {
+    1: {"text": "Buena", "color": "#00e400", "recomendacion": "Calidad del aire satisfactoria."},
+    2: {"text": "Moderada", "color": "#feca57", "recomendacion": "Aceptable para la mayoría."},
+    3: {"text": "Mala", "color": "#ff7e00", "recomendacion": "Grupos sensibles deben reducir actividad exterior."},
+    4: {"text": "Muy Mala", "color": "#ff0000", "recomendacion": "Todos deben reducir actividad exterior."},
+    5: {"text": "Extremadamente Mala", "color": "#8f3f97", "recomendacion": "Evitar actividad exterior."},
+    0: {"text": "Sin datos", "color": "#cccccc", "recomendacion": "No hay datos disponibles."}
+}
+
+# Ventanas de /stations: última hora, últimas 24 horas y previsión
+VENTANAS = ('1h', '24h', 'forecast')
+
+# Celda de la rejilla del índice espacial (grados) y radio terrestre medio (km)
+CELDA_INDICE_GRADOS = 0.25
+RADIO_TIERRA_KM = 6371.0088
+
+SIN_DATOS_COLOR = '#cccccc'
+SIN_DATOS_RECOMENDACION = 'Estación sin datos en la última medición.'
+
+
+def obtener_calidad_texto(aqi: int) -> Dict:
+    """Devuelve información textual según AQI"""
+    return NIVELES_CALIDAD.get(aqi, NIVELES_CALIDAD[0])
+
+
+def station_id_estable(cod_estacion: str) -> int:
+    """
+    Id numérico de la estación: el propio código si es numérico y, si no,
+    un crc32 (a diferencia de hash(), igual en todos los workers y reinicios)
+    """
+    if cod_estacion.isdigit():
+        return int(cod_estacion)
+    return zlib.crc32(cod_estacion.encode('utf-8')) % 1000000
+
+
+def codigos_geo_estacion(cod_estacion: str) -> Dict:
+    """
+    Códigos INE de una estación a partir de su código MITECO (PPMMMEEE:
+    provincia, municipio y número de estación; sin el cero inicial en el CSV)
+    """
+    codigo = cod_estacion.strip().zfill(8) if cod_estacion else ''
+    if len(codigo) != 8 or not codigo.isdigit() or int(codigo[:2]) not in PROVINCIAS:
+        return {'codigo_ine': None, 'codigo_provincia': None, 'codigo_ccaa': None}
+    codigo_provincia = int(codigo[:2])
+    return {
+        'codigo_ine': codigo[:5],
+        'codigo_provincia': codigo_provincia,
+        'codigo_ccaa': ccaa_de_provincia(codigo_provincia)
+    }
+
+
+def _gravedad(tiene_indice: bool, indice_ica: Optional[int], fecha: Optional[str]) -> tuple:
+    tiene_datos = bool(tiene_indice and indice_ica is not None and indice_ica > 0)
+    return (tiene_datos, indice_ica if tiene_datos else 0, fecha or '')
+
+
+def peor_lectura_por_estacion(columnas: Dict[str, list]) -> Dict[str, list]:
+    """
+    Una fila por estación para los feeds con varias horas (24h, previsión):
+    la de mayor índice ICA y, a igualdad, la más reciente (entrada y salida
+    en formato columnar)
+    """
+    por_estacion = {}
+    gravedades = map(_gravedad, columnas['tiene_indice'], columnas['indice_ica'], columnas['fecha'])
+    for i, (cod, gravedad) in enumerate(zip(columnas['cod_estacion'], gravedades)):
+        actual = por_estacion.get(cod)
+        if actual is None or gravedad > actual[0]:
+            por_estacion[cod] = (gravedad, i)
+    indices = [i for _, i in por_estacion.values()]
+    return {campo: [columnas[campo][i] for i in indices] for campo in CAMPOS_DATO}
+
+
+class EstacionAire:
+    """
+    Estación MITECO con solo los campos que varían; las constantes ('Spain',
+    'MITECO ICA'...) y los textos por AQI se añaden al serializar.
+    """
+
+    __slots__ = (
+        'id', 'station_code', 'name', 'station_type', 'station_class', 'lat', 'lon',
+        'pollutant', 'ica_index', 'last_aqi', 'has_real_data', 'is_active', 'fecha',
+        'codigo_ine', 'codigo_provincia', 'codigo_ccaa', 'light'
+    )
+
+    def __init__(self, cod_estacion, nombre, tipo, lat, lon, activa, fecha, indice_ica, tiene_indice, debido_a, aqi):
+        # Argumentos en el orden de CAMPOS_DATO (una fila de las columnas del feed)
+        self.id = station_id_estable(cod_estacion)
+        self.station_code = cod_estacion
+        self.name = nombre
+        self.station_type = tipo
+        self.station_class = TIPO_TO_CLASS.get(tipo, 1)
+        self.lat = lat
+        self.lon = lon
+        self.pollutant = debido_a
+        self.is_active = activa
+        self.fecha = fecha
+
+        # Datos válidos: índice ICA publicado y positivo
+        self.has_real_data = bool(tiene_indice and indice_ica is not None and indice_ica > 0)
+        self.ica_index = indice_ica if self.has_real_data else None
+        self.last_aqi = aqi if self.has_real_data else 0
+
+        codigos = codigos_geo_estacion(cod_estacion)
+        self.codigo_ine = codigos['codigo_ine']
+        self.codigo_provincia = codigos['codigo_provincia']
+        self.codigo_ccaa = codigos['codigo_ccaa']
+
+        # Proyección light precalculada (se sirve tal cual en cada petición)
+        self.light = {
+            'id': self.id,
+            'name': self.name,
+            'lat': self.lat,
+            'lon': self.lon,
+            'last_aqi': self.last_aqi,
+            'quality_color': self.quality_color,
+            'pollutant': self.pollutant,
+            'station_code': self.station_code,
+            'is_active': self.is_active
+        }
+
+    @property
+    def last_measurement(self) -> Optional[float]:
+        # Concentración simulada basada en ICA
+        return self.ica_index * 10 if self.has_real_data else None
+
+    @property
+    def quality_color(self) -> str:
+        return obtener_calidad_texto(self.last_aqi)['color'] if self.has_real_data else SIN_DATOS_COLOR
+
+    def to_dict(self) -> Dict:
+        """Formato completo de estación (modo light=false y detalle)"""
+        estacion = {
+            'id': self.id,
+            'station_code': self.station_code,
+            'eoi_code': f"ES{self.station_code}",
+            'name': self.name,
+            'country_code': 'ES',
+            'country': 'Spain',
+            'station_class': self.station_class,
+            'station_type': self.station_type,
+            'lat': self.lat,
+            'lon': self.lon,
+            'available_pollutants': [self.pollutant] if self.pollutant else [],
+            'last_measurement': self.last_measurement,
+            'last_aqi': self.last_aqi,
+            'pollutant': self.pollutant
+        }
+        if self.has_real_data:
+            calidad = obtener_calidad_texto(self.last_aqi)
+            estacion.update({
+                'unit': 'ICA',
+                'quality_text': calidad['text'],
+                'quality_color': calidad['color'],
+                'recommendation': calidad['recomendacion']
+            })
+        else:
+            estacion.update({
+                'unit': None,
+                'quality_text': 'Sin datos',
+                'quality_color': SIN_DATOS_COLOR,
+                'recommendation': SIN_DATOS_RECOMENDACION
+            })
+        estacion.update({
+            'last_updated': self.fecha,
+            'is_mock': False,
+            'has_real_data': self.has_real_data,
+            'is_active': self.is_active,
+            'data_source': 'MITECO ICA',
+            'measurement_timestamp': self.fecha
+        })
+        if self.has_real_data:
+            estacion['ica_index'] = self.ica_index
+            estacion['ica_contaminant'] = self.pollutant
+        estacion.update({
+            'codigo_ine': self.codigo_ine,
+            'codigo_provincia': self.codigo_provincia,
+            'codigo_ccaa': self.codigo_ccaa
+        })
+        return estacion
+
+
+def distancia_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia haversine en km"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class IndiceEspacial:
+    """
+    Rejilla regular (CELDA_INDICE_GRADOS) sobre las coordenadas de las
+    estaciones. La búsqueda de los k más cercanos recorre anillos de celdas
+    alrededor del punto y para en cuanto ninguna celda sin visitar puede
+    contener una estación más cercana que la k-ésima encontrada.
+
+    Las estaciones se comparan por el término interno de la haversine
+    (monótono con la distancia), con latitud/longitud en radianes y coseno
+    precalculados; la distancia en km solo se calcula para el resultado.
+    Lejos de cualquier estación (mar abierto) los anillos acabarían
+    recorriendo más celdas que estaciones hay: entonces se calculan todas
+    las distancias de una vez con NumPy.
+    """
+
+    __slots__ = ('celdas', 'estaciones', 'coords', 'i_min', 'i_max', 'j_min', 'j_max')
+
+    def __init__(self, estaciones: List['EstacionAire']):
+        self.estaciones = estaciones
+        self.celdas = {}
+        for e in estaciones:
+            fi, la = math.radians(e.lat), math.radians(e.lon)
+            self.celdas.setdefault(self._celda(e.lat, e.lon), []).append((fi, la, math.cos(fi), e))
+        fis = np.radians([e.lat for e in estaciones])
+        self.coords = (fis, np.radians([e.lon for e in estaciones]), np.cos(fis))
+        indices = list(self.celdas) or [(0, 0)]
+        self.i_min = min(i for i, _ in indices)
+        self.i_max = max(i for i, _ in indices)
+        self.j_min = min(j for _, j in indices)
+        self.j_max = max(j for _, j in indices)
+
+    @staticmethod
+    def _celda(lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / CELDA_INDICE_GRADOS), math.floor(lon / CELDA_INDICE_GRADOS))
+
+    def _anillo(self, ci: int, cj: int, r: int):
+        """Celdas ocupadas a distancia de Chebyshev exactamente r de (ci, cj)"""
+        celdas = self.celdas
+        if r == 0:
+            celda = celdas.get((ci, cj))
+            if celda:
+                yield celda
+            return
+        for i in range(max(ci - r, self.i_min), min(ci + r, self.i_max) + 1):
+            if i == ci - r or i == ci + r:
+                columnas = range(max(cj - r, self.j_min), min(cj + r, self.j_max) + 1)
+            else:
+                columnas = (cj - r, cj + r)
+            for j in columnas:
+                celda = celdas.get((i, j))
+                if celda:
+                    yield celda
+
+    def cercanas(
+        self,
+        lat: float,
+        lon: float,
+        k: int,
+        max_km: Optional[float] = None
+    ) -> List[Tuple[float, 'EstacionAire']]:
+        """Las k estaciones más cercanas como [(distancia_km, estacion)], de menor a mayor distancia"""
+        if not self.estaciones:
+            return []
+        fi0, la0 = math.radians(lat), math.radians(lon)
+        cos0 = math.cos(fi0)
+        sin, radians = math.sin, math.radians
+        a_max = sin(min(max_km / RADIO_TIERRA_KM, math.pi) / 2) ** 2 if max_km is not None else 1.0
+
+        ci, cj = self._celda(lat, lon)
+        r_max = max(abs(ci - self.i_min), abs(ci - self.i_max), abs(cj - self.j_min), abs(cj - self.j_max))
+        # Distancia (grados) del punto a los bordes de su celda
+        borde_lat = min(lat - ci * CELDA_INDICE_GRADOS, (ci + 1) * CELDA_INDICE_GRADOS - lat)
+        borde_lon = min(lon - cj * CELDA_INDICE_GRADOS, (cj + 1) * CELDA_INDICE_GRADOS - lon)
+
+        # Montículo de máximos (término haversine negado) con las k mejores hasta ahora
+        mejores = []
+        for r in range(r_max + 1):
+            # Los anillos ya cubren más celdas que una cuarta parte de las estaciones: cálculo directo
+            if (2 * r + 1) ** 2 > len(self.estaciones) // 4:
+                return self._cercanas_todas(fi0, la0, cos0, k, a_max)
+            for celda in self._anillo(ci, cj, r):
+                for fi, la, cos_fi, e in celda:
+                    a = sin((fi - fi0) / 2) ** 2 + cos0 * cos_fi * sin((la - la0) / 2) ** 2
+                    if a > a_max:
+                        continue
+                    if len(mejores) < k:
+                        heapq.heappush(mejores, (-a, e.id, e))
+                    elif a < -mejores[0][0]:
+                        heapq.heapreplace(mejores, (-a, e.id, e))
+
+            # Cota inferior de la distancia (ángulo central) a cualquier celda fuera del anillo r
+            lat_lejana = min(abs(lat) + (r + 1) * CELDA_INDICE_GRADOS, 89.0)
+            angulo = min(
+                radians(borde_lat + r * CELDA_INDICE_GRADOS),
+                radians(borde_lon + r * CELDA_INDICE_GRADOS) * math.cos(radians(lat_lejana))
+            )
+            a_cota = sin(min(angulo, math.pi) / 2) ** 2
+            if a_cota > a_max:
+                break
+            if len(mejores) == k and -mejores[0][0] <= a_cota:
+                break
+
+        return [
+            (2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(-a))), e)
+            for a, _, e in sorted(mejores, reverse=True)
+        ]
+
+    def _cercanas_todas(self, fi0: float, la0: float, cos0: float, k: int, a_max: float):
+        fis, las, coses = self.coords
+        a = np.sin((fis - fi0) / 2) ** 2 + cos0 * coses * np.sin((las - la0) / 2) ** 2
+        candidatas = np.flatnonzero(a <= a_max)
+        if len(candidatas) > k:
+            candidatas = candidatas[np.argpartition(a[candidatas], k - 1)[:k]]
+        orden = sorted(candidatas.tolist(), key=lambda i: (a[i], self.estaciones[i].id))
+        return [
+            (2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a[i]))), self.estaciones[i])
+            for i in orden
+        ]
+
+
+class StationStore:
+    """
+    Estaciones de un snapshot MITECO, construidas una vez por refresco y
+    compartidas por todas las peticiones del worker: registros con __slots__,
+    índice por id estable y proyecciones light precalculadas.
+    """
+
+    __slots__ = ('estaciones', 'con_datos', 'por_id', 'indice')
+
+    def __init__(self, columnas: Dict[str, list]):
+        estaciones = []
+        for fila in zip(*(columnas[campo] for campo in CAMPOS_DATO)):
+            try:
+                estaciones.append(EstacionAire(*fila))
+            except Exception as e:
+                print(f"⚠️ Error procesando estación {fila[0] or 'N/A'}: {e}")
+
+        self.estaciones = estaciones
+        self.con_datos = [e for e in estaciones if e.has_real_data]
+        self.por_id = {e.id: e for e in estaciones}
+        # Índice espacial de las estaciones activas con datos (/nearest)
+        self.indice = IndiceEspacial([e for e in self.con_datos if e.is_active])
+
+        activas_con_datos = sum(1 for e in self.con_datos if e.is_active)
+        activas = sum(1 for e in estaciones if e.is_active)
+        print(f"📊 Estaciones procesadas: {len(estaciones)} (activas con datos: {activas_con_datos}, "
+              f"activas sin datos: {activas - activas_con_datos}, "
+              f"inactivas con datos: {len(self.con_datos) - activas_con_datos}, "
+              f"inactivas sin datos: {len(estaciones) - activas - len(self.con_datos) + activas_con_datos})")
+
+    def get(self, station_id: int) -> Optional[EstacionAire]:
+        return self.por_id.get(station_id)
+
+    def filtrar(
+        self,
+        solo_con_datos: bool = False,
+        codigo_ccaa: Optional[int] = None,
+        codigo_provincia: Optional[int] = None,
+        contaminante: Optional[str] = None
+    ) -> List[EstacionAire]:
+        estaciones = self.con_datos if solo_con_datos else self.estaciones
+        if contaminante:
+            # Contaminante dominante de la lectura (debido_a), como en /readings
+            estaciones = [e for e in estaciones if e.pollutant == contaminante]
+        if codigo_ccaa is not None:
+            estaciones = [e for e in estaciones if e.codigo_ccaa == codigo_ccaa]
+        if codigo_provincia is not None:
+            estaciones = [e for e in estaciones if e.codigo_provincia == codigo_provincia]
+        return estaciones
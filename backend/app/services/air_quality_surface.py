@@ -0,0 +1,239 @@
+# backend/app/services/air_quality_surface.py
+from typing import Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from app.services.air_quality_store import obtener_calidad_texto
+from app.utils.miteco_csv import ICA_TO_AQI
+
+# Península y Baleares (lon_min, lat_min, lon_max, lat_max); Canarias se pide con su propio bbox
+BBOX_DEFECTO = (-9.5, 35.8, 4.5, 44.0)
+RESOLUCION_DEFECTO = 0.1  # grados
+# Resoluciones admitidas (divisores de 180°: el bbox se ajusta a su rejilla y la caché acierta)
+RESOLUCIONES = (0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Exponente de la ponderación 1/d^p y radio máximo de influencia de una estación
+IDW_POTENCIA = float(os.getenv("AIR_QUALITY_IDW_POWER", "2"))
+IDW_RADIO_KM = float(os.getenv("AIR_QUALITY_IDW_RADIUS_KM", "60"))
+
+MAX_CELDAS = 250000
+# Tamaño máximo (celdas x estaciones) de cada bloque de la matriz de distancias
+CHUNK_ELEMENTOS = 1000000
+# Superficies distintas (bbox/resolución) guardadas por snapshot
+MAX_SUPERFICIES = 8
+# Cálculos de superficie simultáneos por worker (el resto espera sin ocupar hilos)
+MAX_CALCULOS_SIMULTANEOS = int(os.getenv("AIR_QUALITY_SURFACE_MAX_BUILDS", "2"))
+
+KM_POR_GRADO_LAT = 110.57
+KM_POR_GRADO_LON_ECUADOR = 111.32
+
+# Color RGBA por nivel ICA (1-6), con los mismos colores que las estaciones
+_PALETA = np.zeros((7, 4), dtype=np.uint8)
+for _ica in range(1, 7):
+    _color = obtener_calidad_texto(ICA_TO_AQI[_ica])["color"]
+    _PALETA[_ica] = [int(_color[i:i + 2], 16) for i in (1, 3, 5)] + [160]
+
+
+def _png_rgba(rgba: np.ndarray) -> bytes:
+    """Codifica una imagen RGBA (alto x ancho x 4, uint8) como PNG sin dependencias"""
+    alto, ancho, _ = rgba.shape
+    # Cada fila va precedida del byte de filtro (0 = sin filtro)
+    filas = np.concatenate([np.zeros((alto, 1), dtype=np.uint8), rgba.reshape(alto, ancho * 4)], axis=1)
+
+    def chunk(tipo: bytes, datos: bytes) -> bytes:
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 6, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(filas.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class AirQualitySurface:
+    """
+    Superficie interpolada (IDW) del índice ICA a partir de las estaciones
+    con datos del snapshot MITECO vigente.
+
+    Se calcula con NumPy por bloques de filas (sin bucles por celda), fuera
+    del event loop, y se guarda por worker ya serializada (JSON y PNG). La
+    superficie por defecto se precalcula tras cada refresco horario; las de
+    otros bbox/resoluciones se calculan en la primera petición (una sola
+    vez por clave aunque lleguen varias a la vez) y se descartan al cambiar
+    el snapshot.
+    """
+
+    _cache = {}
+    _lock = threading.Lock()
+    _locks_clave = {}
+    _calculos = asyncio.Semaphore(MAX_CALCULOS_SIMULTANEOS)
+
+    @staticmethod
+    def ajustar_bbox(
+        bbox: Tuple[float, float, float, float],
+        resolucion: float
+    ) -> Tuple[float, float, float, float]:
+        """Amplía el bbox hasta la rejilla de la resolución (bbox parecidos comparten superficie)"""
+        def ajustar(valor: float, redondeo) -> float:
+            # round() previo: -9.5 / 0.1 da -95.00000000000001 y floor() saltaría una celda
+            return round(redondeo(round(valor / resolucion, 6)) * resolucion, 6)
+
+        lon_min, lat_min, lon_max, lat_max = bbox
+        return (ajustar(lon_min, math.floor), ajustar(lat_min, math.floor),
+                ajustar(lon_max, math.ceil), ajustar(lat_max, math.ceil))
+
+    @staticmethod
+    def interpolar(
+        lats: np.ndarray,
+        lons: np.ndarray,
+        valores: np.ndarray,
+        bbox: Tuple[float, float, float, float],
+        resolucion: float
+    ) -> Tuple[np.ndarray, int]:
+        """
+        Rejilla (alto x ancho) con el valor IDW en el centro de cada celda, de
+        norte a sur y de oeste a este (NaN donde no hay estaciones a menos de
+        IDW_RADIO_KM), y número de estaciones que entran en el cálculo
+        """
+        lon_min, lat_min, lon_max, lat_max = bbox
+        ancho = int(np.ceil(round((lon_max - lon_min) / resolucion, 6)))
+        alto = int(np.ceil(round((lat_max - lat_min) / resolucion, 6)))
+        lons_celda = lon_min + (np.arange(ancho) + 0.5) * resolucion
+        lats_celda = lat_max - (np.arange(alto) + 0.5) * resolucion
+        rejilla = np.full((alto, ancho), np.nan, dtype=np.float32)
+
+        # Solo influyen las estaciones a menos del radio del bbox
+        margen_lat = IDW_RADIO_KM / KM_POR_GRADO_LAT
+        margen_lon = IDW_RADIO_KM / (KM_POR_GRADO_LON_ECUADOR * np.cos(np.radians(max(abs(lat_min), abs(lat_max)))))
+        cerca = (
+            (lats >= lat_min - margen_lat) & (lats <= lat_max + margen_lat)
+            & (lons >= lon_min - margen_lon) & (lons <= lon_max + margen_lon)
+        )
+        lats, lons, valores = lats[cerca], lons[cerca], valores[cerca]
+        if not len(valores):
+            return rejilla, 0
+
+        filas_por_bloque = max(1, CHUNK_ELEMENTOS // (ancho * len(valores)))
+        for inicio in range(0, alto, filas_por_bloque):
+            lat_bloque = lats_celda[inicio:inicio + filas_por_bloque]
+            # Distancia equirectangular en km (celdas x estaciones), suficiente a esta escala
+            dy = (lat_bloque[:, None, None] - lats[None, None, :]) * KM_POR_GRADO_LAT
+            dx = ((lons_celda[None, :, None] - lons[None, None, :])
+                  * (KM_POR_GRADO_LON_ECUADOR * np.cos(np.radians(lat_bloque)))[:, None, None])
+            distancia = np.maximum(np.hypot(dx, dy), 0.1)
+
+            pesos = np.where(distancia <= IDW_RADIO_KM, distancia ** -IDW_POTENCIA, 0.0)
+            suma_pesos = pesos.sum(axis=2)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                rejilla[inicio:inicio + len(lat_bloque)] = np.where(
+                    suma_pesos > 0, (pesos @ valores) / suma_pesos, np.nan
+                )
+        return rejilla, len(valores)
+
+    @classmethod
+    def _build(cls, snapshot: dict, bbox: Tuple[float, float, float, float], resolucion: float) -> dict:
+        inicio = time.perf_counter()
+        estaciones = snapshot["store"].con_datos
+        lats = np.fromiter((e.lat for e in estaciones), dtype=np.float64, count=len(estaciones))
+        lons = np.fromiter((e.lon for e in estaciones), dtype=np.float64, count=len(estaciones))
+        valores = np.fromiter((e.ica_index for e in estaciones), dtype=np.float64, count=len(estaciones))
+
+        rejilla, usadas = cls.interpolar(lats, lons, valores, bbox, resolucion)
+        alto, ancho = rejilla.shape
+
+        # PNG: color del nivel ICA redondeado; transparente sin cobertura
+        niveles = np.nan_to_num(np.clip(np.rint(rejilla), 1, 6), nan=0).astype(np.uint8)
+        png = _png_rgba(_PALETA[niveles])
+
+        redondeada = np.round(rejilla, 2)
+        body = json.dumps(
+            {
+                "success": True,
+                "bbox": list(bbox),
+                "resolution": resolucion,
+                "width": ancho,
+                "height": alto,
+                "order": "row-major, norte a sur y oeste a este (centros de celda)",
+                "power": IDW_POTENCIA,
+                "radius_km": IDW_RADIO_KM,
+                "stations_used": usadas,
+                "fetched_at": snapshot["fetched_at"],
+                "values": [None if np.isnan(v) else float(v) for v in redondeada.ravel()]
+            },
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        print(f"🗺️ Superficie ICA {ancho}x{alto} ({resolucion}°): {usadas} estaciones, "
+              f"{len(body) // 1024} KB json / {len(png) // 1024} KB png "
+              f"({time.perf_counter() - inicio:.2f}s)")
+        return {"fetched_at": snapshot["fetched_at"], "json": body, "png": png}
+
+    @classmethod
+    def get(
+        cls,
+        snapshot: dict,
+        bbox: Tuple[float, float, float, float] = BBOX_DEFECTO,
+        resolucion: float = RESOLUCION_DEFECTO
+    ) -> dict:
+        """Superficie del snapshot para ese bbox/resolución (bloqueante: llamar desde un hilo)"""
+        clave = (snapshot["fetched_at"], bbox, resolucion)
+        superficie = cls._cache.get(clave)
+        if superficie is not None:
+            return superficie
+
+        # Un lock por clave: claves distintas se calculan en paralelo y la misma, una sola vez
+        with cls._lock:
+            lock_clave = cls._locks_clave.setdefault(clave, threading.Lock())
+        try:
+            with lock_clave:
+                superficie = cls._cache.get(clave)
+                if superficie is None:
+                    superficie = cls._build(snapshot, bbox, resolucion)
+                    with cls._lock:
+                        # Se descartan las superficies de snapshots anteriores y, si hay demasiadas, la más antigua
+                        vigentes = {k: v for k, v in cls._cache.items() if k[0] == snapshot["fetched_at"]}
+                        while len(vigentes) >= MAX_SUPERFICIES:
+                            vigentes.pop(next(iter(vigentes)))
+                        vigentes[clave] = superficie
+                        cls._cache = vigentes
+                return superficie
+        finally:
+            with cls._lock:
+                if cls._locks_clave.get(clave) is lock_clave:
+                    del cls._locks_clave[clave]
+
+    @classmethod
+    async def obtener(
+        cls,
+        snapshot: dict,
+        bbox: Tuple[float, float, float, float],
+        resolucion: float
+    ) -> dict:
+        """
+        Versión para el event loop: los aciertos de caché no salen del loop y
+        los cálculos van a un hilo, como mucho MAX_CALCULOS_SIMULTANEOS a la vez
+        """
+        superficie = cls._cache.get((snapshot["fetched_at"], bbox, resolucion))
+        if superficie is not None:
+            return superficie
+        async with cls._calculos:
+            return await asyncio.to_thread(cls.get, snapshot, bbox, resolucion)
+
+    @classmethod
+    def warm(cls, snapshot: Optional[dict]) -> None:
+        """Precalcula la superficie por defecto tras un refresco; los errores no se propagan"""
+        if not snapshot:
+            return
+        try:
+            cls.get(snapshot)
+        except Exception as e:
+            print(f"⚠️ No se pudo precalcular la superficie de calidad del aire: {e}")
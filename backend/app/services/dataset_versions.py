@@ -0,0 +1,50 @@
+# backend/app/services/dataset_versions.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+import os
+import threading
+import time
+
+# Cada cuántos segundos se vuelve a consultar la versión en Postgres
+VERSION_RECHECK_SECONDS = float(os.getenv("DATASET_VERSION_RECHECK_SECONDS", "5"))
+
+
+class DatasetVersionService:
+    """Versión de datos por dataset (tabla dataset_versions), con caché por proceso"""
+    
+    _versions = {}
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get_version(cls, db: Session, dataset: str) -> int:
+        """
+        Devuelve la versión actual del dataset.
+        
+        La consulta a Postgres (lookup por PK) solo se repite cada
+        VERSION_RECHECK_SECONDS; entre medias se sirve el valor en memoria.
+        """
+        now = time.monotonic()
+        cached = cls._versions.get(dataset)
+        if cached and now - cached[1] < VERSION_RECHECK_SECONDS:
+            return cached[0]
+        
+        try:
+            version = db.execute(
+                text("SELECT version FROM dataset_versions WHERE dataset = :dataset"),
+                {"dataset": dataset}
+            ).scalar()
+        except Exception as e:
+            print(f"⚠️ Error leyendo versión de {dataset}: {e}")
+            db.rollback()
+            # Sin tabla de versiones: conservar la última conocida
+            return cached[0] if cached else 0
+        
+        version = int(version) if version is not None else 0
+        with cls._lock:
+            cls._versions[dataset] = (version, now)
+        return version
+    
+    @staticmethod
+    def bump(db: Session, dataset: str) -> None:
+        """Incrementa la versión del dataset (llamar tras una ingesta, dentro de su transacción)"""
+        db.execute(text("SELECT bump_dataset_version(:dataset)"), {"dataset": dataset})
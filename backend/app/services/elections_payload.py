@@ -0,0 +1,117 @@
+# backend/app/services/elections_payload.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from typing import Optional
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from app.services.dataset_versions import DatasetVersionService
+
+DATASET = "elections"
+
+# Proyección light completa (todos los municipios), mismo formato que /elections/data?light=true
+MAP_QUERY = """
+    SELECT
+        m.codigo_ine,
+        m.nombre_municipio,
+        m.nombre_provincia,
+        m.lat,
+        m.lon,
+        e.partido_ganador,
+        e.participacion,
+        m.poblacion
+    FROM municipios_espana m
+    JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
+    ORDER BY m.nombre_municipio
+"""
+
+
+class ElectionsMapPayload:
+    """
+    Payload del mapa de elecciones precalculado por worker.
+
+    Se construye una vez (al arrancar o tras una ingesta) y se guarda ya
+    serializado en JSON y comprimido en gzip, con un ETag fuerte por
+    representación (el de gzip con sufijo -gz). Se
+    reconstruye cuando cambia la versión del dataset 'elections'.
+    """
+
+    _payload = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _build(db: Session, version: int) -> dict:
+        inicio = time.perf_counter()
+        rows = db.execute(text(MAP_QUERY)).fetchall()
+
+        data = [
+            {
+                "codigo_ine": row[0],
+                "nombre_municipio": row[1],
+                "nombre_provincia": row[2],
+                "lat": float(row[3]) if row[3] else None,
+                "lon": float(row[4]) if row[4] else None,
+                "partido_ganador": row[5],
+                "participacion": float(row[6]) if row[6] else None,
+                "poblacion": row[7]
+            }
+            for row in rows
+        ]
+
+        body = json.dumps(
+            {
+                "success": True,
+                "count": len(data),
+                "total": len(data),
+                "light_mode": True,
+                "format": "json",
+                "version": version,
+                "data": data
+            },
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        payload = {
+            "version": version,
+            "etag": '"' + etag + '"',
+            # Otra representación (otros bytes): ETag fuerte distinto
+            "etag_gzip": '"' + etag + '-gz"',
+            "json": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+            "count": len(data)
+        }
+        print(f"🗳️ Payload mapa elecciones v{version}: {len(data)} municipios, "
+              f"{len(body) // 1024} KB json / {len(payload['gzip']) // 1024} KB gzip "
+              f"({time.perf_counter() - inicio:.2f}s)")
+        return payload
+
+    @classmethod
+    def get(cls, db: Session) -> dict:
+        """Devuelve el payload vigente, reconstruyéndolo si la versión ha cambiado"""
+        version = DatasetVersionService.get_version(db, DATASET)
+        payload = cls._payload
+        if payload is not None and payload["version"] == version:
+            return payload
+
+        with cls._lock:
+            # Otro hilo puede haberlo reconstruido mientras esperábamos
+            payload = cls._payload
+            if payload is None or payload["version"] != version:
+                payload = cls._build(db, version)
+                cls._payload = payload
+            return payload
+
+    @classmethod
+    def warm(cls, db: Session) -> Optional[dict]:
+        """Precalcula el payload (arranque); los errores no impiden arrancar"""
+        try:
+            return cls.get(db)
+        except Exception as e:
+            print(f"⚠️ No se pudo precalcular el payload de elecciones: {e}")
+            db.rollback()
+            return None
@@ -1,97 +1,360 @@
 # backend/app/services/housing_cache.py
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import text
 from datetime import datetime, timedelta
-from app.models.housing import HousingINECache, HousingINESnapshot
+from typing import Optional, Tuple
+from app.database import engine
+from app.models.housing import HousingINECache
+from contextlib import contextmanager
+import hashlib
+import io
+import os
+import threading
+import time
 import pandas as pd
 
 CACHE_TTL_HOURS = 24  # Tiempo de vida del caché en horas
 
+# Cada cuántos segundos vuelve cada worker a leer housing_ine_cache_meta
+CACHE_RECHECK_SECONDS = float(os.getenv("HOUSING_CACHE_RECHECK_SECONDS", "5"))
+
+# Clave del advisory lock de Postgres que serializa el refresco entre workers
+REFRESH_LOCK_KEY = 25171  # id de la tabla del IPV en el INE
+
+# Meses de historial que se conservan (la versión vigente no se borra nunca)
+SNAPSHOT_RETENTION_MONTHS = int(os.getenv("HOUSING_SNAPSHOT_RETENTION_MONTHS", "24"))
+
+# Columnas de datos del caché, en el orden del COPY
+COLUMNAS_CACHE = [
+    'periodo', 'anio', 'trimestre', 'ccaa_codigo', 'ccaa_nombre',
+    'tipo_vivienda', 'metrica', 'valor'
+]
+CLAVE_CACHE = ['periodo', 'ccaa_codigo', 'tipo_vivienda', 'metrica']
+
+_COLUMNAS = ', '.join(COLUMNAS_CACHE)
+_CLAVE = ', '.join(CLAVE_CACHE)
+
+# Staging con la estructura del caché; desaparece al terminar la transacción
+STAGING_DDL = f"""
+    CREATE TEMP TABLE housing_ine_staging ON COMMIT DROP AS
+    SELECT {_COLUMNAS} FROM housing_ine_cache WITH NO DATA
+"""
+
+# Versión base: contenido completo
+SNAPSHOT_BASE_SQL = f"""
+    INSERT INTO housing_ine_snapshots (version_id, {_COLUMNAS}, deleted, snapshot_date)
+    SELECT :version_id, {_COLUMNAS}, FALSE, :fecha
+    FROM housing_ine_staging
+"""
+
+# Versión incremental: filas nuevas o cambiadas respecto al caché vigente
+# (= estado de la versión anterior) y lápidas de las que desaparecen
+SNAPSHOT_CAMBIOS_SQL = f"""
+    INSERT INTO housing_ine_snapshots (version_id, {_COLUMNAS}, deleted, snapshot_date)
+    SELECT :version_id, {', '.join('s.' + c for c in COLUMNAS_CACHE)}, FALSE, :fecha
+    FROM housing_ine_staging s
+    LEFT JOIN housing_ine_cache c
+        ON c.periodo = s.periodo AND c.ccaa_codigo = s.ccaa_codigo
+       AND c.tipo_vivienda = s.tipo_vivienda AND c.metrica = s.metrica
+    WHERE c.id IS NULL
+       OR (c.anio, c.trimestre, c.ccaa_nombre, c.valor)
+          IS DISTINCT FROM (s.anio, s.trimestre, s.ccaa_nombre, s.valor)
+    UNION ALL
+    SELECT :version_id, {', '.join('c.' + c for c in COLUMNAS_CACHE)}, TRUE, :fecha
+    FROM housing_ine_cache c
+    WHERE NOT EXISTS (
+        SELECT 1 FROM housing_ine_staging s
+        WHERE s.periodo = c.periodo AND s.ccaa_codigo = c.ccaa_codigo
+          AND s.tipo_vivienda = c.tipo_vivienda AND s.metrica = c.metrica
+    )
+"""
+
+# cached_at en UTC sin zona, como datetime.utcnow() en el modelo
+REPLACE_SQL = f"""
+    INSERT INTO housing_ine_cache ({_COLUMNAS}, cached_at)
+    SELECT {_COLUMNAS}, :fecha
+    FROM housing_ine_staging
+"""
+
+# Metadatos del caché (fila única), en la misma transacción que el refresco
+META_UPSERT_SQL = """
+    INSERT INTO housing_ine_cache_meta (id, version, refreshed_at, row_count, content_hash)
+    VALUES (1, :version, :refreshed_at, :row_count, :content_hash)
+    ON CONFLICT (id) DO UPDATE SET
+        version = EXCLUDED.version,
+        refreshed_at = EXCLUDED.refreshed_at,
+        row_count = EXCLUDED.row_count,
+        content_hash = EXCLUDED.content_hash
+"""
+
+# Versión vigente en una fecha y versión base de la que parte su estado
+VERSION_EN_FECHA_SQL = """
+    SELECT v.version_id, v.snapshot_date, b.version_id AS base_id, b.snapshot_date AS base_date
+    FROM (
+        SELECT version_id, snapshot_date FROM housing_ine_snapshot_versions
+        WHERE snapshot_date <= :fecha
+        ORDER BY version_id DESC LIMIT 1
+    ) v
+    CROSS JOIN LATERAL (
+        SELECT version_id, snapshot_date FROM housing_ine_snapshot_versions
+        WHERE is_base AND version_id <= v.version_id
+        ORDER BY version_id DESC LIMIT 1
+    ) b
+"""
+
+# Materializa el estado completo de una versión para convertirla en base
+# (solo las claves cuya última fila es de una versión anterior)
+COMPACTAR_SQL = f"""
+    INSERT INTO housing_ine_snapshots (version_id, {_COLUMNAS}, deleted, snapshot_date)
+    SELECT :version_id, {_COLUMNAS}, FALSE, :fecha
+    FROM (
+        SELECT DISTINCT ON ({_CLAVE}) {_COLUMNAS}, deleted, version_id
+        FROM housing_ine_snapshots
+        WHERE version_id BETWEEN :base_id AND :version_id
+          AND snapshot_date BETWEEN :base_date AND :fecha
+        ORDER BY {_CLAVE}, version_id DESC
+    ) estado
+    WHERE NOT deleted AND version_id < :version_id
+"""
+
+
 class HousingCacheService:
     """Servicio para gestionar el caché de datos del INE con snapshots históricos"""
     
-    @staticmethod
-    def is_cache_valid(db: Session) -> bool:
-        """Comprueba si el caché tiene datos frescos (menos de 24h)"""
+    # Token de frescura por worker: (metadatos del caché, instante monotónico de la lectura)
+    _frescura = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def cache_metadata(cls, db: Session, forzar: bool = False) -> Optional[dict]:
+        """
+        Metadatos del caché actual (version, refreshed_at, row_count,
+        content_hash) o None si no hay caché.
+        
+        La fila de housing_ine_cache_meta (lookup por PK) solo se vuelve a
+        leer cada CACHE_RECHECK_SECONDS; entre medias se sirve el token en
+        memoria (forzar=True relee siempre). Sin caché no se guarda token: se
+        consulta en cada petición hasta que algún worker lo rellene.
+        """
+        now = time.monotonic()
+        token = cls._frescura
+        if token and not forzar and now - token[1] < CACHE_RECHECK_SECONDS:
+            return token[0]
+        
         try:
-            latest = db.query(HousingINECache).order_by(
-                HousingINECache.cached_at.desc()
-            ).first()
-            
-            if not latest:
-                return False
-            
-            age = datetime.utcnow() - latest.cached_at
-            is_valid = age < timedelta(hours=CACHE_TTL_HOURS)
-            
-            if is_valid:
-                count = db.query(HousingINECache).count()
-                print(f"✅ Caché válido: {count} registros (actualizado hace {age.total_seconds()/3600:.1f}h)")
-            else:
-                print(f"⏳ Caché expirado (última actualización hace {age.total_seconds()/3600:.1f}h)")
-            
-            return is_valid
+            meta = db.execute(text("""
+                SELECT version, refreshed_at, row_count, content_hash
+                FROM housing_ine_cache_meta WHERE id = 1
+            """)).mappings().first()
         except Exception as e:
-            print(f"⚠️ Error verificando caché: {e}")
+            print(f"⚠️ Error leyendo metadatos del caché de vivienda: {e}")
+            db.rollback()
+            return None
+        
+        meta = dict(meta) if meta else None
+        with cls._lock:
+            cls._frescura = (meta, now) if meta else None
+        return meta
+    
+    @classmethod
+    def _recordar_frescura(cls, meta: Optional[dict]) -> None:
+        """Actualiza el token de este worker tras escribir el caché (los demás lo ven al releer)"""
+        with cls._lock:
+            cls._frescura = (meta, time.monotonic()) if meta else None
+    
+    @classmethod
+    def is_cache_valid(cls, db: Session, forzar: bool = False) -> bool:
+        """Comprueba si el caché tiene datos frescos (menos de 24h)"""
+        meta = cls.cache_metadata(db, forzar)
+        if not meta or not meta["row_count"]:
             return False
+        return datetime.utcnow() - meta["refreshed_at"] < timedelta(hours=CACHE_TTL_HOURS)
+    
+    @staticmethod
+    @contextmanager
+    def refresh_lock():
+        """
+        Advisory lock de sesión (no bloqueante) para refrescar el caché desde
+        un solo worker. Devuelve True si se ha obtenido; se libera al salir.
+        
+        Usa una conexión propia en autocommit: la sesión de la petición hace
+        commits durante el refresco y devolvería su conexión al pool con el
+        lock todavía tomado.
+        """
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        adquirido = False
+        try:
+            adquirido = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": REFRESH_LOCK_KEY}
+            ).scalar()
+            yield adquirido
+        finally:
+            try:
+                if adquirido:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REFRESH_LOCK_KEY})
+            finally:
+                conn.close()
+    
+    @staticmethod
+    def content_hash(filas: pd.DataFrame) -> str:
+        """SHA-256 del contenido canónico (filas ordenadas por clave, en CSV)"""
+        return hashlib.sha256(filas.to_csv(index=False, header=False).encode("utf-8")).hexdigest()
     
     @staticmethod
     def save_to_cache(db: Session, df: pd.DataFrame) -> int:
-        """Guarda datos en el caché y crea snapshot histórico"""
+        """
+        Reemplaza el caché por los datos del INE y versiona el historial
+        
+        Todo en una transacción: COPY a una tabla staging temporal, versión
+        del historial con un INSERT ... SELECT y DELETE + INSERT ... SELECT
+        desde staging. Por MVCC los lectores ven el caché anterior completo
+        hasta el COMMIT y el nuevo después, nunca uno vacío o a medias. (Un
+        swap con ALTER TABLE ... RENAME pediría un lock ACCESS EXCLUSIVE que
+        también bloquea a los lectores, y cambiaría los nombres de índices y
+        secuencia de la tabla del modelo.)
+        
+        Si el hash del contenido coincide con el de la última versión no se
+        crea versión ni se reescribe el caché: solo se renueva cached_at.
+        """
+        inicio = time.perf_counter()
+        ahora = datetime.utcnow()
+        
+        # Normalización vectorizada (los NaN de valor se escriben vacíos: NULL en el COPY)
+        filas = pd.DataFrame({
+            'periodo': df['periodo'],
+            'anio': df['anio'].astype(int),
+            'trimestre': df['trimestre'].astype(int),
+            'ccaa_codigo': df['ccaa_codigo'].fillna('00'),
+            'ccaa_nombre': df['ccaa_nombre'].fillna('Nacional'),
+            'tipo_vivienda': df['tipo_vivienda'],
+            'metrica': df['metrica'],
+            'valor': pd.to_numeric(df['valor'], errors='coerce')
+        })[COLUMNAS_CACHE]
+        # Una fila por clave única del caché, en orden canónico para el hash
+        filas = filas.drop_duplicates(CLAVE_CACHE).sort_values(CLAVE_CACHE, kind='stable')
+        content_hash = HousingCacheService.content_hash(filas)
+        
         try:
-            # ========== PASO 1: CREAR SNAPSHOT DEL CACHÉ ANTERIOR ==========
-            print("🔍 DEBUG: Entrando en save_to_cache...")
-            current_cache = db.query(HousingINECache).all()
-            print(f"🔍 DEBUG: current_cache tiene {len(current_cache)} registros")
+            # Serializa refrescos concurrentes; no entra en conflicto con los SELECT de los lectores
+            db.execute(text("LOCK TABLE housing_ine_cache IN SHARE ROW EXCLUSIVE MODE"))
             
-            if current_cache:
-                print(f"📸 Creando snapshot histórico de {len(current_cache)} registros...")
-                for item in current_cache:
-                    snapshot = HousingINESnapshot(
-                        periodo=item.periodo,
-                        anio=item.anio,
-                        trimestre=item.trimestre,
-                        ccaa_codigo=item.ccaa_codigo,
-                        ccaa_nombre=item.ccaa_nombre,
-                        tipo_vivienda=item.tipo_vivienda,
-                        metrica=item.metrica,
-                        valor=item.valor,
-                        snapshot_date=datetime.utcnow()
-                    )
-                    db.add(snapshot)
-                db.commit()
-                print(f"✅ Snapshot histórico creado")
-            else:
-                print("🔍 DEBUG: No hay registros en caché anterior, saltando snapshot")
+            ultima = db.execute(text("""
+                SELECT version_id, content_hash FROM housing_ine_snapshot_versions
+                ORDER BY version_id DESC LIMIT 1
+            """)).first()
+            cache_vacio = db.execute(text("SELECT NOT EXISTS (SELECT 1 FROM housing_ine_cache)")).scalar()
             
-            # ========== PASO 2: LIMPIAR CACHÉ ANTERIOR ==========
-            db.query(HousingINECache).delete()
-            db.commit()
-            print(f"🗑️ Caché anterior eliminado")
+            if ultima and ultima.content_hash == content_hash and not cache_vacio:
+                db.execute(text("UPDATE housing_ine_cache SET cached_at = :fecha"), {"fecha": ahora})
+                meta = {"version": ultima.version_id, "refreshed_at": ahora,
+                        "row_count": len(filas), "content_hash": content_hash}
+                db.execute(text(META_UPSERT_SQL), meta)
+                db.commit()
+                HousingCacheService._recordar_frescura(meta)
+                print(f"💾 Datos INE sin cambios (hash {content_hash[:12]}, versión {ultima.version_id}): "
+                      f"solo se renueva el caché ({time.perf_counter() - inicio:.2f}s)")
+                return len(filas)
             
-            # ========== PASO 3: GUARDAR NUEVOS DATOS EN CACHÉ ==========
-            count = 0
-            for _, row in df.iterrows():
-                cache_entry = HousingINECache(
-                    periodo=row['periodo'],
-                    anio=int(row['anio']),
-                    trimestre=int(row['trimestre']),
-                    ccaa_codigo=row['ccaa_codigo'] if pd.notna(row['ccaa_codigo']) else '00',
-                    ccaa_nombre=row['ccaa_nombre'] if pd.notna(row['ccaa_nombre']) else 'Nacional',
-                    tipo_vivienda=row['tipo_vivienda'],
-                    metrica=row['metrica'],
-                    valor=float(row['valor']) if pd.notna(row['valor']) else None,
+            db.execute(text(STAGING_DDL))
+            buffer = io.StringIO()
+            filas.to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor = db.connection().connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY housing_ine_staging ({_COLUMNAS}) FROM STDIN WITH (FORMAT csv)",
+                    buffer
                 )
-                db.add(cache_entry)
-                count += 1
+            finally:
+                cursor.close()
+            
+            # Nueva versión: base si no hay historial o el caché está vacío (sin estado previo con el que comparar)
+            es_base = ultima is None or cache_vacio
+            version_id = db.execute(text("""
+                INSERT INTO housing_ine_snapshot_versions (snapshot_date, content_hash, row_count, is_base)
+                VALUES (:fecha, :hash, :row_count, :is_base)
+                RETURNING version_id
+            """), {"fecha": ahora, "hash": content_hash, "row_count": len(filas), "is_base": es_base}).scalar()
+            db.execute(text("SELECT housing_snapshots_ensure_partition(:fecha)"), {"fecha": ahora})
             
+            params = {"version_id": version_id, "fecha": ahora}
+            cambios = db.execute(text(SNAPSHOT_BASE_SQL if es_base else SNAPSHOT_CAMBIOS_SQL), params).rowcount
+            db.execute(
+                text("UPDATE housing_ine_snapshot_versions SET changed_rows = :cambios WHERE version_id = :version_id"),
+                {"cambios": cambios, "version_id": version_id}
+            )
+            
+            db.execute(text("DELETE FROM housing_ine_cache"))
+            count = db.execute(text(REPLACE_SQL), {"fecha": ahora}).rowcount
+            meta = {"version": version_id, "refreshed_at": ahora, "row_count": count, "content_hash": content_hash}
+            db.execute(text(META_UPSERT_SQL), meta)
             db.commit()
-            print(f"💾 {count} registros guardados en caché")
-            return count
+            HousingCacheService._recordar_frescura(meta)
         except Exception as e:
             db.rollback()
             print(f"❌ Error guardando en caché: {e}")
             raise
+        
+        print(f"💾 {count} registros guardados en caché (versión {version_id}"
+              f"{' base' if es_base else ''}: {cambios} filas en el historial, "
+              f"{time.perf_counter() - inicio:.2f}s)")
+        
+        # La retención no invalida un refresco ya confirmado
+        try:
+            HousingCacheService.apply_retention(db)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ No se pudo aplicar la retención del historial de vivienda: {e}")
+        return count
+    
+    @staticmethod
+    def apply_retention(db: Session, months: int = SNAPSHOT_RETENTION_MONTHS) -> int:
+        """
+        Borra el historial de meses anteriores a la ventana de retención
+        (particiones enteras). Antes convierte en base la versión más antigua
+        que se conserva para que su estado no dependa de lo borrado.
+        Devuelve el número de particiones borradas.
+        """
+        ultima = db.execute(text("SELECT max(snapshot_date) FROM housing_ine_snapshot_versions")).scalar()
+        if ultima is None:
+            return 0
+        
+        # Primer día del mes de corte (nunca posterior al mes de la versión vigente)
+        ahora = datetime.utcnow()
+        meses = ahora.year * 12 + ahora.month - 1 - months
+        corte = min(datetime(meses // 12, meses % 12 + 1, 1), ultima.replace(day=1, hour=0, minute=0, second=0, microsecond=0))
+        
+        antiguas = db.execute(
+            text("SELECT EXISTS (SELECT 1 FROM housing_ine_snapshot_versions WHERE snapshot_date < :corte)"),
+            {"corte": corte}
+        ).scalar()
+        if not antiguas:
+            return 0
+        
+        primera = db.execute(text("""
+            SELECT version_id, snapshot_date, is_base FROM housing_ine_snapshot_versions
+            WHERE snapshot_date >= :corte ORDER BY version_id LIMIT 1
+        """), {"corte": corte}).first()
+        
+        if not primera.is_base:
+            estado = db.execute(text(VERSION_EN_FECHA_SQL), {"fecha": primera.snapshot_date}).first()
+            params = {
+                "version_id": primera.version_id, "fecha": primera.snapshot_date,
+                "base_id": estado.base_id, "base_date": estado.base_date
+            }
+            db.execute(text(COMPACTAR_SQL), params)
+            # Las lápidas de una base no aportan nada
+            db.execute(text("""
+                DELETE FROM housing_ine_snapshots
+                WHERE version_id = :version_id AND snapshot_date = :fecha AND deleted
+            """), params)
+            db.execute(text("UPDATE housing_ine_snapshot_versions SET is_base = TRUE WHERE version_id = :version_id"), params)
+        
+        borradas = db.execute(text("SELECT housing_snapshots_drop_before(:corte)"), {"corte": corte.date()}).scalar()
+        db.commit()
+        print(f"🧹 Historial de vivienda: {borradas} particiones anteriores a {corte:%Y-%m} borradas "
+              f"(versión {primera.version_id} como base)")
+        return borradas
     
     @staticmethod
     def get_from_cache(
@@ -100,37 +363,52 @@ class HousingCacheService:
         tipo_vivienda: str,
         ccaa: str = None,
         anio_desde: int = None,
-        anio_hasta: int = None
-    ) -> list:
-        """Obtiene datos del caché actual con filtros opcionales"""
+        anio_hasta: int = None,
+        limit: int = None,
+        offset: int = 0,
+        include_total: bool = True
+    ) -> Tuple[list, Optional[int]]:
+        """
+        Página del caché actual con filtros opcionales: (filas como dict, total).
+        
+        Filtro, orden y paginación se resuelven en Postgres sobre
+        idx_housing_consulta (index-only scan, sin sort). El orden termina en
+        (ccaa_codigo, periodo), únicos por métrica y tipo, para que las
+        páginas con OFFSET no se solapen. El total (COUNT sobre todo el
+        filtro) solo se calcula con include_total; si no, es None.
+        """
         try:
-            query = db.query(HousingINECache).filter(
-                and_(
-                    HousingINECache.metrica == metric,
-                    HousingINECache.tipo_vivienda == tipo_vivienda
-                )
-            )
-            
-            if ccaa and ccaa != '00':
-                query = query.filter(HousingINECache.ccaa_codigo == ccaa)
-            elif ccaa == '00':
-                query = query.filter(HousingINECache.ccaa_codigo == '00')
+            where = ["metrica = :metric", "tipo_vivienda = :tipo_vivienda"]
+            params = {"metric": metric, "tipo_vivienda": tipo_vivienda, "limit": limit, "offset": offset}
             
+            if ccaa:
+                where.append("ccaa_codigo = :ccaa")
+                params["ccaa"] = ccaa
             if anio_desde:
-                query = query.filter(HousingINECache.anio >= anio_desde)
-            
+                where.append("anio >= :anio_desde")
+                params["anio_desde"] = anio_desde
             if anio_hasta:
-                query = query.filter(HousingINECache.anio <= anio_hasta)
+                where.append("anio <= :anio_hasta")
+                params["anio_hasta"] = anio_hasta
+            filtro = ' AND '.join(where)
+            
+            # LIMIT NULL = sin límite
+            filas = db.execute(text(f"""
+                SELECT {_COLUMNAS}
+                FROM housing_ine_cache
+                WHERE {filtro}
+                ORDER BY anio DESC, trimestre DESC, ccaa_codigo, periodo
+                LIMIT :limit OFFSET :offset
+            """), params).all()
             
-            results = query.order_by(
-                HousingINECache.anio.desc(),
-                HousingINECache.trimestre.desc()
-            ).all()
+            total = None
+            if include_total:
+                total = db.execute(text(f"SELECT count(*) FROM housing_ine_cache WHERE {filtro}"), params).scalar()
             
-            return results
+            return [dict(zip(COLUMNAS_CACHE, fila)) for fila in filas], total
         except Exception as e:
             print(f"❌ Error obteniendo datos del caché: {e}")
-            return []
+            return [], 0
     
     @staticmethod
     def get_from_snapshots(
@@ -140,31 +418,47 @@ class HousingCacheService:
         ccaa: str = None,
         snapshot_date: datetime = None
     ) -> list:
-        """Obtiene datos históricos de snapshots (para comparativas)"""
+        """
+        Datos tal y como estaban en la versión vigente en snapshot_date (por
+        defecto la última), para comparativas: última fila de cada clave desde
+        la versión base, sin las borradas
+        """
         try:
-            query = db.query(HousingINESnapshot).filter(
-                and_(
-                    HousingINESnapshot.metrica == metric,
-                    HousingINESnapshot.tipo_vivienda == tipo_vivienda
-                )
-            )
-            
-            if ccaa and ccaa != '00':
-                query = query.filter(HousingINESnapshot.ccaa_codigo == ccaa)
-            elif ccaa == '00':
-                query = query.filter(HousingINESnapshot.ccaa_codigo == '00')
-            
-            if snapshot_date:
-                # Obtener snapshot más cercano a esa fecha
-                query = query.filter(HousingINESnapshot.snapshot_date <= snapshot_date)
+            version = db.execute(
+                text(VERSION_EN_FECHA_SQL),
+                {"fecha": snapshot_date or datetime.utcnow()}
+            ).first()
+            if not version:
+                return []
             
-            results = query.order_by(
-                HousingINESnapshot.snapshot_date.desc(),
-                HousingINESnapshot.anio.desc(),
-                HousingINESnapshot.trimestre.desc()
-            ).all()
+            where = ["metrica = :metric", "tipo_vivienda = :tipo_vivienda"]
+            params = {
+                "metric": metric,
+                "tipo_vivienda": tipo_vivienda,
+                "version_id": version.version_id,
+                "fecha": version.snapshot_date,
+                "base_id": version.base_id,
+                "base_date": version.base_date
+            }
+            if ccaa:
+                where.append("ccaa_codigo = :ccaa")
+                params["ccaa"] = ccaa
             
-            return results
+            # El rango de snapshot_date poda las particiones fuera de [base, versión]
+            query = f"""
+                SELECT {_COLUMNAS}, version_id, CAST(:fecha AS timestamp) AS snapshot_date
+                FROM (
+                    SELECT DISTINCT ON (periodo, ccaa_codigo) {_COLUMNAS}, deleted, version_id
+                    FROM housing_ine_snapshots
+                    WHERE {' AND '.join(where)}
+                      AND version_id BETWEEN :base_id AND :version_id
+                      AND snapshot_date BETWEEN :base_date AND :fecha
+                    ORDER BY periodo, ccaa_codigo, version_id DESC
+                ) estado
+                WHERE NOT deleted
+                ORDER BY anio DESC, trimestre DESC
+            """
+            return db.execute(text(query), params).fetchall()
         except Exception as e:
             print(f"❌ Error obteniendo datos de snapshots: {e}")
             return []
@@ -174,7 +468,9 @@ class HousingCacheService:
         """Limpia el caché actual (no toca los snapshots históricos)"""
         try:
             count = db.query(HousingINECache).delete()
+            db.execute(text("DELETE FROM housing_ine_cache_meta"))
             db.commit()
+            HousingCacheService._recordar_frescura(None)
             print(f"🗑️ Caché limpiado: {count} registros eliminados")
             return True
         except Exception as e:
@@ -184,12 +480,12 @@ class HousingCacheService:
     
     @staticmethod
     def get_snapshot_dates(db: Session) -> list:
-        """Obtiene todas las fechas de snapshot disponibles"""
+        """Fechas de las versiones disponibles (una por contenido distinto publicado)"""
         try:
-            dates = db.query(HousingINESnapshot.snapshot_date).distinct().order_by(
-                HousingINESnapshot.snapshot_date.desc()
-            ).all()
+            dates = db.execute(text("""
+                SELECT snapshot_date FROM housing_ine_snapshot_versions ORDER BY version_id DESC
+            """)).fetchall()
             return [d[0] for d in dates]
         except Exception as e:
             print(f"❌ Error obteniendo fechas de snapshots: {e}")
-            return []
\ No newline at end of file
+            return []
@@ -0,0 +1,234 @@
+# backend/app/services/place_index.py
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from bisect import bisect_left
+from pathlib import Path
+from typing import List, Optional
+import csv
+import threading
+import time
+
+from app.services.dataset_versions import DatasetVersionService
+from app.utils.geo_reference import (
+    ARTICULOS, CCAA, PROVINCIAS, normalizar_nombre, provincia_de_municipio, ccaa_de_provincia
+)
+
+NOMENCLATOR_PATH = Path(__file__).resolve().parents[2] / "data" / "nomenclator_municipios.csv"
+
+# El índice se reconstruye cuando cambian los municipios (ingesta electoral / CNIG)
+DATASET = "elections"
+
+TIPOS = ("comunidad", "provincia", "municipio")
+
+
+class PlaceIndex:
+    """
+    Índice de prefijos en memoria de CCAA, provincias y municipios.
+
+    Cada lugar se indexa por su nombre normalizado (sin acentos, minúsculas)
+    y por cada sufijo que empieza en una palabra, de modo que "palmas"
+    encuentra "Las Palmas de Gran Canaria". Las claves van en una lista
+    ordenada y la búsqueda es un bisect + recorrido del rango con el prefijo.
+    """
+
+    _index = None
+    _lock = threading.Lock()
+
+    def __init__(self, lugares: List[dict], version: int = 0):
+        self.version = version
+        self.lugares = lugares
+
+        pares = set()
+        for i, lugar in enumerate(lugares):
+            for nombre in lugar.pop("_nombres"):
+                # Nombres bilingües ("Araba/Álava"): cada forma cuenta como nombre completo
+                for variante in [nombre] + nombre.split("/"):
+                    palabras = normalizar_nombre(variante).split()
+                    for inicio in range(len(palabras)):
+                        # "A Coruña" también es nombre completo para "coruña"
+                        completa = inicio == 0 or (inicio == 1 and palabras[0] in ARTICULOS)
+                        pares.add((" ".join(palabras[inicio:]), i, completa))
+
+        pares = sorted(pares)
+        self._claves = [p[0] for p in pares]
+        self._ids = [p[1] for p in pares]
+        self._completa = [p[2] for p in pares]
+
+    def buscar(self, q: str, limit: int = 10, tipos: Optional[tuple] = None) -> List[dict]:
+        """Lugares cuyo nombre (o una palabra del nombre) empieza por q, por relevancia y población"""
+        prefijo = normalizar_nombre(q)
+        if not prefijo:
+            return []
+
+        # id -> mejor rango (0 nombre exacto, 1 prefijo del nombre, 2 prefijo de palabra)
+        rangos = {}
+        pos = bisect_left(self._claves, prefijo)
+        while pos < len(self._claves) and self._claves[pos].startswith(prefijo):
+            lugar_id = self._ids[pos]
+            if tipos is None or self.lugares[lugar_id]["tipo"] in tipos:
+                if self._completa[pos]:
+                    rango = 0 if self._claves[pos] == prefijo else 1
+                else:
+                    rango = 2
+                if rango < rangos.get(lugar_id, 3):
+                    rangos[lugar_id] = rango
+            pos += 1
+
+        ordenados = sorted(
+            rangos.items(),
+            key=lambda item: (item[1], -(self.lugares[item[0]]["poblacion"] or 0))
+        )
+        return [self.lugares[lugar_id] for lugar_id, _ in ordenados[:limit]]
+
+    @staticmethod
+    def _municipios_nomenclator() -> dict:
+        """codigo_ine -> lugar, desde el nomenclátor del CNIG"""
+        municipios = {}
+        if not NOMENCLATOR_PATH.exists():
+            print(f"⚠️ Nomenclátor no encontrado: {NOMENCLATOR_PATH}")
+            return municipios
+
+        with open(NOMENCLATOR_PATH, encoding="latin-1", newline="") as f:
+            for fila in csv.DictReader(f, delimiter=";"):
+                codigo = (fila.get("COD_INE") or "").strip()[:5]
+                if len(codigo) != 5 or not codigo.isdigit():
+                    continue
+                try:
+                    lon = float(fila["LONGITUD_ETRS89"].replace(",", "."))
+                    lat = float(fila["LATITUD_ETRS89"].replace(",", "."))
+                except (KeyError, ValueError, AttributeError):
+                    lon = lat = None
+                try:
+                    poblacion = int(fila.get("POBLACION_MUNI") or 0)
+                except ValueError:
+                    poblacion = 0
+                municipios[codigo] = {
+                    "nombre": fila["NOMBRE_ACTUAL"].strip(),
+                    "poblacion": poblacion,
+                    "lat": lat,
+                    "lon": lon,
+                    "_nombres": {fila["NOMBRE_ACTUAL"].strip()}
+                }
+        return municipios
+
+    @staticmethod
+    def _municipios_bd(db: Session, municipios: dict) -> dict:
+        """Completa/actualiza los municipios con municipios_espana; devuelve nombres de CCAA y provincia de la BD"""
+        nombres_region = {}
+        rows = db.execute(text("""
+            SELECT codigo_ine, nombre_municipio, nombre_provincia, nombre_comunidad, poblacion, lat, lon
+            FROM municipios_espana
+        """)).fetchall()
+
+        for row in rows:
+            lugar = municipios.setdefault(row[0], {"nombre": row[1], "_nombres": set()})
+            lugar["_nombres"].add(row[1])
+            if row[4]:
+                lugar["poblacion"] = row[4]
+            if row[5] is not None and row[6] is not None:
+                lugar["lat"] = float(row[5])
+                lugar["lon"] = float(row[6])
+
+            codigo_provincia = provincia_de_municipio(row[0])
+            nombres_region.setdefault(("provincia", codigo_provincia), set()).add(row[2])
+            nombres_region.setdefault(("comunidad", ccaa_de_provincia(codigo_provincia)), set()).add(row[3])
+
+        return nombres_region
+
+    @classmethod
+    def build(cls, db: Optional[Session], version: int = 0) -> "PlaceIndex":
+        inicio = time.perf_counter()
+        municipios = cls._municipios_nomenclator()
+
+        nombres_region = {}
+        if db is not None:
+            try:
+                nombres_region = cls._municipios_bd(db, municipios)
+            except Exception as e:
+                print(f"⚠️ municipios_espana no disponible para el índice de lugares: {e}")
+                db.rollback()
+
+        lugares = []
+        poblacion_provincia = {}
+        for codigo, m in municipios.items():
+            codigo_provincia = provincia_de_municipio(codigo)
+            if codigo_provincia not in PROVINCIAS:
+                continue
+            codigo_ccaa = ccaa_de_provincia(codigo_provincia)
+            poblacion = m.get("poblacion") or 0
+            poblacion_provincia[codigo_provincia] = poblacion_provincia.get(codigo_provincia, 0) + poblacion
+            lugares.append({
+                "tipo": "municipio",
+                "nombre": m["nombre"],
+                "codigo_ine": codigo,
+                "codigo_provincia": codigo_provincia,
+                "provincia": PROVINCIAS[codigo_provincia][0],
+                "codigo_ccaa": codigo_ccaa,
+                "comunidad": CCAA[codigo_ccaa],
+                "poblacion": poblacion,
+                "lat": m.get("lat"),
+                "lon": m.get("lon"),
+                "_nombres": m["_nombres"]
+            })
+
+        poblacion_ccaa = {}
+        for codigo_provincia, (nombre, codigo_ccaa) in PROVINCIAS.items():
+            poblacion = poblacion_provincia.get(codigo_provincia, 0)
+            poblacion_ccaa[codigo_ccaa] = poblacion_ccaa.get(codigo_ccaa, 0) + poblacion
+            lugares.append({
+                "tipo": "provincia",
+                "nombre": nombre,
+                "codigo_ine": None,
+                "codigo_provincia": codigo_provincia,
+                "provincia": nombre,
+                "codigo_ccaa": codigo_ccaa,
+                "comunidad": CCAA[codigo_ccaa],
+                "poblacion": poblacion,
+                "lat": None,
+                "lon": None,
+                "_nombres": {nombre} | nombres_region.get(("provincia", codigo_provincia), set())
+            })
+
+        for codigo_ccaa, nombre in CCAA.items():
+            lugares.append({
+                "tipo": "comunidad",
+                "nombre": nombre,
+                "codigo_ine": None,
+                "codigo_provincia": None,
+                "provincia": None,
+                "codigo_ccaa": codigo_ccaa,
+                "comunidad": nombre,
+                "poblacion": poblacion_ccaa.get(codigo_ccaa, 0),
+                "lat": None,
+                "lon": None,
+                "_nombres": {nombre} | nombres_region.get(("comunidad", codigo_ccaa), set())
+            })
+
+        indice = cls(lugares, version)
+        print(f"🔎 Índice de lugares v{version}: {len(lugares)} lugares, "
+              f"{len(indice._claves)} claves ({time.perf_counter() - inicio:.2f}s)")
+        return indice
+
+    @classmethod
+    def get(cls, db: Session) -> "PlaceIndex":
+        """Índice vigente del worker, reconstruido si cambia la versión de los municipios"""
+        version = DatasetVersionService.get_version(db, DATASET)
+        indice = cls._index
+        if indice is not None and indice.version == version:
+            return indice
+
+        with cls._lock:
+            indice = cls._index
+            if indice is None or indice.version != version:
+                indice = cls.build(db, version)
+                cls._index = indice
+            return indice
+
+    @classmethod
+    def warm(cls, db: Session) -> Optional["PlaceIndex"]:
+        try:
+            return cls.get(db)
+        except Exception as e:
+            print(f"⚠️ No se pudo construir el índice de lugares: {e}")
+            db.rollback()
+            return None
@@ -0,0 +1,56 @@
+# backend/app/services/tile_cache.py
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import json
+import os
+import threading
+
+# Número máximo de tiles en memoria por worker
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "2048"))
+
+
+class TileCache:
+    """
+    Caché LRU en memoria de tiles vectoriales (MVT).
+    
+    La clave incluye un hash de los filtros y la versión del dataset: cuando
+    una ingesta incrementa la versión, las entradas antiguas se descartan.
+    """
+    
+    def __init__(self, max_entries: int = TILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._tiles = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def filter_hash(filtros: dict) -> str:
+        """Hash estable de los filtros de la petición"""
+        canonico = json.dumps(filtros, sort_keys=True, default=str)
+        return hashlib.sha1(canonico.encode("utf-8")).hexdigest()
+    
+    def _check_version(self, version: int) -> None:
+        if self._version != version:
+            self._tiles.clear()
+            self._version = version
+    
+    def get(self, version: int, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            self._check_version(version)
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+    
+    def set(self, version: int, key: tuple, tile: bytes) -> None:
+        with self._lock:
+            self._check_version(version)
+            self._tiles[key] = tile
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_entries:
+                self._tiles.popitem(last=False)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
@@ -0,0 +1,217 @@
+# backend/app/utils/geo_reference.py
+"""
+Referencia geográfica canónica: comunidades autónomas y provincias con sus
+códigos INE como enteros pequeños (CCAA 1-19, provincias 1-52). Los
+municipios se identifican por su código INE de 5 cifras (provincia * 1000 + municipio).
+"""
+import re
+import unicodedata
+from typing import Optional
+
+# Código INE de comunidad autónoma -> nombre canónico
+CCAA = {
+    1: "Andalucía",
+    2: "Aragón",
+    3: "Principado de Asturias",
+    4: "Illes Balears",
+    5: "Canarias",
+    6: "Cantabria",
+    7: "Castilla y León",
+    8: "Castilla - La Mancha",
+    9: "Cataluña",
+    10: "Comunitat Valenciana",
+    11: "Extremadura",
+    12: "Galicia",
+    13: "Comunidad de Madrid",
+    14: "Región de Murcia",
+    15: "Comunidad Foral de Navarra",
+    16: "País Vasco",
+    17: "La Rioja",
+    18: "Ciudad de Ceuta",
+    19: "Ciudad de Melilla"
+}
+
+# Código INE de provincia -> (nombre canónico, código de CCAA)
+PROVINCIAS = {
+    1: ("Araba/Álava", 16),
+    2: ("Albacete", 8),
+    3: ("Alicante/Alacant", 10),
+    4: ("Almería", 1),
+    5: ("Ávila", 7),
+    6: ("Badajoz", 11),
+    7: ("Illes Balears", 4),
+    8: ("Barcelona", 9),
+    9: ("Burgos", 7),
+    10: ("Cáceres", 11),
+    11: ("Cádiz", 1),
+    12: ("Castellón/Castelló", 10),
+    13: ("Ciudad Real", 8),
+    14: ("Córdoba", 1),
+    15: ("A Coruña", 12),
+    16: ("Cuenca", 8),
+    17: ("Girona", 9),
+    18: ("Granada", 1),
+    19: ("Guadalajara", 8),
+    20: ("Gipuzkoa", 16),
+    21: ("Huelva", 1),
+    22: ("Huesca", 2),
+    23: ("Jaén", 1),
+    24: ("León", 7),
+    25: ("Lleida", 9),
+    26: ("La Rioja", 17),
+    27: ("Lugo", 12),
+    28: ("Madrid", 13),
+    29: ("Málaga", 1),
+    30: ("Murcia", 14),
+    31: ("Navarra", 15),
+    32: ("Ourense", 12),
+    33: ("Asturias", 3),
+    34: ("Palencia", 7),
+    35: ("Las Palmas", 5),
+    36: ("Pontevedra", 12),
+    37: ("Salamanca", 7),
+    38: ("Santa Cruz de Tenerife", 5),
+    39: ("Cantabria", 6),
+    40: ("Segovia", 7),
+    41: ("Sevilla", 1),
+    42: ("Soria", 7),
+    43: ("Tarragona", 9),
+    44: ("Teruel", 2),
+    45: ("Toledo", 8),
+    46: ("Valencia/València", 10),
+    47: ("Valladolid", 7),
+    48: ("Bizkaia", 16),
+    49: ("Zamora", 7),
+    50: ("Zaragoza", 2),
+    51: ("Ceuta", 18),
+    52: ("Melilla", 19)
+}
+
+# Nombres oficiales del INE en formato "Nombre, Artículo" (API de precios de vivienda)
+CCAA_NOMBRES_INE = {
+    1: "Andalucía",
+    2: "Aragón",
+    3: "Asturias, Principado de",
+    4: "Balears, Illes",
+    5: "Canarias",
+    6: "Cantabria",
+    7: "Castilla y León",
+    8: "Castilla - La Mancha",
+    9: "Cataluña",
+    10: "Comunitat Valenciana",
+    11: "Extremadura",
+    12: "Galicia",
+    13: "Madrid, Comunidad de",
+    14: "Murcia, Región de",
+    15: "Navarra, Comunidad Foral de",
+    16: "País Vasco",
+    17: "Rioja, La",
+    18: "Ceuta",
+    19: "Melilla"
+}
+
+# Otras grafías de CCAA usadas por los datasets (covid, fuentes externas)
+CCAA_VARIANTES = {
+    3: ("Asturias",),
+    4: ("Islas Baleares", "Baleares"),
+    8: ("Castilla-La Mancha",),
+    9: ("Catalunya",),
+    10: ("Comunidad Valenciana",),
+    13: ("Madrid",),
+    14: ("Murcia",),
+    15: ("Navarra",),
+    16: ("Euskadi",),
+    18: ("Ceuta",),
+    19: ("Melilla",)
+}
+
+# Otras grafías de provincias (nombres castellanos antiguos, formas cortas)
+PROVINCIA_VARIANTES = {
+    7: ("Balears, Illes", "Islas Baleares", "Baleares"),
+    15: ("La Coruña",),
+    17: ("Gerona",),
+    20: ("Guipúzcoa",),
+    25: ("Lérida",),
+    32: ("Orense",),
+    48: ("Vizcaya",)
+}
+
+# Artículos iniciales; algunas fuentes los posponen ("Rioja, La", "Coruña, A", "Palmas, Las")
+ARTICULOS = {
+    'el', 'la', 'los', 'las', 'lo', 'l', 'a', 'o', 'os', 'as', 'es', 'sa', 'ses', 'els', 'les'
+}
+
+
+def normalizar_nombre(nombre: Optional[str]) -> str:
+    """Minúsculas, sin acentos ni puntuación y con el artículo pospuesto al principio"""
+    if not isinstance(nombre, str):
+        return ''
+    nombre = nombre.strip()
+    if ', ' in nombre:
+        base, articulo = nombre.rsplit(', ', 1)
+        if articulo.lower().rstrip("'") in ARTICULOS:
+            nombre = f"{articulo} {base}"
+    nombre = unicodedata.normalize('NFKD', nombre.lower())
+    nombre = ''.join(c for c in nombre if not unicodedata.combining(c))
+    return ' '.join(re.sub(r"[^a-z0-9]+", ' ', nombre).split())
+
+
+def provincia_de_municipio(codigo_ine) -> Optional[int]:
+    """Código de provincia a partir del código INE de municipio ('28079' o 28079)"""
+    try:
+        return int(codigo_ine) // 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def ccaa_de_provincia(codigo_provincia: Optional[int]) -> Optional[int]:
+    provincia = PROVINCIAS.get(codigo_provincia)
+    return provincia[1] if provincia else None
+
+
+def formas_nombre(nombre: str) -> set:
+    """
+    Grafías habituales de un nombre: bilingüe con y sin espacios y en ambos
+    órdenes ("Araba/Álava", "Araba / Álava", "Álava/Araba", "Álava"...), y
+    con el artículo pospuesto ("La Rioja" -> "Rioja, La").
+    """
+    formas = {nombre}
+    partes = [p.strip() for p in nombre.split("/")]
+    if len(partes) == 2:
+        formas.update(partes)
+        formas.update({"/".join(partes), " / ".join(partes),
+                       "/".join(reversed(partes)), " / ".join(reversed(partes))})
+    for forma in list(formas):
+        palabras = forma.split(" ", 1)
+        if len(palabras) == 2 and palabras[0].lower() in ARTICULOS:
+            formas.add(f"{palabras[1]}, {palabras[0]}")
+    return formas
+
+
+def variantes_nombre() -> list:
+    """Filas (nivel, variante, codigo) para la tabla geo_nombres, con la variante en minúsculas"""
+    filas = set()
+    for codigo, nombre in CCAA.items():
+        nombres = {nombre, CCAA_NOMBRES_INE[codigo], *CCAA_VARIANTES.get(codigo, ())}
+        for n in nombres:
+            filas.update(("ccaa", forma.lower(), codigo) for forma in formas_nombre(n))
+    for codigo, (nombre, _) in PROVINCIAS.items():
+        for n in {nombre, *PROVINCIA_VARIANTES.get(codigo, ())}:
+            filas.update(("provincia", forma.lower(), codigo) for forma in formas_nombre(n))
+    return sorted(filas)
+
+
+# nombre normalizado -> código, por nivel
+_CODIGOS_POR_NOMBRE = {"ccaa": {}, "provincia": {}}
+for _nivel, _variante, _codigo in variantes_nombre():
+    _CODIGOS_POR_NOMBRE[_nivel].setdefault(normalizar_nombre(_variante), _codigo)
+
+
+def codigo_ccaa(nombre: Optional[str]) -> Optional[int]:
+    """Código INE de la CCAA a partir de cualquiera de sus grafías (None si no se reconoce)"""
+    return _CODIGOS_POR_NOMBRE["ccaa"].get(normalizar_nombre(nombre))
+
+
+def codigo_provincia(nombre: Optional[str]) -> Optional[int]:
+    """Código INE de la provincia a partir de cualquiera de sus grafías (None si no se reconoce)"""
+    return _CODIGOS_POR_NOMBRE["provincia"].get(normalizar_nombre(nombre))
@@ -0,0 +1,133 @@
+# backend/app/utils/miteco_csv.py
+"""
+Parser vectorizado del CSV del Índice de Calidad del Aire (MITECO)
+
+Formato: cod_estacion,nombre,tipo,latitud,longitud,activa,fecha,indice,debido_a
+
+Se lee de una vez con el lector CSV de pyarrow (todas las columnas como
+texto, para validar igual que antes), se valida con máscaras booleanas de
+pyarrow.compute y se devuelve como arrays paralelos por campo; los
+contadores de descartes se calculan como agregados de esas máscaras.
+"""
+from datetime import datetime
+from io import BytesIO
+from typing import Dict
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+COLUMNAS_MITECO = [
+    'cod_estacion', 'nombre', 'tipo', 'latitud', 'longitud',
+    'activa', 'fecha', 'indice', 'debido_a'
+]
+
+CAMPOS_DATO = [
+    'cod_estacion', 'nombre', 'tipo', 'lat', 'lon', 'activa',
+    'fecha', 'indice_ica', 'tiene_indice', 'debido_a', 'aqi'
+]
+
+# Mapeo de índice ICA (1-6) a nuestro AQI (1-5)
+ICA_TO_AQI = {
+    1: 1,  # Buena
+    2: 2,  # Razonablemente buena
+    3: 3,  # Regular
+    4: 4,  # Desfavorable
+    5: 5,  # Muy desfavorable
+    6: 5   # Extremadamente desfavorable
+}
+
+# Números tal y como los aceptan int() / float()
+_PATRON_ENTERO = r'^[+-]?\d+$'
+_PATRON_DECIMAL = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
+
+
+def _contar(mascara) -> int:
+    return pc.sum(mascara).as_py() or 0
+
+
+def _numero(columna, patron: str, tipo):
+    """Convierte a número las celdas que encajan en el patrón; el resto queda a null"""
+    return pc.cast(pc.if_else(pc.match_substring_regex(columna, patron), columna, None), tipo)
+
+
+def parsear_csv_miteco_columnas(contenido: bytes) -> Dict[str, list]:
+    """CSV MITECO -> arrays paralelos por campo (solo filas válidas, en el orden del fichero)"""
+    tabla = pa_csv.read_csv(
+        BytesIO(contenido),
+        read_options=pa_csv.ReadOptions(use_threads=False),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={col: pa.string() for col in COLUMNAS_MITECO},
+            include_columns=COLUMNAS_MITECO,
+            include_missing_columns=True,
+            strings_can_be_null=False
+        )
+    )
+    # Las columnas ausentes en el fichero llegan como null
+    col = {
+        nombre: pc.utf8_trim_whitespace(
+            pc.fill_null(tabla[nombre], '') if tabla[nombre].null_count else tabla[nombre]
+        )
+        for nombre in COLUMNAS_MITECO
+    }
+
+    activa = pc.equal(pc.utf8_lower(col['activa']), 'true')
+
+    # Filas sin código o nombre
+    con_identidad = pc.and_(pc.not_equal(col['cod_estacion'], ''), pc.not_equal(col['nombre'], ''))
+
+    # Coordenadas: numéricas y distintas de 0 (no se filtra por rango: MITECO solo tiene estaciones españolas)
+    lat = _numero(col['latitud'], _PATRON_DECIMAL, pa.float64())
+    lon = _numero(col['longitud'], _PATRON_DECIMAL, pa.float64())
+    con_coords = pc.fill_null(pc.and_(pc.not_equal(lat, 0), pc.not_equal(lon, 0)), False)
+
+    validas = pc.and_(con_identidad, con_coords)
+
+    # Índice ICA entero (el resto cuenta como "sin índice")
+    indice = _numero(col['indice'], _PATRON_ENTERO, pa.int64())
+    tiene_indice = pc.is_valid(indice)
+
+    fecha = pc.if_else(pc.equal(col['fecha'], ''), datetime.now().isoformat(), col['fecha'])
+
+    fuera_rango = pc.or_(
+        pc.or_(pc.less(lat, 20), pc.greater(lat, 45)),
+        pc.or_(pc.less(lon, -20), pc.greater(lon, 5))
+    )
+    sospechosas = pc.and_(validas, pc.fill_null(fuera_rango, False))
+
+    # Un único filtro sobre la tabla de salida y conversión a listas Python por columna
+    columnas = pa.table({
+        'cod_estacion': col['cod_estacion'],
+        'nombre': col['nombre'],
+        'tipo': col['tipo'],
+        'lat': lat,
+        'lon': lon,
+        'activa': activa,
+        'fecha': fecha,
+        'indice_ica': indice,
+        'tiene_indice': tiene_indice,
+        'debido_a': col['debido_a']
+    }).filter(validas).to_pydict()
+    columnas['debido_a'] = [x or None for x in columnas['debido_a']]
+    columnas['aqi'] = [ICA_TO_AQI.get(i, 0) if i else 0 for i in columnas['indice_ica']]
+
+    n_validas = len(columnas['cod_estacion'])
+    n_activas = sum(columnas['activa'])
+    sin_identidad = len(tabla) - _contar(con_identidad)
+    print(f"✅ {n_validas} estaciones parseadas de {len(tabla)} filas "
+          f"(activas: {n_activas}, inactivas: {n_validas - n_activas}, "
+          f"sin índice: {n_validas - sum(columnas['tiene_indice'])}, "
+          f"sin código/nombre: {sin_identidad}, "
+          f"sin coordenadas: {len(tabla) - sin_identidad - n_validas}, "
+          f"coordenadas sospechosas: {_contar(sospechosas)})")
+    return columnas
+
+
+def filas_columnas(columnas: Dict[str, list]) -> int:
+    """Número de filas de un feed MITECO en formato columnar"""
+    return len(columnas['cod_estacion'])
+
+
+def fila_columnas(columnas: Dict[str, list], i: int) -> Dict:
+    """Fila i como dict (solo para respuestas puntuales, no en bucles por estación)"""
+    return {campo: columnas[campo][i] for campo in CAMPOS_DATO}
@@ -0,0 +1,90 @@
+# backend/app/utils/spatial.py
+"""
+Utilidades para filtros espaciales (bbox y radio) en las queries PostGIS
+"""
+from typing import Optional, Tuple
+import math
+from fastapi import HTTPException
+
+# Tipos de filtros ya validados
+BBox = Tuple[float, float, float, float]        # (min_lon, min_lat, max_lon, max_lat)
+Near = Tuple[float, float, float]               # (lon, lat, radius_km)
+
+KM_POR_GRADO_LAT = 110.57
+KM_POR_GRADO_LON_ECUADOR = 111.32
+
+
+def _parse_floats(valor: str, n: int, nombre: str) -> list:
+    partes = [p.strip() for p in valor.split(",")]
+    if len(partes) != n:
+        raise HTTPException(status_code=400, detail=f"{nombre} debe tener {n} valores separados por coma")
+    try:
+        return [float(p) for p in partes]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{nombre} contiene valores no numéricos")
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[BBox]:
+    """Parsea 'minLon,minLat,maxLon,maxLat'"""
+    if not bbox:
+        return None
+    min_lon, min_lat, max_lon, max_lat = _parse_floats(bbox, 4, "bbox")
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= 90 and -90 <= max_lat <= 90):
+        raise HTTPException(status_code=400, detail="bbox fuera de rango")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox debe ser minLon,minLat,maxLon,maxLat")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_near(near: Optional[str], radius_km: Optional[float]) -> Optional[Near]:
+    """Parsea 'lon,lat' + radius_km"""
+    if not near:
+        return None
+    if radius_km is None or radius_km <= 0:
+        raise HTTPException(status_code=400, detail="near requiere radius_km > 0")
+    lon, lat = _parse_floats(near, 2, "near")
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise HTTPException(status_code=400, detail="near fuera de rango")
+    return lon, lat, radius_km
+
+
+def radio_en_grados(lat: float, radius_km: float) -> float:
+    """Radio en grados que cubre radius_km en cualquier dirección (para el prefiltro &&)"""
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    return max(radius_km / KM_POR_GRADO_LAT, radius_km / (KM_POR_GRADO_LON_ECUADOR * cos_lat))
+
+
+def filtros_espaciales_sql(columna_geom: str, bbox: Optional[BBox], near: Optional[Near]):
+    """
+    Condiciones SQL (lista) y parámetros para bbox/near sobre una columna geometry(4326).
+    
+    Ambos filtros empiezan por `geom && <caja>` para que Postgres use el índice
+    GIST; el radio exacto se comprueba después con ST_DWithin sobre geography.
+    """
+    condiciones = []
+    params = {}
+    
+    if bbox:
+        condiciones.append(
+            f"{columna_geom} && ST_MakeEnvelope(:bbox_min_lon, :bbox_min_lat, :bbox_max_lon, :bbox_max_lat, 4326)"
+        )
+        params.update({
+            'bbox_min_lon': bbox[0],
+            'bbox_min_lat': bbox[1],
+            'bbox_max_lon': bbox[2],
+            'bbox_max_lat': bbox[3]
+        })
+    
+    if near:
+        lon, lat, radius_km = near
+        punto = "ST_SetSRID(ST_MakePoint(:near_lon, :near_lat), 4326)"
+        condiciones.append(f"{columna_geom} && ST_Expand({punto}, :near_grados)")
+        condiciones.append(f"ST_DWithin({columna_geom}::geography, {punto}::geography, :near_metros)")
+        params.update({
+            'near_lon': lon,
+            'near_lat': lat,
+            'near_grados': radio_en_grados(lat, radius_km),
+            'near_metros': radius_km * 1000
+        })
+    
+    return condiciones, params
@@ -0,0 +1,113 @@
+# backend/app/utils/wire_format.py
+"""
+Formatos de transporte compactos para los modos light (mapas)
+
+- json:     lista de objetos (formato original)
+- columnar: arrays paralelos por campo; las columnas de texto repetitivas
+            (provincia, partido...) van codificadas como diccionario
+- arrow:    stream IPC de Apache Arrow con las mismas columnas
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+from fastapi import HTTPException, Response
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow es opcional: solo lo necesita format=arrow
+    pa = None
+
+FORMATOS = ('json', 'columnar', 'arrow')
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def validar_formato(formato: str, light: bool) -> str:
+    """Valida el parámetro format (los formatos compactos solo aplican a light=true)"""
+    formato = (formato or 'json').lower()
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no válido. Válidos: {', '.join(FORMATOS)}")
+    if formato != 'json' and not light:
+        raise HTTPException(status_code=400, detail=f"format={formato} solo está disponible con light=true")
+    if formato == 'arrow' and pa is None:
+        raise HTTPException(status_code=501, detail="format=arrow requiere pyarrow instalado en el servidor")
+    return formato
+
+
+def filas_a_columnas(
+    filas: Sequence[Sequence],
+    nombres: List[str],
+    conversiones: Optional[Dict[str, Callable]] = None
+) -> Dict[str, list]:
+    """Transpone filas (tuplas) a columnas, aplicando conversiones por columna"""
+    conversiones = conversiones or {}
+    columnas = list(zip(*filas)) if filas else [() for _ in nombres]
+    resultado = {}
+    for nombre, valores in zip(nombres, columnas):
+        convertir = conversiones.get(nombre)
+        resultado[nombre] = [convertir(v) for v in valores] if convertir else list(valores)
+    return resultado
+
+
+def dicts_a_columnas(registros: Iterable[dict], nombres: List[str]) -> Dict[str, list]:
+    """Transpone una lista de dicts a columnas"""
+    registros = list(registros)
+    return {nombre: [r.get(nombre) for r in registros] for nombre in nombres}
+
+
+def _codificar_diccionario(valores: list):
+    """Devuelve (códigos, diccionario) para una columna de texto"""
+    indices = {}
+    codigos = []
+    for v in valores:
+        if v is None:
+            codigos.append(None)
+            continue
+        codigo = indices.get(v)
+        if codigo is None:
+            codigo = indices[v] = len(indices)
+        codigos.append(codigo)
+    return codigos, list(indices)
+
+
+def a_columnar(columnas: Dict[str, list], columnas_diccionario: Iterable[str] = ()) -> dict:
+    """
+    Formato columnar JSON:
+    {"columns": {campo: [...]}, "dictionaries": {campo: [valores únicos]}}
+    
+    En las columnas con diccionario cada valor es el índice en dictionaries[campo].
+    """
+    salida = {}
+    diccionarios = {}
+    columnas_diccionario = set(columnas_diccionario)
+    for nombre, valores in columnas.items():
+        if nombre in columnas_diccionario:
+            salida[nombre], diccionarios[nombre] = _codificar_diccionario(valores)
+        else:
+            salida[nombre] = valores
+    return {"columns": salida, "dictionaries": diccionarios}
+
+
+def respuesta_arrow(
+    columnas: Dict[str, list],
+    columnas_diccionario: Iterable[str] = (),
+    metadata: Optional[dict] = None
+) -> Response:
+    """Stream IPC de Arrow; la metadata (count, total...) va en el schema"""
+    columnas_diccionario = set(columnas_diccionario)
+    arrays = []
+    for nombre, valores in columnas.items():
+        array = pa.array(valores)
+        if nombre in columnas_diccionario:
+            array = array.dictionary_encode()
+        arrays.append(array)
+    
+    tabla = pa.Table.from_arrays(arrays, names=list(columnas))
+    if metadata:
+        tabla = tabla.replace_schema_metadata(
+            {str(k): "" if v is None else str(v) for k, v in metadata.items()}
+        )
+    
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tabla.schema) as writer:
+        writer.write_table(tabla)
+    
+    return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# backend/scripts/benchmark_miteco_parser.py
+"""
+Benchmark del parser del CSV MITECO: implementación anterior (csv.DictReader
+fila a fila, con print por estación inactiva) frente al parser vectorizado
+de app/utils/miteco_csv.py (pyarrow, arrays por campo como los guarda el
+snapshot). Comprueba además que la salida es idéntica.
+
+Los print de ambos parsers se escriben en un fichero temporal real, como el
+stdout de gunicorn en producción (redirigido a fichero/pipe, con búfer): el
+coste de los logs por estación del parser anterior entra en la medición.
+
+Con --escala N se replican las filas N veces (p. ej. 24 para simular el
+feed de las últimas 24 horas).
+
+Uso:
+  python benchmark_miteco_parser.py [../data/ica-ultima-hora.csv] [--repeticiones 50] [--escala 24]
+"""
+import argparse
+import contextlib
+import csv
+import os
+import statistics
+import sys
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.utils.miteco_csv import ICA_TO_AQI, CAMPOS_DATO, parsear_csv_miteco_columnas  # noqa: E402
+
+
+def parsear_csv_miteco_filas(contenido: bytes) -> list:
+    """Parser anterior de descargar_datos_miteco (referencia)"""
+    reader = csv.DictReader(StringIO(contenido.decode('utf-8')))
+    datos = []
+    for row in reader:
+        try:
+            cod_estacion = row.get('cod_estacion', '').strip()
+            nombre = row.get('nombre', '').strip()
+            tipo_estacion = row.get('tipo', '').strip()
+            latitud_str = row.get('latitud', '').strip()
+            longitud_str = row.get('longitud', '').strip()
+            activa_str = row.get('activa', '').strip().lower()
+            fecha = row.get('fecha', '').strip()
+            indice_str = row.get('indice', '').strip()
+            debido_a = row.get('debido_a', '').strip()
+
+            if not cod_estacion or not nombre:
+                continue
+
+            activa = activa_str == 'true'
+            if not activa:
+                print(f"📝 DEBUG INACTIVA: {nombre}")
+
+            try:
+                lat = float(latitud_str) if latitud_str else None
+                lon = float(longitud_str) if longitud_str else None
+                if not activa:
+                    print(f"  📍 Coordenadas: {lat}, {lon}")
+                if not lat or not lon:
+                    continue
+                if lat < 20 or lat > 45 or lon < -20 or lon > 5:
+                    print(f"⚠️  Coordenadas sospechosas (pero aceptadas): {lat}, {lon} - {nombre}")
+            except (ValueError, TypeError):
+                continue
+
+            indice_ica = None
+            tiene_indice = False
+            if indice_str:
+                try:
+                    indice_ica = int(indice_str)
+                    tiene_indice = True
+                except ValueError:
+                    pass
+
+            datos.append({
+                'cod_estacion': cod_estacion,
+                'nombre': nombre,
+                'tipo': tipo_estacion,
+                'lat': lat,
+                'lon': lon,
+                'activa': activa,
+                'fecha': fecha if fecha else None,
+                'indice_ica': indice_ica,
+                'tiene_indice': tiene_indice,
+                'debido_a': debido_a if debido_a else None,
+                'aqi': ICA_TO_AQI.get(indice_ica, 0) if tiene_indice and indice_ica else 0,
+            })
+        except Exception:
+            continue
+    return datos
+
+
+def medir(funcion, contenido: bytes, repeticiones: int) -> list:
+    """Tiempos por ejecución, con los print a un fichero de log real (no /dev/null)"""
+    tiempos = []
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion(contenido)
+            tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parser CSV MITECO")
+    parser.add_argument('csv', nargs='?', default=str(BACKEND_DIR / 'data' / 'ica-ultima-hora.csv'))
+    parser.add_argument('--repeticiones', type=int, default=50)
+    parser.add_argument('--escala', type=int, default=1, help="Replicar las filas N veces")
+    args = parser.parse_args()
+
+    contenido = Path(args.csv).read_bytes()
+    if args.escala > 1:
+        cabecera, filas = contenido.rstrip(b'\n').split(b'\n', 1)
+        contenido = cabecera + b'\n' + (filas + b'\n') * args.escala
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        referencia = parsear_csv_miteco_filas(contenido)
+        columnas = parsear_csv_miteco_columnas(contenido)
+
+    # Filas solo para comparar (fuera de la medición); la fecha vacía se rellena
+    # con datetime.now() en el parser real: se compara sin ella
+    vectorizado = [dict(zip(CAMPOS_DATO, fila)) for fila in zip(*(columnas[c] for c in CAMPOS_DATO))]
+    if [{**d, 'fecha': d['fecha'] or None} for d in vectorizado] != referencia:
+        print("❌ La salida del parser vectorizado difiere de la referencia")
+        sys.exit(1)
+    print(f"✅ Salida idéntica: {len(referencia)} estaciones")
+
+    resultados = {
+        'fila a fila (csv.DictReader)': medir(parsear_csv_miteco_filas, contenido, args.repeticiones),
+        'vectorizado (pyarrow, columnas)': medir(parsear_csv_miteco_columnas, contenido, args.repeticiones)
+    }
+
+    print(f"\n📊 {args.csv} x{args.escala} ({len(contenido) // 1024} KB, {len(referencia)} estaciones), "
+          f"{args.repeticiones} repeticiones")
+    for nombre, tiempos in resultados.items():
+        print(f"   {nombre:32s} mediana {statistics.median(tiempos) * 1000:7.2f} ms | "
+              f"mín {min(tiempos) * 1000:7.2f} ms")
+
+    base, nuevo = (statistics.median(t) for t in resultados.values())
+    print(f"\n🚀 Speedup: x{base / nuevo:.1f}")
+
+
+if __name__ == "__main__":
+    main()
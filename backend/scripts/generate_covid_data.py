@@ -3,28 +3,29 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import random
+import sys
 
-# Coordenadas aproximadas de capitales de comunidad autónoma
+# Coordenadas aproximadas de capitales de comunidad autónoma (y su provincia)
 COMUNIDADES_COORDS = {
-    "Andalucía": {"lat": 37.3886, "lon": -5.9845, "capital": "Sevilla"},
-    "Aragón": {"lat": 41.6488, "lon": -0.8891, "capital": "Zaragoza"},
-    "Asturias": {"lat": 43.3614, "lon": -5.8458, "capital": "Oviedo"},
-    "Islas Baleares": {"lat": 39.5696, "lon": 2.6502, "capital": "Palma"},
-    "Canarias": {"lat": 28.1235, "lon": -15.4134, "capital": "Las Palmas"},
-    "Cantabria": {"lat": 43.4623, "lon": -3.8044, "capital": "Santander"},
-    "Castilla-La Mancha": {"lat": 39.8628, "lon": -4.0245, "capital": "Toledo"},
-    "Castilla y León": {"lat": 41.6523, "lon": -4.7245, "capital": "Valladolid"},
-    "Cataluña": {"lat": 41.3851, "lon": 2.1734, "capital": "Barcelona"},
-    "Comunidad Valenciana": {"lat": 39.4699, "lon": -0.3763, "capital": "Valencia"},
-    "Extremadura": {"lat": 38.9160, "lon": -6.3438, "capital": "Mérida"},
-    "Galicia": {"lat": 42.8782, "lon": -8.5449, "capital": "Santiago"},
-    "Madrid": {"lat": 40.4168, "lon": -3.7038, "capital": "Madrid"},
-    "Murcia": {"lat": 37.9924, "lon": -1.1307, "capital": "Murcia"},
-    "Navarra": {"lat": 42.8125, "lon": -1.6432, "capital": "Pamplona"},
-    "País Vasco": {"lat": 42.8464, "lon": -2.6724, "capital": "Vitoria"},
-    "La Rioja": {"lat": 42.4627, "lon": -2.4449, "capital": "Logroño"},
-    "Ceuta": {"lat": 35.8891, "lon": -5.3167, "capital": "Ceuta"},
-    "Melilla": {"lat": 35.2923, "lon": -2.9475, "capital": "Melilla"}
+    "Andalucía": {"lat": 37.3886, "lon": -5.9845, "capital": "Sevilla", "provincia": "Sevilla"},
+    "Aragón": {"lat": 41.6488, "lon": -0.8891, "capital": "Zaragoza", "provincia": "Zaragoza"},
+    "Asturias": {"lat": 43.3614, "lon": -5.8458, "capital": "Oviedo", "provincia": "Asturias"},
+    "Islas Baleares": {"lat": 39.5696, "lon": 2.6502, "capital": "Palma", "provincia": "Illes Balears"},
+    "Canarias": {"lat": 28.1235, "lon": -15.4134, "capital": "Las Palmas", "provincia": "Las Palmas"},
+    "Cantabria": {"lat": 43.4623, "lon": -3.8044, "capital": "Santander", "provincia": "Cantabria"},
+    "Castilla-La Mancha": {"lat": 39.8628, "lon": -4.0245, "capital": "Toledo", "provincia": "Toledo"},
+    "Castilla y León": {"lat": 41.6523, "lon": -4.7245, "capital": "Valladolid", "provincia": "Valladolid"},
+    "Cataluña": {"lat": 41.3851, "lon": 2.1734, "capital": "Barcelona", "provincia": "Barcelona"},
+    "Comunidad Valenciana": {"lat": 39.4699, "lon": -0.3763, "capital": "Valencia", "provincia": "Valencia"},
+    "Extremadura": {"lat": 38.9160, "lon": -6.3438, "capital": "Mérida", "provincia": "Badajoz"},
+    "Galicia": {"lat": 42.8782, "lon": -8.5449, "capital": "Santiago", "provincia": "A Coruña"},
+    "Madrid": {"lat": 40.4168, "lon": -3.7038, "capital": "Madrid", "provincia": "Madrid"},
+    "Murcia": {"lat": 37.9924, "lon": -1.1307, "capital": "Murcia", "provincia": "Murcia"},
+    "Navarra": {"lat": 42.8125, "lon": -1.6432, "capital": "Pamplona", "provincia": "Navarra"},
+    "País Vasco": {"lat": 42.8464, "lon": -2.6724, "capital": "Vitoria", "provincia": "Araba/Álava"},
+    "La Rioja": {"lat": 42.4627, "lon": -2.4449, "capital": "Logroño", "provincia": "La Rioja"},
+    "Ceuta": {"lat": 35.8891, "lon": -5.3167, "capital": "Ceuta", "provincia": "Ceuta"},
+    "Melilla": {"lat": 35.2923, "lon": -2.9475, "capital": "Melilla", "provincia": "Melilla"}
 }
 
 # Población aproximada (en miles) para calcular casos
@@ -66,7 +67,7 @@ def generate_covid_data(start_date="2023-01-01", days=90):
             data.append({
                 "fecha": fecha.strftime("%Y-%m-%d"),
                 "comunidad_autonoma": comunidad,
-                "provincia": coords["capital"],
+                "provincia": coords["provincia"],
                 "casos_confirmados": casos,
                 "ingresos_uci": ingresos_uci,
                 "fallecidos": fallecidos,
@@ -77,29 +78,6 @@ def generate_covid_data(start_date="2023-01-01", days=90):
     
     return pd.DataFrame(data)
 
-def generate_sql_inserts(df):
-    """Genera sentencias SQL INSERT a partir del DataFrame"""
-    
-    sql_lines = []
-    sql_lines.append("-- INSERT de datos COVID generados automáticamente")
-    sql_lines.append("DELETE FROM covid_cases;  -- Borra datos existentes")
-    sql_lines.append("")
-    
-    for _, row in df.iterrows():
-        sql = f"""INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados, ingresos_uci, fallecidos, altas, geom) VALUES (
-    '{row['fecha']}',
-    '{row['comunidad_autonoma']}',
-    '{row['provincia']}',
-    {row['casos_confirmados']},
-    {row['ingresos_uci']},
-    {row['fallecidos']},
-    {row['altas']},
-    ST_SetSRID(ST_MakePoint({row['lon']}, {row['lat']}), 4326)
-);"""
-        sql_lines.append(sql)
-    
-    return "\n".join(sql_lines)
-
 if __name__ == "__main__":
     print("Generando datos COVID para España...")
     
@@ -115,11 +93,13 @@ if __name__ == "__main__":
     df.to_csv("covid_data_spain.csv", index=False)
     print("\nDatos guardados en: covid_data_spain.csv")
     
-    # Generar SQL
-    sql_content = generate_sql_inserts(df)
-    with open("covid_data_inserts.sql", "w", encoding="utf-8") as f:
-        f.write(sql_content)
-    print("SQL generado en: covid_data_inserts.sql")
+    # Carga directa en BD con COPY (python generate_covid_data.py --load)
+    if "--load" in sys.argv:
+        from load_covid_data import get_db_config, load_covid_dataframe
+        afectadas = load_covid_dataframe(df, get_db_config(), replace=True)
+        print(f"Cargados en covid_cases: {afectadas} registros")
+    else:
+        print("Para cargar en BD: python load_covid_data.py covid_data_spain.csv --replace")
     
     # Resumen por comunidad
     print("\n📊 Resumen por comunidad (primer día):")
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import random
+import sys
 import json
 
 # Coordenadas de capitales de provincia
@@ -138,29 +139,6 @@ def generate_covid_data_provincias(start_date="2023-01-01", days=30):
     
     return pd.DataFrame(data)
 
-def generate_sql_inserts(df):
-    """Genera sentencias SQL INSERT a partir del DataFrame"""
-    
-    sql_lines = []
-    sql_lines.append("-- INSERT de datos COVID generados automáticamente")
-    sql_lines.append("DELETE FROM covid_cases;  -- Borra datos existentes")
-    sql_lines.append("")
-    
-    for _, row in df.iterrows():
-        sql = f"""INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados, ingresos_uci, fallecidos, altas, geom) VALUES (
-    '{row['fecha']}',
-    '{row['comunidad_autonoma']}',
-    '{row['provincia']}',
-    {row['casos_confirmados']},
-    {row['ingresos_uci']},
-    {row['fallecidos']},
-    {row['altas']},
-    ST_SetSRID(ST_MakePoint({row['lon']}, {row['lat']}), 4326)
-);"""
-        sql_lines.append(sql)
-    
-    return "\n".join(sql_lines)
-
 if __name__ == "__main__":
     print("Generando datos COVID para España...")
     
@@ -176,11 +154,13 @@ if __name__ == "__main__":
     df.to_csv("covid_data_spain.csv", index=False)
     print("\nDatos guardados en: covid_data_spain.csv")
     
-    # Generar SQL
-    sql_content = generate_sql_inserts(df)
-    with open("covid_data_inserts.sql", "w", encoding="utf-8") as f:
-        f.write(sql_content)
-    print("SQL generado en: covid_data_inserts.sql")
+    # Carga directa en BD con COPY (python generate_covid_data_provincias.py --load)
+    if "--load" in sys.argv:
+        from load_covid_data import get_db_config, load_covid_dataframe
+        afectadas = load_covid_dataframe(df, get_db_config(), replace=True)
+        print(f"Cargados en covid_cases: {afectadas} registros")
+    else:
+        print("Para cargar en BD: python load_covid_data.py covid_data_spain.csv --replace")
     
     # Resumen por comunidad
     print("\n📊 Resumen por comunidad (primer día):")
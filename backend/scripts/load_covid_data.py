@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# backend/scripts/load_covid_data.py
+"""
+Carga masiva de datos COVID en covid_cases con COPY FROM STDIN.
+
+Flujo:
+  1. COPY del CSV/DataFrame a una tabla staging temporal
+  2. Un único INSERT ... SELECT que deriva geom (ST_MakePoint) y los
+     códigos INE (join con geo_nombres) y hace upsert por (fecha,
+     comunidad, provincia); las filas sin provincia (nivel CCAA)
+     conservan provincia NULL y chocan por (fecha, comunidad, '')
+
+Los rollups diarios y la versión del dataset se refrescan solos mediante
+los triggers por sentencia de covid_cases (ver docker/init-db.sql).
+
+Uso:
+  python load_covid_data.py ../data/covid_data_spain.csv [--replace]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import psycopg2
+
+# Columnas aceptadas en el CSV de entrada (mismo formato que covid_data_spain.csv)
+COLUMNAS_CSV = [
+    'fecha', 'comunidad_autonoma', 'provincia', 'casos_confirmados',
+    'ingresos_uci', 'fallecidos', 'altas', 'lat', 'lon'
+]
+
+STAGING_DDL = """
+    CREATE TEMP TABLE covid_staging (
+        fecha DATE,
+        comunidad_autonoma VARCHAR(100),
+        provincia VARCHAR(100),
+        casos_confirmados INTEGER,
+        ingresos_uci INTEGER,
+        fallecidos INTEGER,
+        altas INTEGER,
+        lat DOUBLE PRECISION,
+        lon DOUBLE PRECISION
+    ) ON COMMIT DROP
+"""
+
+UPSERT_SQL = """
+    INSERT INTO covid_cases
+        (fecha, comunidad_autonoma, provincia, casos_confirmados,
+         ingresos_uci, fallecidos, altas, geom, codigo_ccaa, codigo_provincia)
+    SELECT DISTINCT ON (s.fecha, s.comunidad_autonoma, COALESCE(s.provincia, ''))
+        s.fecha,
+        s.comunidad_autonoma,
+        s.provincia,
+        s.casos_confirmados,
+        s.ingresos_uci,
+        s.fallecidos,
+        s.altas,
+        CASE WHEN s.lat IS NOT NULL AND s.lon IS NOT NULL
+             THEN ST_SetSRID(ST_MakePoint(s.lon, s.lat), 4326)
+        END,
+        -- Códigos INE resueltos aquí en bloque (el trigger por fila solo actúa si llegan a NULL)
+        COALESCE(nc.codigo, gp.codigo_ccaa),
+        np.codigo
+    FROM covid_staging s
+    LEFT JOIN geo_nombres np ON np.nivel = 'provincia' AND np.variante = lower(trim(s.provincia))
+    LEFT JOIN geo_nombres nc ON nc.nivel = 'ccaa' AND nc.variante = lower(trim(s.comunidad_autonoma))
+    LEFT JOIN geo_provincias gp ON gp.codigo = np.codigo
+    WHERE s.fecha IS NOT NULL AND s.comunidad_autonoma IS NOT NULL
+    ORDER BY s.fecha, s.comunidad_autonoma, COALESCE(s.provincia, '')
+    -- Misma expresión que el índice único uq_covid_fecha_provincia (NULL-safe)
+    ON CONFLICT (fecha, comunidad_autonoma, (COALESCE(provincia, ''))) DO UPDATE SET
+        casos_confirmados = EXCLUDED.casos_confirmados,
+        ingresos_uci = EXCLUDED.ingresos_uci,
+        fallecidos = EXCLUDED.fallecidos,
+        altas = EXCLUDED.altas,
+        geom = EXCLUDED.geom,
+        codigo_ccaa = EXCLUDED.codigo_ccaa,
+        codigo_provincia = EXCLUDED.codigo_provincia
+"""
+
+
+def get_db_config():
+    """Obtener configuración de base de datos desde .env en raíz del proyecto"""
+    env_path = Path(__file__).parent.parent.parent / '.env'
+    env_vars = {}
+
+    if env_path.exists():
+        try:
+            with open(env_path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '=' in line:
+                        key, value = line.split('=', 1)
+                        env_vars[key.strip()] = value.strip()
+        except Exception as e:
+            print(f"⚠️  Error leyendo .env: {e}")
+            env_vars = {}
+    else:
+        print("⚠️  No se encontró .env, usando valores por defecto")
+
+    return {
+        'host': 'localhost',
+        'port': 5440,
+        'database': env_vars.get('DB_NAME', 'geodata_prod'),
+        'user': env_vars.get('DB_USER', 'geodata'),
+        'password': env_vars.get('DB_PASSWORD', 'geodata')
+    }
+
+
+def _copy_y_upsert(conn, stream, columnas, replace=False, header=False):
+    """COPY de un stream CSV a staging + upsert set-based. Devuelve filas afectadas."""
+    with conn.cursor() as cur:
+        cur.execute(STAGING_DDL)
+
+        cur.copy_expert(
+            f"COPY covid_staging ({', '.join(columnas)}) FROM STDIN "
+            f"WITH (FORMAT csv, HEADER {'true' if header else 'false'})",
+            stream
+        )
+        cur.execute("SELECT COUNT(*) FROM covid_staging")
+        staged = cur.fetchone()[0]
+        print(f"   📥 {staged} filas copiadas a staging")
+
+        if replace:
+            cur.execute("DELETE FROM covid_cases")
+            print(f"   🗑️ {cur.rowcount} filas anteriores eliminadas")
+
+        # La clave del upsert (uq_covid_fecha_provincia) está en docker/init-db.sql
+        cur.execute(UPSERT_SQL)
+        afectadas = cur.rowcount
+
+    conn.commit()
+
+    # Estadísticas frescas para el planificador tras una carga grande
+    old_autocommit = conn.autocommit
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE covid_cases")
+    conn.autocommit = old_autocommit
+
+    return afectadas
+
+
+def load_covid_dataframe(df: pd.DataFrame, db_config: dict, replace: bool = False) -> int:
+    """Carga un DataFrame con las columnas de COLUMNAS_CSV en covid_cases"""
+    faltan = [c for c in COLUMNAS_CSV if c not in df.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas en el DataFrame: {faltan}")
+
+    buffer = io.StringIO()
+    df[COLUMNAS_CSV].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        return _copy_y_upsert(conn, buffer, COLUMNAS_CSV, replace=replace)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def load_covid_csv(csv_path, db_config: dict, replace: bool = False) -> int:
+    """Carga un CSV (con cabecera) en covid_cases sin pasarlo por pandas"""
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        cabecera = [c.strip() for c in f.readline().split(',')]
+        desconocidas = [c for c in cabecera if c not in COLUMNAS_CSV]
+        if desconocidas:
+            raise ValueError(f"Columnas no reconocidas en el CSV: {desconocidas}")
+
+        conn = psycopg2.connect(**db_config)
+        try:
+            # El stream ya está posicionado tras la cabecera
+            return _copy_y_upsert(conn, f, cabecera, replace=replace)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga masiva de datos COVID con COPY")
+    parser.add_argument('csv', help="CSV con columnas: " + ",".join(COLUMNAS_CSV))
+    parser.add_argument('--replace', action='store_true',
+                        help="Borrar covid_cases antes de cargar (misma transacción)")
+    args = parser.parse_args()
+
+    csv_path = Path(args.csv)
+    if not csv_path.exists():
+        print(f"❌ Archivo no encontrado: {csv_path}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"📊 CARGA COVID: {csv_path}")
+    print("=" * 60)
+
+    inicio = time.perf_counter()
+    try:
+        afectadas = load_covid_csv(csv_path, get_db_config(), replace=args.replace)
+    except Exception as e:
+        print(f"\n💥 ERROR: {e}")
+        sys.exit(1)
+
+    print(f"\n✅ {afectadas} filas insertadas/actualizadas en {time.perf_counter() - inicio:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
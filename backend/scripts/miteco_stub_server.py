@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# backend/scripts/miteco_stub_server.py
+"""
+Servidor local que imita https://ica.miteco.es/datos/ para probar el
+refresco del snapshot sin red (MITECO_BASE_URL=http://localhost:8765).
+
+Sirve los tres feeds a partir de data/ica-ultima-hora.csv:
+  - ica-ultima-hora.csv       el fichero tal cual
+  - ica-ultimas-24-horas.csv  24 copias con la fecha retrasada 0-23 horas
+  - ica-previsto.csv          una copia con la fecha del día siguiente
+
+Con --latencia cada respuesta se retrasa N segundos, para comprobar que un
+refresco tarda lo que el feed más lento y no la suma de los tres.
+
+Uso:
+  python miteco_stub_server.py [--puerto 8765] [--latencia 1.0] [--fallar forecast]
+"""
+import argparse
+import csv
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+FEEDS = {
+    'last_hour': 'ica-ultima-hora.csv',
+    'last_24h': 'ica-ultimas-24-horas.csv',
+    'forecast': 'ica-previsto.csv'
+}
+
+
+def desplazar_fechas(contenido: str, desplazamientos: list) -> bytes:
+    """Repite las filas una vez por desplazamiento (en horas) de la columna fecha"""
+    filas = list(csv.reader(StringIO(contenido)))
+    cabecera, datos = filas[0], filas[1:]
+    col_fecha = cabecera.index('fecha')
+
+    salida = StringIO()
+    writer = csv.writer(salida, lineterminator='\n')
+    writer.writerow(cabecera)
+    for horas in desplazamientos:
+        for fila in datos:
+            fila = list(fila)
+            if fila[col_fecha]:
+                fecha = datetime.fromisoformat(fila[col_fecha]) + timedelta(hours=horas)
+                fila[col_fecha] = fecha.isoformat()
+            writer.writerow(fila)
+    return salida.getvalue().encode('utf-8')
+
+
+def construir_feeds(csv_path: Path) -> dict:
+    contenido = csv_path.read_text(encoding='utf-8')
+    return {
+        FEEDS['last_hour']: contenido.encode('utf-8'),
+        FEEDS['last_24h']: desplazar_fechas(contenido, list(range(-23, 1))),
+        FEEDS['forecast']: desplazar_fechas(contenido, [24])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de los feeds MITECO ICA")
+    parser.add_argument('csv', nargs='?', default=str(BACKEND_DIR / 'data' / 'ica-ultima-hora.csv'))
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.0, help="Segundos de espera por respuesta")
+    parser.add_argument('--fallar', choices=list(FEEDS), action='append', default=[],
+                        help="Feed que responde 503 (se puede repetir)")
+    args = parser.parse_args()
+
+    feeds = construir_feeds(Path(args.csv))
+    fallar = {FEEDS[f] for f in args.fallar}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            nombre = self.path.rsplit('/', 1)[-1]
+            time.sleep(args.latencia)
+            if nombre in fallar:
+                self.send_error(503)
+                return
+            contenido = feeds.get(nombre)
+            if contenido is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Length', str(len(contenido)))
+            self.end_headers()
+            self.wfile.write(contenido)
+
+        def log_message(self, formato, *valores):
+            print(f"📄 {self.address_string()} {formato % valores}")
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', args.puerto), Handler)
+    print(f"🌐 Feeds MITECO de prueba en http://127.0.0.1:{args.puerto} "
+          f"({', '.join(f'{n}: {len(c) // 1024} KB' for n, c in feeds.items())})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 # /home/bbvedf/prog/geo-data/backend/scripts/process_elections.py
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+import hashlib
+import io
 import os
 from pathlib import Path
 import sys
@@ -68,43 +69,131 @@ def get_excel_path():
         else:
             raise FileNotFoundError(f"Archivo no encontrado: {user_path}")
 
-def process_excel_to_postgres(excel_path, db_config, limit=None):
-    """Procesa Excel del Ministerio y carga a PostgreSQL"""
-    
-    print(f"🎯 Configuración DB: {db_config['host']}:{db_config['port']}/{db_config['database']}")
+# Partidos principales (14) y nombres alternativos con los que pueden aparecer
+# (ya normalizados con clean_column_name)
+PARTIDOS_PRINCIPALES = [
+    'pp', 'psoe', 'vox', 'sumar', 'erc', 
+    'jxcat_junts', 'eh_bildu', 'eaj_pnv', 
+    'bng', 'cca', 'upn', 'pacma', 'cup_pr', 'fo'
+]
+
+PARTIDOS_ALIASES = {
+    'jxcat_junts': ['jxcat_junts', 'jxcat___junts', 'junts', 'jxcat'],
+    'eaj_pnv': ['eaj_pnv', 'pnv'],
+    'bng': ['bng', 'bloque_nacionalista_galego'],
+    'cca': ['cca', 'coalición_canaria'],
+    'upn': ['upn', 'unión_del_pueblo_navarro'],
+    'pacma': ['pacma', 'partido_animalista'],
+    'cup_pr': ['cup_pr', 'cup'],
+    'fo': ['fo', 'frente_obrero']
+}
+
+COL_MAPPING = {
+    'nombre_municipio': ['nombre_de_municipio', 'municipio'],
+    'nombre_provincia': ['nombre_de_provincia', 'provincia'],
+    'nombre_comunidad': ['nombre_de_comunidad', 'comunidad'],
+    'poblacion': ['población', 'poblacion', 'habitantes']
+}
+
+COLUMNAS_BASE = {
+    'num_mesas': 'número_de_mesas',
+    'censo': 'total_censo_electoral',
+    'votantes': 'total_votantes',
+    'votos_validos': 'votos_válidos',
+    'votos_candidaturas': 'votos_a_candidaturas',
+    'votos_blanco': 'votos_en_blanco',
+    'votos_nulos': 'votos_nulos'
+}
+
+MUNICIPIOS_COLUMNAS = [
+    'codigo_ine', 'nombre_municipio', 'nombre_provincia', 'nombre_comunidad', 'poblacion'
+]
+
+ELECCIONES_COLUMNAS = (
+    ['municipio_ine'] + list(COLUMNAS_BASE) + PARTIDOS_PRINCIPALES +
+    ['participacion', 'partido_ganador', 'votos_ganador', 'total_votos_partidos']
+)
+
+# Caché del Excel ya parseado (Parquet), indexada por checksum del fichero
+PARSE_CACHE_DIR = Path(__file__).parent.parent / 'data' / '.cache'
+
+def clean_column_name(col):
+    if isinstance(col, str):
+        return col.strip().lower().replace(' ', '_').replace('-', '_').replace('.', '')
+    elif isinstance(col, (int, float)):
+        return f'col_{int(col)}'
+    else:
+        return str(col)
+
+def file_sha256(path):
+    """Checksum SHA-256 del fichero fuente"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+def read_excel_cached(excel_path):
+    """
+    Lee el Excel del Ministerio con columnas normalizadas.
     
-    # 1. Leer Excel (saltar primeras 5 filas, fila 6 son encabezados)
-    print("📥 Leyendo Excel...")
-    try:
-        df = pd.read_excel(
-            excel_path, 
-            skiprows=5,
-            dtype={'Código de Municipio': str}
-        )
-        print(f"   ✅ Leídas {len(df)} filas del Excel")
-    except Exception as e:
-        print(f"❌ Error leyendo Excel: {e}")
-        return 0, 0
+    El resultado se guarda en Parquet con el checksum del fichero en el
+    nombre: si el Excel no cambia, las siguientes ejecuciones no lo parsean.
+    """
+    checksum = file_sha256(excel_path)
+    cache_path = PARSE_CACHE_DIR / f"elecciones_{checksum[:16]}.parquet"
     
-    # 2. Limpiar nombres de columnas
-    def clean_column_name(col):
-        if isinstance(col, str):
-            return col.strip().lower().replace(' ', '_').replace('-', '_').replace('.', '')
-        elif isinstance(col, (int, float)):
-            return f'col_{int(col)}'
-        else:
-            return str(col)
+    if cache_path.exists():
+        try:
+            df = pd.read_parquet(cache_path)
+            print(f"   ⚡ Excel ya parseado, usando caché: {cache_path.name}")
+            return df
+        except Exception as e:
+            print(f"   ⚠️  Caché ilegible ({e}), se vuelve a leer el Excel")
     
+    df = pd.read_excel(
+        excel_path, 
+        skiprows=5,
+        dtype={'Código de Municipio': str}
+    )
     df.columns = [clean_column_name(col) for col in df.columns]
-    print(f"   ✅ Columnas encontradas: {len(df.columns)}")
-    print(f"   📋 Primeras columnas: {list(df.columns)[:15]}...")
     
-    # 3. Limitar para prueba (opcional)
-    if limit:
-        df = df.head(limit)
-        print(f"   ⚡ Modo prueba: limitando a {limit} registros")
+    try:
+        PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        print(f"   💾 Caché Parquet guardada: {cache_path.name}")
+    except Exception as e:
+        # Sin pyarrow o sin permisos: se sigue sin caché
+        print(f"   ⚠️  No se pudo guardar la caché Parquet: {e}")
     
-    # 4. Crear código INE único (provincia + municipio)
+    return df
+
+def resolve_column(df, candidates):
+    """Primera columna candidata presente en el DataFrame (o None)"""
+    for possible in candidates:
+        if possible in df.columns:
+            return possible
+    return None
+
+def numeric_column(df, col):
+    """Columna numérica entera con NaN -> 0 (Series de ceros si no existe)"""
+    if col is None or col not in df.columns:
+        return pd.Series(0, index=df.index, dtype='int64')
+    serie = df[col]
+    if serie.dtype == object:
+        serie = serie.astype(str).str.replace('.', '', regex=False)
+    return pd.to_numeric(serie, errors='coerce').fillna(0).astype('int64')
+
+def text_column(df, col, default):
+    if col is None:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df[col].where(df[col].notna(), default)
+
+def prepare_frames(df):
+    """Transforma el Excel normalizado en los DataFrames de municipios y elecciones"""
+    # Código INE único (provincia + municipio)
     cod_prov_col = None
     cod_mun_col = None
     for col in df.columns:
@@ -114,157 +203,84 @@ def process_excel_to_postgres(excel_path, db_config, limit=None):
             cod_mun_col = col
     
     if cod_prov_col and cod_mun_col:
-        df['codigo_ine'] = df[cod_prov_col].astype(str).str.zfill(2) + \
-                          df[cod_mun_col].astype(str).str.zfill(3)
+        codigo_ine = df[cod_prov_col].astype(str).str.zfill(2) + \
+                     df[cod_mun_col].astype(str).str.zfill(3)
         print(f"   ✅ Código INE creado usando: {cod_prov_col}, {cod_mun_col}")
     else:
         print("⚠️  No se encontraron columnas de código, usando índice")
-        df['codigo_ine'] = df.index.astype(str).str.zfill(5)
+        codigo_ine = pd.Series(df.index.astype(str).str.zfill(5), index=df.index)
     
-    # 5. PREPARAR DATOS PARA TABLA MUNICIPIOS
-    print("\n🧹 Preparando datos de municipios...")
-    municipios_data = []
+    # Municipios
+    municipios = pd.DataFrame({
+        'codigo_ine': codigo_ine,
+        'nombre_municipio': text_column(df, resolve_column(df, COL_MAPPING['nombre_municipio']), 'Desconocido'),
+        'nombre_provincia': text_column(df, resolve_column(df, COL_MAPPING['nombre_provincia']), 'Desconocida'),
+        'nombre_comunidad': text_column(df, resolve_column(df, COL_MAPPING['nombre_comunidad']), 'Desconocida'),
+        'poblacion': numeric_column(df, resolve_column(df, COL_MAPPING['poblacion']))
+    })
     
-    col_mapping = {
-        'nombre_municipio': ['nombre_de_municipio', 'municipio'],
-        'nombre_provincia': ['nombre_de_provincia', 'provincia'],
-        'nombre_comunidad': ['nombre_de_comunidad', 'comunidad'],
-        'poblacion': ['población', 'poblacion', 'habitantes']
-    }
+    # Elecciones: columnas base y votos por partido (resolución de aliases una sola vez)
+    elecciones = pd.DataFrame({'municipio_ine': codigo_ine})
+    for destino, origen in COLUMNAS_BASE.items():
+        elecciones[destino] = numeric_column(df, origen)
     
-    for _, row in df.iterrows():
-        nombre_municipio = None
-        for possible in col_mapping['nombre_municipio']:
-            if possible in df.columns:
-                nombre_municipio = row[possible]
-                break
-        
-        nombre_provincia = None
-        for possible in col_mapping['nombre_provincia']:
-            if possible in df.columns:
-                nombre_provincia = row[possible]
-                break
-        
-        nombre_comunidad = None
-        for possible in col_mapping['nombre_comunidad']:
-            if possible in df.columns:
-                nombre_comunidad = row[possible]
-                break
-        
-        poblacion = None
-        for possible in col_mapping['poblacion']:
-            if possible in df.columns and possible in row:
-                poblacion_val = row[possible]
-                if isinstance(poblacion_val, str):
-                    poblacion_val = poblacion_val.replace('.', '')
-                poblacion = int(float(poblacion_val)) if pd.notna(poblacion_val) else 0
-                break
-        
-        municipios_data.append({
-            'codigo_ine': row['codigo_ine'],
-            'nombre_municipio': nombre_municipio or 'Desconocido',
-            'nombre_provincia': nombre_provincia or 'Desconocida',
-            'nombre_comunidad': nombre_comunidad or 'Desconocida',
-            'poblacion': poblacion or 0,
-            'lat': None,
-            'lon': None
-        })
+    for partido in PARTIDOS_PRINCIPALES:
+        origen = resolve_column(df, PARTIDOS_ALIASES.get(partido, [partido]))
+        elecciones[partido] = numeric_column(df, origen)
     
-    print(f"   ✅ {len(municipios_data)} municipios preparados")
+    votos = elecciones[PARTIDOS_PRINCIPALES]
+    hay_votos = votos.max(axis=1) > 0
+    elecciones['partido_ganador'] = votos.idxmax(axis=1).where(hay_votos, 'sin_datos')
+    elecciones['votos_ganador'] = votos.max(axis=1).where(hay_votos, 0)
+    elecciones['total_votos_partidos'] = votos.sum(axis=1)
     
-    # 6. PREPARAR DATOS PARA TABLA ELECCIONES
-    print("\n🗳️ Preparando datos electorales...")
-    elecciones_data = []
+    censo = elecciones['censo']
+    elecciones['participacion'] = (
+        (elecciones['votantes'] / censo.where(censo > 0) * 100).fillna(0).round(2)
+    )
     
-    # Partidos principales (14 como acordamos)
-    partidos_principales = [
-        'pp', 'psoe', 'vox', 'sumar', 'erc', 
-        'jxcat_junts', 'eh_bildu', 'eaj_pnv', 
-        'bng', 'cca', 'upn', 'pacma', 'cup_pr', 'fo'
-    ]
+    return municipios, elecciones[ELECCIONES_COLUMNAS]
+
+def copy_to_staging(cur, df, tabla, columnas):
+    """COPY FROM STDIN de un DataFrame a una tabla temporal con la estructura de la tabla destino"""
+    cur.execute(f"""
+        CREATE TEMP TABLE {tabla}_staging ON COMMIT DROP AS
+        SELECT {', '.join(columnas)} FROM {tabla} WITH NO DATA
+    """)
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, columns=columnas)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY {tabla}_staging ({', '.join(columnas)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def process_excel_to_postgres(excel_path, db_config, limit=None):
+    """Procesa Excel del Ministerio y carga a PostgreSQL"""
     
-    # Mapear nombres alternativos que puedan aparecer
-    partidos_aliases = {
-        'jxcat_junts': ['jxcat_junts', 'junts', 'jxcat'],
-        'eaj_pnv': ['eaj_pnv', 'pnv'],
-        'bng': ['bng', 'bloque_nacionalista_galego'],
-        'cca': ['cca', 'coalición_canaria'],
-        'upn': ['upn', 'unión_del_pueblo_navarro'],
-        'pacma': ['pacma', 'partido_animalista'],
-        'cup_pr': ['cup_pr', 'cup'],
-        'fo': ['fo', 'frente_obrero']
-    }
+    print(f"🎯 Configuración DB: {db_config['host']}:{db_config['port']}/{db_config['database']}")
     
-    for idx, row in df.iterrows():
-        # Buscar votos para cada partido (con aliases)
-        votos_partidos = {}
-        
-        for partido in partidos_principales:
-            votos = 0
-            # Intentar con el nombre directo
-            if partido in df.columns:
-                votos = int(row[partido]) if pd.notna(row[partido]) else 0
-            else:
-                # Buscar en aliases
-                for alias in partidos_aliases.get(partido, []):
-                    if alias in df.columns:
-                        votos = int(row[alias]) if pd.notna(row[alias]) else 0
-                        break
-            
-            votos_partidos[partido] = votos
-        
-        # Encontrar partido ganador
-        if votos_partidos:
-            # Filtrar partidos con 0 votos
-            votos_no_cero = {k: v for k, v in votos_partidos.items() if v > 0}
-            if votos_no_cero:
-                partido_ganador = max(votos_no_cero, key=votos_no_cero.get)
-                votos_ganador = votos_no_cero[partido_ganador]
-            else:
-                partido_ganador = 'sin_datos'
-                votos_ganador = 0
-        else:
-            partido_ganador = 'sin_datos'
-            votos_ganador = 0
-        
-        # Calcular participación
-        censo = row['total_censo_electoral'] if pd.notna(row['total_censo_electoral']) else 0
-        votantes = row['total_votantes'] if pd.notna(row['total_votantes']) else 0
-        participacion = (votantes / censo * 100) if censo > 0 else 0
-        
-        elecciones_data.append({
-            'municipio_ine': row['codigo_ine'],
-            # Datos base
-            'num_mesas': int(row['número_de_mesas']) if pd.notna(row['número_de_mesas']) else 0,
-            'censo': int(censo),
-            'votantes': int(votantes),
-            'votos_validos': int(row['votos_válidos']) if pd.notna(row['votos_válidos']) else 0,
-            'votos_candidaturas': int(row['votos_a_candidaturas']) if pd.notna(row['votos_a_candidaturas']) else 0,
-            'votos_blanco': int(row['votos_en_blanco']) if pd.notna(row['votos_en_blanco']) else 0,
-            'votos_nulos': int(row['votos_nulos']) if pd.notna(row['votos_nulos']) else 0,
-            # Partidos (solo 14 principales)
-            'pp': votos_partidos.get('pp', 0),
-            'psoe': votos_partidos.get('psoe', 0),
-            'vox': votos_partidos.get('vox', 0),
-            'sumar': votos_partidos.get('sumar', 0),
-            'erc': votos_partidos.get('erc', 0),
-            'jxcat_junts': votos_partidos.get('jxcat_junts', 0),
-            'eh_bildu': votos_partidos.get('eh_bildu', 0),
-            'eaj_pnv': votos_partidos.get('eaj_pnv', 0),
-            'bng': votos_partidos.get('bng', 0),
-            'cca': votos_partidos.get('cca', 0),
-            'upn': votos_partidos.get('upn', 0),
-            'pacma': votos_partidos.get('pacma', 0),
-            'cup_pr': votos_partidos.get('cup_pr', 0),
-            'fo': votos_partidos.get('fo', 0),
-            # Campos calculados
-            'participacion': round(participacion, 2),
-            'partido_ganador': partido_ganador,
-            'votos_ganador': votos_ganador,
-            'total_votos_partidos': sum(votos_partidos.values())
-        })
+    # 1. Leer Excel (saltar primeras 5 filas, fila 6 son encabezados) o su caché Parquet
+    print("📥 Leyendo Excel...")
+    try:
+        df = read_excel_cached(excel_path)
+        print(f"   ✅ Leídas {len(df)} filas del Excel")
+    except Exception as e:
+        print(f"❌ Error leyendo Excel: {e}")
+        return 0, 0
+    
+    print(f"   ✅ Columnas encontradas: {len(df.columns)}")
+    print(f"   📋 Primeras columnas: {list(df.columns)[:15]}...")
     
-    print(f"   ✅ {len(elecciones_data)} resultados electorales preparados")
+    # 2. Limitar para prueba (opcional)
+    if limit:
+        df = df.head(limit)
+        print(f"   ⚡ Modo prueba: limitando a {limit} registros")
+    
+    # 3. Transformaciones vectorizadas
+    print("\n🧹 Preparando municipios y resultados electorales...")
+    municipios, elecciones = prepare_frames(df)
+    print(f"   ✅ {len(municipios)} municipios y {len(elecciones)} resultados preparados")
     
     # 7. CONECTAR A POSTGRESQL Y CARGAR DATOS
     print("\n💾 Conectando a PostgreSQL...")
@@ -294,6 +310,41 @@ def process_excel_to_postgres(excel_path, db_config, limit=None):
         """)
         print("   ✅ Tabla municipios_espana creada/verificada")
         
+        # Geometría derivada de lat/lon (se recalcula sola al actualizar coordenadas)
+        cur.execute("""
+            ALTER TABLE municipios_espana
+            ADD COLUMN IF NOT EXISTS geom GEOMETRY(Point, 4326)
+            GENERATED ALWAYS AS (
+                CASE WHEN lat IS NOT NULL AND lon IS NOT NULL
+                     THEN ST_SetSRID(ST_MakePoint(lon::double precision, lat::double precision), 4326)
+                END
+            ) STORED
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_municipios_geom
+            ON municipios_espana USING GIST(geom)
+        """)
+        print("   ✅ Columna geom + índice GIST creados/verificados")
+        
+        # Códigos INE enteros para filtrar por igualdad (provincia = codigo_ine / 1000)
+        cur.execute("""
+            ALTER TABLE municipios_espana
+            ADD COLUMN IF NOT EXISTS codigo_municipio INTEGER
+                GENERATED ALWAYS AS (codigo_ine::integer) STORED,
+            ADD COLUMN IF NOT EXISTS codigo_provincia SMALLINT
+                GENERATED ALWAYS AS ((codigo_ine::integer / 1000)::smallint) STORED,
+            ADD COLUMN IF NOT EXISTS codigo_ccaa SMALLINT
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_municipios_codigo_provincia
+            ON municipios_espana(codigo_provincia)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_municipios_codigo_ccaa
+            ON municipios_espana(codigo_ccaa)
+        """)
+        print("   ✅ Columnas de códigos INE + índices creados/verificados")
+        
         # 7.2 Crear tabla elecciones si no existe
         cur.execute("""
             CREATE TABLE IF NOT EXISTS elecciones_congreso_2023 (
@@ -333,82 +384,56 @@ def process_excel_to_postgres(excel_path, db_config, limit=None):
         """)
         print("   ✅ Tabla elecciones_congreso_2023 creada/verificada")
         
-        # 7.3 Insertar datos de municipios
-        print(f"\n📤 Insertando {len(municipios_data)} municipios...")
-        municipios_sql = """
+        # 7.3 Municipios: COPY a staging + upsert
+        print(f"\n📤 Cargando {len(municipios)} municipios (COPY)...")
+        copy_to_staging(cur, municipios, 'municipios_espana', MUNICIPIOS_COLUMNAS)
+        cur.execute("""
             INSERT INTO municipios_espana 
-            (codigo_ine, nombre_municipio, nombre_provincia, nombre_comunidad, poblacion, lat, lon)
-            VALUES %s
+            (codigo_ine, nombre_municipio, nombre_provincia, nombre_comunidad, poblacion)
+            SELECT codigo_ine, nombre_municipio, nombre_provincia, nombre_comunidad, poblacion
+            FROM municipios_espana_staging
             ON CONFLICT (codigo_ine) DO UPDATE SET
                 nombre_municipio = EXCLUDED.nombre_municipio,
                 nombre_provincia = EXCLUDED.nombre_provincia,
                 nombre_comunidad = EXCLUDED.nombre_comunidad,
                 poblacion = EXCLUDED.poblacion,
                 updated_at = CURRENT_TIMESTAMP
-        """
-        
-        municipios_values = [
-            (m['codigo_ine'], m['nombre_municipio'], m['nombre_provincia'], 
-             m['nombre_comunidad'], m['poblacion'], m['lat'], m['lon'])
-            for m in municipios_data
-        ]
+        """)
+        print(f"   ✅ Municipios insertados/actualizados: {cur.rowcount}")
         
-        execute_values(cur, municipios_sql, municipios_values)
-        print(f"   ✅ Municipios insertados/actualizados")
+        # CCAA desde la tabla de referencia geo_provincias (init-db.sql)
+        cur.execute("""
+            UPDATE municipios_espana m
+            SET codigo_ccaa = p.codigo_ccaa
+            FROM geo_provincias p
+            WHERE p.codigo = m.codigo_provincia
+              AND m.codigo_ccaa IS DISTINCT FROM p.codigo_ccaa
+        """)
+        print(f"   ✅ Código de CCAA asignado a {cur.rowcount} municipios")
         
-        # 7.4 Insertar datos electorales
-        print(f"\n📊 Insertando {len(elecciones_data)} resultados electorales...")
-        elecciones_sql = """
-            INSERT INTO elecciones_congreso_2023 
-            (municipio_ine, num_mesas, censo, votantes, votos_validos, 
-             votos_candidaturas, votos_blanco, votos_nulos,
-             pp, psoe, vox, sumar, erc, jxcat_junts, eh_bildu, eaj_pnv,
-             bng, cca, upn, pacma, cup_pr, fo,
-             participacion, partido_ganador, votos_ganador, total_votos_partidos)
-            VALUES %s
+        # 7.4 Resultados electorales: COPY a staging + upsert
+        print(f"\n📊 Cargando {len(elecciones)} resultados electorales (COPY)...")
+        copy_to_staging(cur, elecciones, 'elecciones_congreso_2023', ELECCIONES_COLUMNAS)
+        lista_columnas = ", ".join(ELECCIONES_COLUMNAS)
+        actualizaciones = ",\n                ".join(
+            f"{col} = EXCLUDED.{col}" for col in ELECCIONES_COLUMNAS if col != 'municipio_ine'
+        )
+        cur.execute(f"""
+            INSERT INTO elecciones_congreso_2023 ({lista_columnas})
+            SELECT {lista_columnas}
+            FROM elecciones_congreso_2023_staging
             ON CONFLICT (municipio_ine) DO UPDATE SET
-                num_mesas = EXCLUDED.num_mesas,
-                censo = EXCLUDED.censo,
-                votantes = EXCLUDED.votantes,
-                votos_validos = EXCLUDED.votos_validos,
-                votos_candidaturas = EXCLUDED.votos_candidaturas,
-                votos_blanco = EXCLUDED.votos_blanco,
-                votos_nulos = EXCLUDED.votos_nulos,
-                pp = EXCLUDED.pp,
-                psoe = EXCLUDED.psoe,
-                vox = EXCLUDED.vox,
-                sumar = EXCLUDED.sumar,
-                erc = EXCLUDED.erc,
-                jxcat_junts = EXCLUDED.jxcat_junts,
-                eh_bildu = EXCLUDED.eh_bildu,
-                eaj_pnv = EXCLUDED.eaj_pnv,
-                bng = EXCLUDED.bng,
-                cca = EXCLUDED.cca,
-                upn = EXCLUDED.upn,
-                pacma = EXCLUDED.pacma,
-                cup_pr = EXCLUDED.cup_pr,
-                fo = EXCLUDED.fo,
-                participacion = EXCLUDED.participacion,
-                partido_ganador = EXCLUDED.partido_ganador,
-                votos_ganador = EXCLUDED.votos_ganador,
-                total_votos_partidos = EXCLUDED.total_votos_partidos,
+                {actualizaciones},
                 created_at = CURRENT_TIMESTAMP
-        """
+        """)
+        print(f"   ✅ Resultados electorales insertados/actualizados: {cur.rowcount}")
         
-        elecciones_values = [
-            (
-                e['municipio_ine'], e['num_mesas'], e['censo'], e['votantes'], 
-                e['votos_validos'], e['votos_candidaturas'], e['votos_blanco'], e['votos_nulos'],
-                e['pp'], e['psoe'], e['vox'], e['sumar'], e['erc'], 
-                e['jxcat_junts'], e['eh_bildu'], e['eaj_pnv'],
-                e['bng'], e['cca'], e['upn'], e['pacma'], e['cup_pr'], e['fo'],
-                e['participacion'], e['partido_ganador'], e['votos_ganador'], e['total_votos_partidos']
-            )
-            for e in elecciones_data
-        ]
+        # 7.5 Cubo de agregados comunidad/provincia/nacional
+        print("\n🧮 Recalculando agregados por comunidad y provincia...")
+        build_elections_cube(cur)
         
-        execute_values(cur, elecciones_sql, elecciones_values)
-        print(f"   ✅ Resultados electorales insertados/actualizados")
+        # Invalida los payloads precalculados de la API (/elections/map)
+        cur.execute("SELECT bump_dataset_version('elections')")
         
         conn.commit()
         
@@ -433,7 +458,114 @@ def process_excel_to_postgres(excel_path, db_config, limit=None):
         print("🔒 Conexión cerrada")
     
     print("\n✅ Proceso completado exitosamente!")
-    return len(municipios_data), len(elecciones_data)
+    return len(municipios), len(elecciones)
+
+# Partidos con columna propia en elecciones_congreso_2023 (y en el cubo de agregados)
+PARTIDOS_CUBO = [
+    'pp', 'psoe', 'vox', 'sumar', 'erc',
+    'jxcat_junts', 'eh_bildu', 'eaj_pnv',
+    'bng', 'cca', 'upn', 'pacma', 'cup_pr', 'fo'
+]
+
+def build_elections_cube(cur):
+    """
+    Recalcula elecciones_congreso_2023_agregados con GROUPING SETS:
+    (comunidad, provincia), (comunidad) y () -> niveles provincia, comunidad y nacional,
+    con los códigos INE de cada unidad para filtrar por igualdad entera.
+    Se ejecuta dentro de la transacción de la carga.
+    """
+    columnas_partidos = ",\n            ".join(f"{p} BIGINT NOT NULL DEFAULT 0" for p in PARTIDOS_CUBO)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS elecciones_congreso_2023_agregados (
+            nivel VARCHAR(10) NOT NULL,          -- 'nacional' | 'comunidad' | 'provincia'
+            comunidad VARCHAR(50) NOT NULL DEFAULT '',
+            provincia VARCHAR(50) NOT NULL DEFAULT '',
+            codigo_ccaa SMALLINT,                -- NULL en el nivel nacional
+            codigo_provincia SMALLINT,           -- solo en el nivel provincia
+            num_municipios INTEGER NOT NULL,
+            censo BIGINT NOT NULL DEFAULT 0,
+            votantes BIGINT NOT NULL DEFAULT 0,
+            votos_validos BIGINT NOT NULL DEFAULT 0,
+            {columnas_partidos},
+            participacion DECIMAL(5,2),
+            partido_ganador VARCHAR(50),
+            votos_ganador BIGINT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (nivel, comunidad, provincia)
+        )
+    """)
+    # Tablas creadas antes de los códigos INE
+    cur.execute("""
+        ALTER TABLE elecciones_congreso_2023_agregados
+        ADD COLUMN IF NOT EXISTS codigo_ccaa SMALLINT,
+        ADD COLUMN IF NOT EXISTS codigo_provincia SMALLINT
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_elecciones_agregados_ccaa
+        ON elecciones_congreso_2023_agregados(nivel, codigo_ccaa)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_elecciones_agregados_provincia
+        ON elecciones_congreso_2023_agregados(nivel, codigo_provincia)
+    """)
+    
+    sumas = ",\n                ".join(f"SUM(e.{p}) AS {p}" for p in PARTIDOS_CUBO)
+    unpivot = ", ".join(f"('{p}', g.{p})" for p in PARTIDOS_CUBO)
+    lista = ", ".join(PARTIDOS_CUBO)
+    
+    cur.execute("DELETE FROM elecciones_congreso_2023_agregados")
+    cur.execute(f"""
+        WITH grupos AS (
+            SELECT
+                CASE
+                    WHEN GROUPING(m.nombre_comunidad) = 1 THEN 'nacional'
+                    WHEN GROUPING(m.nombre_provincia) = 1 THEN 'comunidad'
+                    ELSE 'provincia'
+                END AS nivel,
+                CASE WHEN GROUPING(m.nombre_comunidad) = 0 THEN COALESCE(m.nombre_comunidad, '') ELSE '' END AS comunidad,
+                CASE WHEN GROUPING(m.nombre_provincia) = 0 THEN COALESCE(m.nombre_provincia, '') ELSE '' END AS provincia,
+                -- Códigos INE del grupo (dependen del nombre: un único valor por grupo)
+                CASE WHEN GROUPING(m.nombre_comunidad) = 0 THEN MIN(m.codigo_ccaa) END AS codigo_ccaa,
+                CASE WHEN GROUPING(m.nombre_provincia) = 0 THEN MIN(m.codigo_provincia) END AS codigo_provincia,
+                COUNT(*) AS num_municipios,
+                SUM(e.censo) AS censo,
+                SUM(e.votantes) AS votantes,
+                SUM(e.votos_validos) AS votos_validos,
+                {sumas}
+            FROM municipios_espana m
+            JOIN elecciones_congreso_2023 e ON m.codigo_ine = e.municipio_ine
+            GROUP BY GROUPING SETS (
+                (m.nombre_comunidad, m.nombre_provincia),
+                (m.nombre_comunidad),
+                ()
+            )
+        )
+        INSERT INTO elecciones_congreso_2023_agregados (
+            nivel, comunidad, provincia, codigo_ccaa, codigo_provincia,
+            num_municipios, censo, votantes, votos_validos,
+            {lista},
+            participacion, partido_ganador, votos_ganador
+        )
+        SELECT
+            g.nivel, g.comunidad, g.provincia, g.codigo_ccaa, g.codigo_provincia, g.num_municipios,
+            COALESCE(g.censo, 0), COALESCE(g.votantes, 0), COALESCE(g.votos_validos, 0),
+            {", ".join(f"COALESCE(g.{p}, 0)" for p in PARTIDOS_CUBO)},
+            ROUND(g.votantes * 100.0 / NULLIF(g.censo, 0), 2),
+            COALESCE(w.partido, 'sin_datos'),
+            COALESCE(w.votos, 0)
+        FROM grupos g
+        LEFT JOIN LATERAL (
+            SELECT v.partido, v.votos
+            FROM (VALUES {unpivot}) AS v(partido, votos)
+            WHERE v.votos > 0
+            ORDER BY v.votos DESC
+            LIMIT 1
+        ) w ON TRUE
+    """)
+    
+    cur.execute("SELECT nivel, COUNT(*) FROM elecciones_congreso_2023_agregados GROUP BY nivel")
+    resumen = ", ".join(f"{nivel}: {n}" for nivel, n in cur.fetchall())
+    print(f"   ✅ Cubo de agregados recalculado ({resumen})")
 
 def main():
     """Función principal"""
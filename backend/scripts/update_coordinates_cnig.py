@@ -12,6 +12,8 @@ import requests
 import zipfile
 import io
 import logging
+import re
+import unicodedata
 from datetime import datetime
 
 # Configurar logging
@@ -166,7 +168,7 @@ def parse_cnig_csv(file_path):
     """
     try:
         # Leer CSV
-        df = pd.read_csv(file_path, sep=';', encoding='latin-1')
+        df = pd.read_csv(file_path, sep=';', encoding='latin-1', dtype={'COD_INE': str})
         logger.info(f"📊 Dataset cargado: {len(df)} filas")
         
         # 1. Crear columna codigo_ine directamente desde COD_INE
@@ -201,21 +203,89 @@ def parse_cnig_csv(file_path):
         traceback.print_exc()
         raise
 
+# Artículos que el nomenclátor pospone ("Rioja, La", "Coruña, A", "Palmas, Las")
+ARTICULOS_POSPUESTOS = {
+    'el', 'la', 'los', 'las', 'lo', 'l', 'a', 'o', 'os', 'as', 'es', 'sa', 'ses', 'els', 'les'
+}
+
+def normalizar_nombre(nombre):
+    """Minúsculas, sin acentos ni puntuación y con el artículo pospuesto al principio"""
+    if not isinstance(nombre, str):
+        return ''
+    nombre = nombre.strip()
+    if ', ' in nombre:
+        base, articulo = nombre.rsplit(', ', 1)
+        if articulo.lower().rstrip("'") in ARTICULOS_POSPUESTOS:
+            nombre = f"{articulo} {base}"
+    nombre = unicodedata.normalize('NFKD', nombre.lower())
+    nombre = ''.join(c for c in nombre if not unicodedata.combining(c))
+    return ' '.join(re.sub(r"[^a-z0-9ñ]+", ' ', nombre).split())
+
+def variantes_nombre(nombre):
+    """Formas normalizadas de un nombre bilingüe ("Araba/Álava" -> araba/alava, araba, alava)"""
+    variantes = {normalizar_nombre(nombre)}
+    if isinstance(nombre, str):
+        for parte in re.split(r'\s*[/-]\s*', nombre):
+            variantes.add(normalizar_nombre(parte))
+    variantes.discard('')
+    return variantes
+
+class IndiceMunicipios:
+    """
+    Índice en memoria de municipios por provincia normalizada.
+    
+    Sustituye a la consulta ILIKE '%nombre%' AND ILIKE '%provincia%' que se
+    lanzaba contra la BD por cada municipio del CNIG sin código coincidente.
+    """
+    
+    def __init__(self, municipios_db):
+        # provincia normalizada -> {nombre normalizado: codigo_ine}
+        self.por_provincia = {}
+        for codigo, (nombre, provincia) in sorted(municipios_db.items()):
+            nombres = self.por_provincia.setdefault(normalizar_nombre(provincia), {})
+            for variante in variantes_nombre(nombre):
+                nombres.setdefault(variante, codigo)
+    
+    def _provincias(self, provincia):
+        variantes = variantes_nombre(provincia)
+        return [
+            nombres for prov, nombres in self.por_provincia.items()
+            if any(v == prov or v in prov or prov in v for v in variantes)
+        ]
+    
+    def buscar(self, nombre, provincia):
+        """Devuelve el codigo_ine del municipio o None (exacto primero, luego contenido)"""
+        candidatos = self._provincias(provincia)
+        variantes = variantes_nombre(nombre)
+        
+        for nombres in candidatos:
+            for variante in variantes:
+                if variante in nombres:
+                    return nombres[variante]
+        
+        for nombres in candidatos:
+            for nombre_bd, codigo in nombres.items():
+                if any(variante in nombre_bd for variante in variantes):
+                    return codigo
+        return None
+
 def update_database_from_cnig(db_config, cnig_df):
     """
     Actualiza la base de datos con coordenadas del CNIG
     
+    Todas las coordenadas se copian (COPY) a una tabla temporal y se aplican
+    con un único UPDATE ... FROM en una sola transacción. Los municipios sin
+    código coincidente se resuelven en memoria por nombre y provincia.
+    
     Args:
         db_config: Configuración de la base de datos
         cnig_df: DataFrame con datos del CNIG
     """
+    conn = None
     try:
         conn = psycopg2.connect(**db_config)
         cur = conn.cursor()
         
-        # Contadores
-        updated = 0
-        not_found = 0
         errors = 0
         
         # Obtener todos los municipios de nuestra BD
@@ -227,74 +297,73 @@ def update_database_from_cnig(db_config, cnig_df):
         municipios_db = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
         logger.info(f"📊 Municipios en nuestra BD: {len(municipios_db)}")
         
-        # Procesar cada municipio del CNIG
-        for _, row in cnig_df.iterrows():
-            codigo_ine_cnig = row['codigo_ine']
-            
-            # Buscar coincidencia por código INE
-            if codigo_ine_cnig in municipios_db:
-                try:
-                    # Actualizar coordenadas
-                    cur.execute("""
-                        UPDATE municipios_espana
-                        SET lat = %s, lon = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE codigo_ine = %s
-                    """, (row['lat'], row['lon'], codigo_ine_cnig))
-                    
-                    updated += 1
-                    
-                    if updated % 100 == 0:
-                        logger.info(f"  ✅ {updated} municipios actualizados")
-                        
-                except Exception as e:
-                    errors += 1
-                    logger.warning(f"⚠️ Error actualizando {codigo_ine_cnig}: {e}")
+        # 1. Coincidencia directa por código INE
+        por_codigo = cnig_df['codigo_ine'].isin(municipios_db.keys())
+        directos = cnig_df.loc[por_codigo, ['codigo_ine', 'lat', 'lon']]
+        sin_codigo = cnig_df.loc[~por_codigo]
+        logger.info(f"  ✅ {len(directos)} municipios por código INE")
+        
+        # 2. Resto: búsqueda aproximada por nombre + provincia en memoria
+        indice = IndiceMunicipios(municipios_db)
+        ya_asignados = set(directos['codigo_ine'])
+        por_nombre = []
+        no_encontrados = []
+        
+        for municipio, provincia, lat, lon in sin_codigo[['municipio', 'provincia', 'lat', 'lon']].itertuples(index=False):
+            codigo_match = indice.buscar(municipio, provincia)
+            if codigo_match and codigo_match not in ya_asignados:
+                ya_asignados.add(codigo_match)
+                por_nombre.append((codigo_match, lat, lon))
+                logger.info(f"  🔍 Encontrado por nombre: {municipio} -> {codigo_match}")
             else:
-                not_found += 1
-                # Intentar buscar por nombre y provincia
-                municipio_nombre = row['municipio']
-                provincia_nombre = row['provincia']
-                
-                # Buscar coincidencia aproximada
-                cur.execute("""
-                    SELECT codigo_ine FROM municipios_espana
-                    WHERE nombre_municipio ILIKE %s
-                    AND nombre_provincia ILIKE %s
-                    LIMIT 1
-                """, (f"%{municipio_nombre}%", f"%{provincia_nombre}%"))
-                
-                match = cur.fetchone()
-                if match:
-                    try:
-                        codigo_match = match[0]
-                        cur.execute("""
-                            UPDATE municipios_espana
-                            SET lat = %s, lon = %s, updated_at = CURRENT_TIMESTAMP
-                            WHERE codigo_ine = %s
-                        """, (row['lat'], row['lon'], codigo_match))
-                        
-                        updated += 1
-                        not_found -= 1  # Corregir contador
-                        logger.info(f"  🔍 Encontrado por nombre: {municipio_nombre}")
-                        
-                    except Exception as e:
-                        errors += 1
+                no_encontrados.append((municipio, provincia))
+        
+        coordenadas = pd.concat(
+            [directos, pd.DataFrame(por_nombre, columns=['codigo_ine', 'lat', 'lon'])],
+            ignore_index=True
+        ).drop_duplicates(subset='codigo_ine', keep='first')
+        
+        # 3. COPY a tabla temporal + un único UPDATE ... FROM
+        cur.execute("""
+            CREATE TEMP TABLE cnig_coordenadas (
+                codigo_ine VARCHAR(5) PRIMARY KEY,
+                lat DOUBLE PRECISION NOT NULL,
+                lon DOUBLE PRECISION NOT NULL
+            ) ON COMMIT DROP
+        """)
+        buffer = io.StringIO()
+        coordenadas.to_csv(buffer, index=False, header=False, columns=['codigo_ine', 'lat', 'lon'])
+        buffer.seek(0)
+        cur.copy_expert("COPY cnig_coordenadas (codigo_ine, lat, lon) FROM STDIN WITH (FORMAT csv)", buffer)
+        
+        cur.execute("""
+            UPDATE municipios_espana m
+            SET lat = c.lat, lon = c.lon, updated_at = CURRENT_TIMESTAMP
+            FROM cnig_coordenadas c
+            WHERE m.codigo_ine = c.codigo_ine
+        """)
+        updated = cur.rowcount
+        
+        # Coordenadas nuevas: invalida mapa de elecciones e índice de lugares de la API
+        cur.execute("SELECT bump_dataset_version('elections')")
         
         conn.commit()
+        not_found = len(no_encontrados)
         
         # Estadísticas finales
         logger.info("\n" + "=" * 60)
         logger.info("📈 RESULTADOS DE ACTUALIZACIÓN:")
         logger.info(f"   Municipios actualizados: {updated}")
+        logger.info(f"     - por código INE: {len(directos)}")
+        logger.info(f"     - por nombre: {len(por_nombre)}")
         logger.info(f"   Municipios no encontrados: {not_found}")
         logger.info(f"   Errores: {errors}")
         
         # Mostrar algunos municipios no encontrados
         if not_found > 0:
             logger.info("\n🔍 Municipios del CNIG no encontrados en nuestra BD (primeros 10):")
-            not_found_samples = cnig_df[~cnig_df['codigo_ine'].isin(municipios_db.keys())].head(10)
-            for _, row in not_found_samples.iterrows():
-                logger.info(f"   {row['codigo_ine']}: {row['municipio']}, {row['provincia']}")
+            for municipio, provincia in no_encontrados[:10]:
+                logger.info(f"   {municipio}, {provincia}")
         
         cur.close()
         conn.close()
@@ -303,6 +372,9 @@ def update_database_from_cnig(db_config, cnig_df):
         
     except Exception as e:
         logger.error(f"❌ Error en la base de datos: {e}")
+        if conn is not None:
+            conn.rollback()
+            conn.close()
         raise
 
 def verify_update(db_config):
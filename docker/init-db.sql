@@ -12,6 +12,10 @@ CREATE TABLE covid_cases (
     fallecidos INTEGER,
     altas INTEGER,
     geom GEOMETRY(Point, 4326),
+    -- Códigos INE: la carga masiva los resuelve en bloque desde geo_nombres y
+    -- el trigger covid_cases_geo_codes los rellena en inserciones sueltas
+    codigo_ccaa SMALLINT,
+    codigo_provincia SMALLINT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -20,6 +24,271 @@ CREATE TABLE covid_cases (
 CREATE INDEX idx_covid_fecha ON covid_cases(fecha);
 CREATE INDEX idx_covid_comunidad ON covid_cases(comunidad_autonoma);
 CREATE INDEX idx_covid_geom ON covid_cases USING GIST(geom);
+-- Paginación keyset de /api/covid/data: ORDER BY fecha, comunidad_autonoma, id
+CREATE INDEX idx_covid_keyset ON covid_cases(fecha, comunidad_autonoma, id);
+-- Clave natural para el upsert de scripts/load_covid_data.py; NULL-safe: las
+-- filas de nivel CCAA (provincia NULL) chocan por (fecha, comunidad, '')
+CREATE UNIQUE INDEX uq_covid_fecha_provincia ON covid_cases(fecha, comunidad_autonoma, COALESCE(provincia, ''));
+
+-- ============================================================
+-- Referencia geográfica canónica (códigos INE enteros)
+-- Espejo de backend/app/utils/geo_reference.py: CCAA 1-19, provincias 1-52
+-- y todas las grafías conocidas de cada nombre (en minúsculas)
+-- ============================================================
+CREATE TABLE geo_ccaa (
+    codigo SMALLINT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE geo_provincias (
+    codigo SMALLINT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    codigo_ccaa SMALLINT NOT NULL REFERENCES geo_ccaa(codigo)
+);
+
+CREATE TABLE geo_nombres (
+    nivel VARCHAR(10) NOT NULL,          -- 'ccaa' | 'provincia'
+    variante VARCHAR(100) NOT NULL,      -- lower(nombre)
+    codigo SMALLINT NOT NULL,
+    PRIMARY KEY (nivel, variante)
+);
+
+INSERT INTO geo_ccaa (codigo, nombre) VALUES
+(1, 'Andalucía'),
+(2, 'Aragón'),
+(3, 'Principado de Asturias'),
+(4, 'Illes Balears'),
+(5, 'Canarias'),
+(6, 'Cantabria'),
+(7, 'Castilla y León'),
+(8, 'Castilla - La Mancha'),
+(9, 'Cataluña'),
+(10, 'Comunitat Valenciana'),
+(11, 'Extremadura'),
+(12, 'Galicia'),
+(13, 'Comunidad de Madrid'),
+(14, 'Región de Murcia'),
+(15, 'Comunidad Foral de Navarra'),
+(16, 'País Vasco'),
+(17, 'La Rioja'),
+(18, 'Ciudad de Ceuta'),
+(19, 'Ciudad de Melilla');
+
+INSERT INTO geo_provincias (codigo, nombre, codigo_ccaa) VALUES
+(1, 'Araba/Álava', 16),
+(2, 'Albacete', 8),
+(3, 'Alicante/Alacant', 10),
+(4, 'Almería', 1),
+(5, 'Ávila', 7),
+(6, 'Badajoz', 11),
+(7, 'Illes Balears', 4),
+(8, 'Barcelona', 9),
+(9, 'Burgos', 7),
+(10, 'Cáceres', 11),
+(11, 'Cádiz', 1),
+(12, 'Castellón/Castelló', 10),
+(13, 'Ciudad Real', 8),
+(14, 'Córdoba', 1),
+(15, 'A Coruña', 12),
+(16, 'Cuenca', 8),
+(17, 'Girona', 9),
+(18, 'Granada', 1),
+(19, 'Guadalajara', 8),
+(20, 'Gipuzkoa', 16),
+(21, 'Huelva', 1),
+(22, 'Huesca', 2),
+(23, 'Jaén', 1),
+(24, 'León', 7),
+(25, 'Lleida', 9),
+(26, 'La Rioja', 17),
+(27, 'Lugo', 12),
+(28, 'Madrid', 13),
+(29, 'Málaga', 1),
+(30, 'Murcia', 14),
+(31, 'Navarra', 15),
+(32, 'Ourense', 12),
+(33, 'Asturias', 3),
+(34, 'Palencia', 7),
+(35, 'Las Palmas', 5),
+(36, 'Pontevedra', 12),
+(37, 'Salamanca', 7),
+(38, 'Santa Cruz de Tenerife', 5),
+(39, 'Cantabria', 6),
+(40, 'Segovia', 7),
+(41, 'Sevilla', 1),
+(42, 'Soria', 7),
+(43, 'Tarragona', 9),
+(44, 'Teruel', 2),
+(45, 'Toledo', 8),
+(46, 'Valencia/València', 10),
+(47, 'Valladolid', 7),
+(48, 'Bizkaia', 16),
+(49, 'Zamora', 7),
+(50, 'Zaragoza', 2),
+(51, 'Ceuta', 18),
+(52, 'Melilla', 19);
+
+INSERT INTO geo_nombres (nivel, variante, codigo) VALUES
+('ccaa', 'andalucía', 1),
+('ccaa', 'aragón', 2),
+('ccaa', 'asturias', 3),
+('ccaa', 'asturias, principado de', 3),
+('ccaa', 'baleares', 4),
+('ccaa', 'balears, illes', 4),
+('ccaa', 'canarias', 5),
+('ccaa', 'cantabria', 6),
+('ccaa', 'castilla - la mancha', 8),
+('ccaa', 'castilla y león', 7),
+('ccaa', 'castilla-la mancha', 8),
+('ccaa', 'catalunya', 9),
+('ccaa', 'cataluña', 9),
+('ccaa', 'ceuta', 18),
+('ccaa', 'ciudad de ceuta', 18),
+('ccaa', 'ciudad de melilla', 19),
+('ccaa', 'comunidad de madrid', 13),
+('ccaa', 'comunidad foral de navarra', 15),
+('ccaa', 'comunidad valenciana', 10),
+('ccaa', 'comunitat valenciana', 10),
+('ccaa', 'euskadi', 16),
+('ccaa', 'extremadura', 11),
+('ccaa', 'galicia', 12),
+('ccaa', 'illes balears', 4),
+('ccaa', 'islas baleares', 4),
+('ccaa', 'la rioja', 17),
+('ccaa', 'madrid', 13),
+('ccaa', 'madrid, comunidad de', 13),
+('ccaa', 'melilla', 19),
+('ccaa', 'murcia', 14),
+('ccaa', 'murcia, región de', 14),
+('ccaa', 'navarra', 15),
+('ccaa', 'navarra, comunidad foral de', 15),
+('ccaa', 'país vasco', 16),
+('ccaa', 'principado de asturias', 3),
+('ccaa', 'región de murcia', 14),
+('ccaa', 'rioja, la', 17),
+('provincia', 'a coruña', 15),
+('provincia', 'alacant', 3),
+('provincia', 'alacant / alicante', 3),
+('provincia', 'alacant/alicante', 3),
+('provincia', 'albacete', 2),
+('provincia', 'alicante', 3),
+('provincia', 'alicante / alacant', 3),
+('provincia', 'alicante/alacant', 3),
+('provincia', 'almería', 4),
+('provincia', 'araba', 1),
+('provincia', 'araba / álava', 1),
+('provincia', 'araba/álava', 1),
+('provincia', 'asturias', 33),
+('provincia', 'badajoz', 6),
+('provincia', 'baleares', 7),
+('provincia', 'balears, illes', 7),
+('provincia', 'barcelona', 8),
+('provincia', 'bizkaia', 48),
+('provincia', 'burgos', 9),
+('provincia', 'cantabria', 39),
+('provincia', 'castelló', 12),
+('provincia', 'castelló / castellón', 12),
+('provincia', 'castelló/castellón', 12),
+('provincia', 'castellón', 12),
+('provincia', 'castellón / castelló', 12),
+('provincia', 'castellón/castelló', 12),
+('provincia', 'ceuta', 51),
+('provincia', 'ciudad real', 13),
+('provincia', 'coruña, a', 15),
+('provincia', 'coruña, la', 15),
+('provincia', 'cuenca', 16),
+('provincia', 'cáceres', 10),
+('provincia', 'cádiz', 11),
+('provincia', 'córdoba', 14),
+('provincia', 'gerona', 17),
+('provincia', 'gipuzkoa', 20),
+('provincia', 'girona', 17),
+('provincia', 'granada', 18),
+('provincia', 'guadalajara', 19),
+('provincia', 'guipúzcoa', 20),
+('provincia', 'huelva', 21),
+('provincia', 'huesca', 22),
+('provincia', 'illes balears', 7),
+('provincia', 'islas baleares', 7),
+('provincia', 'jaén', 23),
+('provincia', 'la coruña', 15),
+('provincia', 'la rioja', 26),
+('provincia', 'las palmas', 35),
+('provincia', 'león', 24),
+('provincia', 'lleida', 25),
+('provincia', 'lugo', 27),
+('provincia', 'lérida', 25),
+('provincia', 'madrid', 28),
+('provincia', 'melilla', 52),
+('provincia', 'murcia', 30),
+('provincia', 'málaga', 29),
+('provincia', 'navarra', 31),
+('provincia', 'orense', 32),
+('provincia', 'ourense', 32),
+('provincia', 'palencia', 34),
+('provincia', 'palmas, las', 35),
+('provincia', 'pontevedra', 36),
+('provincia', 'rioja, la', 26),
+('provincia', 'salamanca', 37),
+('provincia', 'santa cruz de tenerife', 38),
+('provincia', 'segovia', 40),
+('provincia', 'sevilla', 41),
+('provincia', 'soria', 42),
+('provincia', 'tarragona', 43),
+('provincia', 'teruel', 44),
+('provincia', 'toledo', 45),
+('provincia', 'valencia', 46),
+('provincia', 'valencia / valència', 46),
+('provincia', 'valencia/valència', 46),
+('provincia', 'valladolid', 47),
+('provincia', 'valència', 46),
+('provincia', 'valència / valencia', 46),
+('provincia', 'valència/valencia', 46),
+('provincia', 'vizcaya', 48),
+('provincia', 'zamora', 49),
+('provincia', 'zaragoza', 50),
+('provincia', 'álava', 1),
+('provincia', 'álava / araba', 1),
+('provincia', 'álava/araba', 1),
+('provincia', 'ávila', 5);
+
+-- Resuelve los nombres libres de covid_cases a códigos INE (filas sueltas;
+-- scripts/load_covid_data.py ya inserta los códigos y el trigger no se dispara)
+CREATE OR REPLACE FUNCTION covid_cases_set_geo_codes()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT codigo INTO NEW.codigo_provincia
+    FROM geo_nombres
+    WHERE nivel = 'provincia' AND variante = lower(trim(NEW.provincia));
+
+    SELECT codigo INTO NEW.codigo_ccaa
+    FROM geo_nombres
+    WHERE nivel = 'ccaa' AND variante = lower(trim(NEW.comunidad_autonoma));
+
+    IF NEW.codigo_ccaa IS NULL AND NEW.codigo_provincia IS NOT NULL THEN
+        SELECT codigo_ccaa INTO NEW.codigo_ccaa
+        FROM geo_provincias
+        WHERE codigo = NEW.codigo_provincia;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER covid_cases_geo_codes
+BEFORE INSERT ON covid_cases
+FOR EACH ROW WHEN (NEW.codigo_ccaa IS NULL AND NEW.codigo_provincia IS NULL)
+EXECUTE FUNCTION covid_cases_set_geo_codes();
+
+CREATE TRIGGER covid_cases_geo_codes_update
+BEFORE UPDATE OF comunidad_autonoma, provincia ON covid_cases
+FOR EACH ROW WHEN (OLD.comunidad_autonoma IS DISTINCT FROM NEW.comunidad_autonoma
+                   OR OLD.provincia IS DISTINCT FROM NEW.provincia)
+EXECUTE FUNCTION covid_cases_set_geo_codes();
+
+-- Filtros por código: igualdad entera indexada
+CREATE INDEX idx_covid_codigo_ccaa ON covid_cases(codigo_ccaa, fecha);
+CREATE INDEX idx_covid_codigo_provincia ON covid_cases(codigo_provincia, fecha);
 
 -- Datos demo realistas (enero 2023, 17 CCAA x 31 días = 527 registros)
 -- Coordenadas aproximadas de capitales de comunidad autónoma
@@ -35,14 +304,14 @@ INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados
 ('2023-01-03', 'Aragón', 'Zaragoza', 310, 11, 1, 275, ST_SetSRID(ST_MakePoint(-0.8891, 41.6488), 4326)),
 
 -- Asturias (Oviedo)
-('2023-01-01', 'Asturias', 'Oviedo', 180, 6, 1, 160, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
-('2023-01-02', 'Asturias', 'Oviedo', 190, 7, 2, 165, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
-('2023-01-03', 'Asturias', 'Oviedo', 175, 6, 1, 155, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
+('2023-01-01', 'Asturias', 'Asturias', 180, 6, 1, 160, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
+('2023-01-02', 'Asturias', 'Asturias', 190, 7, 2, 165, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
+('2023-01-03', 'Asturias', 'Asturias', 175, 6, 1, 155, ST_SetSRID(ST_MakePoint(-5.8458, 43.3614), 4326)),
 
 -- Baleares (Palma)
-('2023-01-01', 'Islas Baleares', 'Palma', 210, 8, 1, 185, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
-('2023-01-02', 'Islas Baleares', 'Palma', 225, 9, 2, 195, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
-('2023-01-03', 'Islas Baleares', 'Palma', 205, 8, 1, 180, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
+('2023-01-01', 'Islas Baleares', 'Illes Balears', 210, 8, 1, 185, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
+('2023-01-02', 'Islas Baleares', 'Illes Balears', 225, 9, 2, 195, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
+('2023-01-03', 'Islas Baleares', 'Illes Balears', 205, 8, 1, 180, ST_SetSRID(ST_MakePoint(2.6502, 39.5696), 4326)),
 
 -- Canarias (Las Palmas)
 ('2023-01-01', 'Canarias', 'Las Palmas', 280, 10, 2, 245, ST_SetSRID(ST_MakePoint(-15.4134, 28.1235), 4326)),
@@ -50,9 +319,9 @@ INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados
 ('2023-01-03', 'Canarias', 'Las Palmas', 270, 10, 2, 235, ST_SetSRID(ST_MakePoint(-15.4134, 28.1235), 4326)),
 
 -- Cantabria (Santander)
-('2023-01-01', 'Cantabria', 'Santander', 95, 3, 0, 85, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
-('2023-01-02', 'Cantabria', 'Santander', 105, 4, 1, 90, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
-('2023-01-03', 'Cantabria', 'Santander', 90, 3, 0, 80, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
+('2023-01-01', 'Cantabria', 'Cantabria', 95, 3, 0, 85, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
+('2023-01-02', 'Cantabria', 'Cantabria', 105, 4, 1, 90, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
+('2023-01-03', 'Cantabria', 'Cantabria', 90, 3, 0, 80, ST_SetSRID(ST_MakePoint(-3.8044, 43.4623), 4326)),
 
 -- Castilla-La Mancha (Toledo)
 ('2023-01-01', 'Castilla-La Mancha', 'Toledo', 420, 15, 3, 370, ST_SetSRID(ST_MakePoint(-4.0245, 39.8628), 4326)),
@@ -75,14 +344,14 @@ INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados
 ('2023-01-03', 'Comunidad Valenciana', 'Valencia', 900, 32, 5, 790, ST_SetSRID(ST_MakePoint(-0.3763, 39.4699), 4326)),
 
 -- Extremadura (Mérida)
-('2023-01-01', 'Extremadura', 'Mérida', 150, 5, 1, 130, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
-('2023-01-02', 'Extremadura', 'Mérida', 165, 6, 2, 145, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
-('2023-01-03', 'Extremadura', 'Mérida', 140, 5, 1, 125, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
+('2023-01-01', 'Extremadura', 'Badajoz', 150, 5, 1, 130, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
+('2023-01-02', 'Extremadura', 'Badajoz', 165, 6, 2, 145, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
+('2023-01-03', 'Extremadura', 'Badajoz', 140, 5, 1, 125, ST_SetSRID(ST_MakePoint(-6.3438, 38.9160), 4326)),
 
 -- Galicia (Santiago de Compostela)
-('2023-01-01', 'Galicia', 'Santiago de Compostela', 480, 17, 3, 420, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
-('2023-01-02', 'Galicia', 'Santiago de Compostela', 510, 19, 4, 445, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
-('2023-01-03', 'Galicia', 'Santiago de Compostela', 470, 16, 3, 410, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
+('2023-01-01', 'Galicia', 'A Coruña', 480, 17, 3, 420, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
+('2023-01-02', 'Galicia', 'A Coruña', 510, 19, 4, 445, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
+('2023-01-03', 'Galicia', 'A Coruña', 470, 16, 3, 410, ST_SetSRID(ST_MakePoint(-8.5449, 42.8782), 4326)),
 
 -- Madrid (Madrid)
 ('2023-01-01', 'Madrid', 'Madrid', 1500, 55, 10, 1320, ST_SetSRID(ST_MakePoint(-3.7038, 40.4168), 4326)),
@@ -95,19 +364,19 @@ INSERT INTO covid_cases (fecha, comunidad_autonoma, provincia, casos_confirmados
 ('2023-01-03', 'Murcia', 'Murcia', 270, 10, 2, 240, ST_SetSRID(ST_MakePoint(-1.1307, 37.9924), 4326)),
 
 -- Navarra (Pamplona)
-('2023-01-01', 'Navarra', 'Pamplona', 110, 4, 1, 95, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
-('2023-01-02', 'Navarra', 'Pamplona', 120, 5, 2, 105, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
-('2023-01-03', 'Navarra', 'Pamplona', 105, 4, 1, 90, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
+('2023-01-01', 'Navarra', 'Navarra', 110, 4, 1, 95, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
+('2023-01-02', 'Navarra', 'Navarra', 120, 5, 2, 105, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
+('2023-01-03', 'Navarra', 'Navarra', 105, 4, 1, 90, ST_SetSRID(ST_MakePoint(-1.6432, 42.8125), 4326)),
 
 -- País Vasco (Vitoria-Gasteiz)
-('2023-01-01', 'País Vasco', 'Vitoria-Gasteiz', 340, 12, 2, 300, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
-('2023-01-02', 'País Vasco', 'Vitoria-Gasteiz', 360, 13, 3, 315, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
-('2023-01-03', 'País Vasco', 'Vitoria-Gasteiz', 330, 11, 2, 290, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
+('2023-01-01', 'País Vasco', 'Araba/Álava', 340, 12, 2, 300, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
+('2023-01-02', 'País Vasco', 'Araba/Álava', 360, 13, 3, 315, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
+('2023-01-03', 'País Vasco', 'Araba/Álava', 330, 11, 2, 290, ST_SetSRID(ST_MakePoint(-2.6724, 42.8464), 4326)),
 
 -- La Rioja (Logroño)
-('2023-01-01', 'La Rioja', 'Logroño', 75, 2, 0, 65, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
-('2023-01-02', 'La Rioja', 'Logroño', 85, 3, 1, 75, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
-('2023-01-03', 'La Rioja', 'Logroño', 70, 2, 0, 60, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
+('2023-01-01', 'La Rioja', 'La Rioja', 75, 2, 0, 65, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
+('2023-01-02', 'La Rioja', 'La Rioja', 85, 3, 1, 75, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
+('2023-01-03', 'La Rioja', 'La Rioja', 70, 2, 0, 60, ST_SetSRID(ST_MakePoint(-2.4449, 42.4627), 4326)),
 
 -- Ceuta (Ceuta)
 ('2023-01-01', 'Ceuta', 'Ceuta', 25, 1, 0, 22, ST_SetSRID(ST_MakePoint(-5.3167, 35.8891), 4326)),
@@ -129,4 +398,330 @@ END;
 $$ language 'plpgsql';
 
 CREATE TRIGGER update_covid_cases_updated_at BEFORE UPDATE
-ON covid_cases FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
\ No newline at end of file
+ON covid_cases FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- ============================================================
+-- Versión de datos por dataset: la incrementan las cargas y la usan
+-- las cachés en memoria (tiles, payloads precalculados) para invalidarse
+-- ============================================================
+CREATE TABLE dataset_versions (
+    dataset VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO dataset_versions (dataset, version) VALUES ('covid', 1), ('elections', 1), ('air_quality', 1);
+
+CREATE OR REPLACE FUNCTION bump_dataset_version(p_dataset VARCHAR)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO dataset_versions (dataset, version, updated_at)
+    VALUES (p_dataset, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT (dataset) DO UPDATE SET
+        version = dataset_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- ============================================================
+-- Rollups diarios de covid_cases (para /api/covid/stats)
+-- Se mantienen de forma incremental: cada sentencia sobre
+-- covid_cases recalcula solo el rango de fechas afectado.
+-- ============================================================
+CREATE TABLE covid_daily_ccaa (
+    fecha DATE NOT NULL,
+    comunidad_autonoma VARCHAR(100) NOT NULL,
+    total_casos BIGINT NOT NULL DEFAULT 0,
+    total_uci BIGINT NOT NULL DEFAULT 0,
+    total_fallecidos BIGINT NOT NULL DEFAULT 0,
+    total_altas BIGINT NOT NULL DEFAULT 0,
+    registros INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, comunidad_autonoma)
+);
+
+CREATE INDEX idx_covid_daily_ccaa_comunidad ON covid_daily_ccaa(comunidad_autonoma, fecha);
+
+CREATE TABLE covid_daily_provincia (
+    fecha DATE NOT NULL,
+    comunidad_autonoma VARCHAR(100) NOT NULL,
+    provincia VARCHAR(100) NOT NULL,
+    total_casos BIGINT NOT NULL DEFAULT 0,
+    total_uci BIGINT NOT NULL DEFAULT 0,
+    total_fallecidos BIGINT NOT NULL DEFAULT 0,
+    total_altas BIGINT NOT NULL DEFAULT 0,
+    registros INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, comunidad_autonoma, provincia)
+);
+
+CREATE INDEX idx_covid_daily_provincia_provincia ON covid_daily_provincia(provincia, fecha);
+
+-- Recalcula los rollups de un rango de fechas.
+-- Las cargas concurrentes se serializan con un advisory lock de
+-- transacción: sin él, dos cargas que tocan la misma (fecha, ccaa)
+-- borran las dos y luego insertan las dos (clave duplicada), y cada una
+-- sumaría sin ver las filas aún no confirmadas de la otra. La que espera
+-- recalcula después del COMMIT de la primera (READ COMMITTED: cada
+-- sentencia ve lo ya confirmado), así que el resultado incluye ambas.
+CREATE OR REPLACE FUNCTION refresh_covid_rollups(p_desde DATE, p_hasta DATE)
+RETURNS void AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('covid_rollups'));
+
+    DELETE FROM covid_daily_ccaa WHERE fecha BETWEEN p_desde AND p_hasta;
+    DELETE FROM covid_daily_provincia WHERE fecha BETWEEN p_desde AND p_hasta;
+
+    INSERT INTO covid_daily_ccaa
+        (fecha, comunidad_autonoma, total_casos, total_uci, total_fallecidos, total_altas, registros)
+    SELECT
+        fecha,
+        comunidad_autonoma,
+        COALESCE(SUM(casos_confirmados), 0),
+        COALESCE(SUM(ingresos_uci), 0),
+        COALESCE(SUM(fallecidos), 0),
+        COALESCE(SUM(altas), 0),
+        COUNT(*)
+    FROM covid_cases
+    WHERE fecha BETWEEN p_desde AND p_hasta
+    GROUP BY fecha, comunidad_autonoma;
+
+    INSERT INTO covid_daily_provincia
+        (fecha, comunidad_autonoma, provincia, total_casos, total_uci, total_fallecidos, total_altas, registros)
+    SELECT
+        fecha,
+        comunidad_autonoma,
+        COALESCE(provincia, comunidad_autonoma),
+        COALESCE(SUM(casos_confirmados), 0),
+        COALESCE(SUM(ingresos_uci), 0),
+        COALESCE(SUM(fallecidos), 0),
+        COALESCE(SUM(altas), 0),
+        COUNT(*)
+    FROM covid_cases
+    WHERE fecha BETWEEN p_desde AND p_hasta
+    GROUP BY fecha, comunidad_autonoma, COALESCE(provincia, comunidad_autonoma);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger por sentencia: solo refresca los días tocados por la carga
+CREATE OR REPLACE FUNCTION covid_cases_refresh_rollups()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_desde DATE;
+    v_hasta DATE;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT MIN(fecha), MAX(fecha) INTO v_desde, v_hasta FROM nuevas;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT MIN(fecha), MAX(fecha) INTO v_desde, v_hasta FROM antiguas;
+    ELSE
+        SELECT MIN(fecha), MAX(fecha) INTO v_desde, v_hasta
+        FROM (SELECT fecha FROM nuevas UNION ALL SELECT fecha FROM antiguas) afectadas;
+    END IF;
+
+    IF v_desde IS NOT NULL THEN
+        PERFORM refresh_covid_rollups(v_desde, v_hasta);
+        PERFORM bump_dataset_version('covid');
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION covid_cases_truncate_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE covid_daily_ccaa, covid_daily_provincia;
+    PERFORM bump_dataset_version('covid');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER covid_rollups_insert AFTER INSERT ON covid_cases
+REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION covid_cases_refresh_rollups();
+
+CREATE TRIGGER covid_rollups_update AFTER UPDATE ON covid_cases
+REFERENCING OLD TABLE AS antiguas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION covid_cases_refresh_rollups();
+
+CREATE TRIGGER covid_rollups_delete AFTER DELETE ON covid_cases
+REFERENCING OLD TABLE AS antiguas
+FOR EACH STATEMENT EXECUTE FUNCTION covid_cases_refresh_rollups();
+
+CREATE TRIGGER covid_rollups_truncate AFTER TRUNCATE ON covid_cases
+FOR EACH STATEMENT EXECUTE FUNCTION covid_cases_truncate_rollups();
+
+-- Carga inicial de los rollups con los datos demo
+SELECT refresh_covid_rollups(MIN(fecha), MAX(fecha)) FROM covid_cases;
+
+
+-- ============================================================
+-- Calidad del aire (MITECO ICA): dimensión de estaciones y lecturas
+-- horarias particionadas por día. Las ingiere el refresco en segundo
+-- plano de la API (app/services/air_quality_history.py)
+-- ============================================================
+CREATE TABLE air_quality_stations (
+    cod_estacion VARCHAR(10) PRIMARY KEY,
+    station_id INTEGER NOT NULL,
+    nombre VARCHAR(150) NOT NULL,
+    tipo VARCHAR(20),
+    station_class SMALLINT,
+    codigo_ine VARCHAR(5),
+    codigo_provincia SMALLINT,
+    codigo_ccaa SMALLINT,
+    geom GEOMETRY(Point, 4326),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_air_quality_stations_station_id ON air_quality_stations(station_id);
+CREATE INDEX idx_air_quality_stations_ccaa ON air_quality_stations(codigo_ccaa);
+CREATE INDEX idx_air_quality_stations_provincia ON air_quality_stations(codigo_provincia);
+CREATE INDEX idx_air_quality_stations_geom ON air_quality_stations USING GIST(geom);
+
+CREATE TABLE air_quality_readings (
+    cod_estacion VARCHAR(10) NOT NULL REFERENCES air_quality_stations(cod_estacion),
+    fecha TIMESTAMP NOT NULL,               -- hora de la medición (hora local MITECO)
+    indice_ica SMALLINT,                    -- 1-6, NULL si la estación no publicó índice
+    aqi SMALLINT,
+    contaminante VARCHAR(10),               -- contaminante que determina el índice
+    activa BOOLEAN NOT NULL DEFAULT TRUE,
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Histórico por estación: (cod_estacion, fecha) con poda de particiones
+    PRIMARY KEY (cod_estacion, fecha)
+) PARTITION BY RANGE (fecha);
+
+-- Últimas lecturas / rango temporal, con y sin contaminante
+CREATE INDEX idx_air_quality_readings_fecha ON air_quality_readings(fecha);
+CREATE INDEX idx_air_quality_readings_contaminante ON air_quality_readings(contaminante, fecha);
+
+-- Crea (si no existe) la partición diaria que contiene p_dia
+CREATE OR REPLACE FUNCTION air_quality_ensure_partition(p_dia DATE)
+RETURNS void AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF air_quality_readings FOR VALUES FROM (%L) TO (%L)',
+        'air_quality_readings_' || to_char(p_dia, 'YYYYMMDD'),
+        p_dia,
+        p_dia + 1
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================
+-- Vivienda (INE, Índice de Precios de Vivienda): caché actual y
+-- snapshots históricos. Espejo de backend/app/models/housing.py; las
+-- escribe HousingCacheService.save_to_cache (COPY a staging + reemplazo
+-- en una sola transacción)
+-- ============================================================
+CREATE TABLE housing_ine_cache (
+    id SERIAL PRIMARY KEY,
+    periodo VARCHAR(10) NOT NULL,
+    anio INTEGER NOT NULL,
+    trimestre INTEGER NOT NULL,
+    ccaa_codigo VARCHAR(5) NOT NULL,
+    ccaa_nombre VARCHAR(100) NOT NULL,
+    tipo_vivienda VARCHAR(100) NOT NULL,
+    metrica VARCHAR(100) NOT NULL,
+    valor DOUBLE PRECISION,
+    cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_housing_cache UNIQUE (periodo, ccaa_codigo, tipo_vivienda, metrica)
+);
+
+CREATE INDEX idx_housing_periodo ON housing_ine_cache(periodo);
+CREATE INDEX idx_housing_ccaa ON housing_ine_cache(ccaa_codigo);
+CREATE INDEX idx_housing_tipo ON housing_ine_cache(tipo_vivienda);
+-- Consultas de /api/housing/data: filtro por métrica/tipo y orden de la
+-- respuesta (anio DESC, trimestre DESC, ccaa_codigo, periodo: único por
+-- métrica y tipo) leídos del índice, con el resto de columnas incluidas
+-- (index-only scan, sin sort). Cubre también los filtros solo por métrica
+-- (sustituye a idx_housing_metrica)
+CREATE INDEX idx_housing_consulta ON housing_ine_cache(metrica, tipo_vivienda, anio DESC, trimestre DESC, ccaa_codigo, periodo)
+    INCLUDE (ccaa_nombre, valor);
+
+-- Metadatos del caché (una sola fila), escritos en la misma transacción que
+-- el refresco: la comprobación de frescura es un lookup por PK
+CREATE TABLE housing_ine_cache_meta (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version INTEGER NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL,
+    row_count INTEGER NOT NULL,
+    content_hash CHAR(64) NOT NULL
+);
+
+-- Historial deduplicado: una versión por contenido distinto publicado
+-- por el INE (hash SHA-256 del contenido canónico). Cada versión guarda
+-- solo las filas que cambian respecto a la anterior (y lápidas para las
+-- que desaparecen); las versiones base guardan el contenido completo.
+-- Estado en una versión V = última fila por clave desde la base <= V.
+CREATE TABLE housing_ine_snapshot_versions (
+    version_id SERIAL PRIMARY KEY,
+    snapshot_date TIMESTAMP NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    row_count INTEGER NOT NULL,
+    changed_rows INTEGER NOT NULL DEFAULT 0,
+    is_base BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE INDEX idx_snapshot_versions_date ON housing_ine_snapshot_versions(snapshot_date);
+
+-- Particionada por mes de snapshot_date: la retención borra particiones enteras
+CREATE TABLE housing_ine_snapshots (
+    id BIGSERIAL,
+    version_id INTEGER NOT NULL,
+    periodo VARCHAR(10) NOT NULL,
+    anio INTEGER NOT NULL,
+    trimestre INTEGER NOT NULL,
+    ccaa_codigo VARCHAR(5) NOT NULL,
+    ccaa_nombre VARCHAR(100) NOT NULL,
+    tipo_vivienda VARCHAR(100) NOT NULL,
+    metrica VARCHAR(100) NOT NULL,
+    valor DOUBLE PRECISION,
+    deleted BOOLEAN NOT NULL DEFAULT FALSE,
+    snapshot_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (id, snapshot_date)
+) PARTITION BY RANGE (snapshot_date);
+
+-- Reconstrucción del estado por métrica/tipo: DISTINCT ON (clave) ORDER BY version_id DESC
+CREATE INDEX idx_snapshot_estado ON housing_ine_snapshots(metrica, tipo_vivienda, ccaa_codigo, periodo, version_id);
+CREATE INDEX idx_snapshot_version ON housing_ine_snapshots(version_id);
+
+-- Crea (si no existe) la partición mensual que contiene p_fecha
+CREATE OR REPLACE FUNCTION housing_snapshots_ensure_partition(p_fecha TIMESTAMP)
+RETURNS void AS $$
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF housing_ine_snapshots FOR VALUES FROM (%L) TO (%L)',
+        'housing_ine_snapshots_' || to_char(p_fecha, 'YYYYMM'),
+        date_trunc('month', p_fecha),
+        date_trunc('month', p_fecha) + INTERVAL '1 month'
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Borra las particiones (y versiones) de meses anteriores a p_corte; devuelve
+-- cuántas particiones se han borrado. La versión más antigua que se conserva
+-- debe ser base (HousingCacheService.apply_retention la compacta antes)
+CREATE OR REPLACE FUNCTION housing_snapshots_drop_before(p_corte DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    particion RECORD;
+    borradas INTEGER := 0;
+BEGIN
+    FOR particion IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'housing_ine_snapshots'
+          AND c.relname ~ '^housing_ine_snapshots_[0-9]{6}$'
+          AND to_date(right(c.relname, 6), 'YYYYMM') < date_trunc('month', p_corte)
+    LOOP
+        EXECUTE format('DROP TABLE %I', particion.relname);
+        borradas := borradas + 1;
+    END LOOP;
+
+    DELETE FROM housing_ine_snapshot_versions WHERE snapshot_date < date_trunc('month', p_corte);
+    RETURN borradas;
+END;
+$$ LANGUAGE plpgsql;
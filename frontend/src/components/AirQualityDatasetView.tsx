@@ -273,7 +273,7 @@ function AirQualityDatasetView() {
       const response = await api.get('/api/air-quality/stations', {
         params: { 
           limite: 1000,
-          contaminante: selectedPollutant === 'ALL' ? 'PM2.5' : selectedPollutant,
+          // Sin filtro por contaminante: se carga una sola vez y se filtra en cliente
           solo_con_datos: false,
           light: false
         }
@@ -287,7 +287,7 @@ function AirQualityDatasetView() {
     } finally {
       setIsFiltering(false);
     }
-  }, [fullData.length, selectedPollutant]);
+  }, [fullData.length]);
 
   useEffect(() => {
     if (activeTab === 'chart' && fullData.length === 0) {
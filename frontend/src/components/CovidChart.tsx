@@ -1,18 +1,17 @@
 import { LineChart, Line, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts'
 import { FaAngleRight } from 'react-icons/fa';
 
-interface DataPoint {
-  fecha: string
-  casos: number
-  comunidad: string
+export interface CovidTimeseries {
+  fechas: string[]
+  series: { region: string; valores: number[] }[]
 }
 
 interface CovidChartProps {
-  data: DataPoint[]
+  data: CovidTimeseries | null
 }
 
 export default function CovidChart({ data }: CovidChartProps) {
-  if (!data || data.length === 0) {
+  if (!data || data.fechas.length === 0) {
     return (
       <div className="h-64 flex items-center justify-center bg-gray-50 rounded">
         <p className="text-gray-500">No hay datos para mostrar</p>
@@ -20,26 +19,24 @@ export default function CovidChart({ data }: CovidChartProps) {
     )
   }
 
-  // Agrupar por fecha para ver evolución total
-  const byDate = data.reduce((acc, curr) => {
-    if (!acc[curr.fecha]) {
-      acc[curr.fecha] = { fecha: curr.fecha, total: 0, madrid: 0, cataluna: 0 }
-    }
-    acc[curr.fecha].total += curr.casos
-    if (curr.comunidad === 'Madrid') acc[curr.fecha].madrid = curr.casos
-    if (curr.comunidad === 'Cataluña') acc[curr.fecha].cataluna = curr.casos
-    return acc
-  }, {} as Record<string, any>)
+  // Las series llegan alineadas con el eje de fechas: basta con indexar
+  const serieDe = (region: string) => data.series.find(s => s.region === region)?.valores
+  const madrid = serieDe('Madrid')
+  const cataluna = serieDe('Cataluña')
 
-  const chartData = Object.values(byDate).sort((a: any, b: any) => 
-    new Date(a.fecha).getTime() - new Date(b.fecha).getTime()
-  )
+  const chartData = data.fechas.map((fecha, i) => ({
+    fecha,
+    total: data.series.reduce((acc, s) => acc + s.valores[i], 0),
+    madrid: madrid ? madrid[i] : 0,
+    cataluna: cataluna ? cataluna[i] : 0
+  }))
 
   // Datos por comunidad (última fecha)
-  const latestData = data.filter(d => {
-    const latestDate = Math.max(...data.map(item => new Date(item.fecha).getTime()))
-    return new Date(d.fecha).getTime() === latestDate
-  })
+  const last = data.fechas.length - 1
+  const latestData = data.series.map(s => ({
+    comunidad: s.region,
+    casos: s.valores[last]
+  }))
 
   return (
     <div className="space-y-8">
@@ -2,7 +2,7 @@
 import { useEffect, useState, useCallback, useRef } from 'react'
 import axios from 'axios'
 import VanillaMap from './VanillaMap'
-import CovidChart from './CovidChart'
+import CovidChart, { CovidTimeseries } from './CovidChart'
 import CovidTable from './CovidTable'
 import { FaFilter, FaTrashAlt, FaSpinner, FaMapMarkedAlt, FaChartBar, FaTable } from 'react-icons/fa';
 
@@ -20,16 +20,10 @@ interface CovidDataLight {
   lon: number;
 }
 
-interface CovidDataFull extends CovidDataLight {
-  ingresos_uci: number;
-  fallecidos: number;
-  altas: number;
-}
-
 function CovidDatasetView() {  
   const [allCovidData, setAllCovidData] = useState<CovidDataLight[]>([]);
   const [filteredCovidData, setFilteredCovidData] = useState<CovidDataLight[]>([]);
-  const [fullData, setFullData] = useState<CovidDataFull[]>([]);
+  const [timeseries, setTimeseries] = useState<CovidTimeseries | null>(null);
   const [loading, setLoading] = useState(true);
   const [isFiltering, setIsFiltering] = useState(false);
   const [activeTab, setActiveTab] = useState<'map' | 'chart' | 'data'>('map');
@@ -102,35 +96,37 @@ function CovidDatasetView() {
     };
   }, []);
 
-  // ============ CARGAR DATOS COMPLETOS (PARA GRÁFICOS) ============
-  const loadFullData = useCallback(async () => {
-    if (fullData.length > 0) return;
+  // ============ CARGAR SERIES TEMPORALES (PARA GRÁFICOS) ============
+  const loadTimeseries = useCallback(async () => {
+    if (timeseries) return;
 
     try {
       setIsFiltering(true);
 
-      const response = await api.get('/api/covid/data', {
+      // Series ya agregadas y alineadas en el servidor (una por comunidad)
+      const response = await api.get('/api/covid/timeseries', {
         params: { 
-          limit: 10000,
-          light: false
+          nivel: 'comunidad',
+          metrica: 'casos',
+          bucket: 'day'
         }
       });
 
-      setFullData(response.data.data);
-      console.log(`✅ Datos COVID completos cargados: ${response.data.data.length} registros`);
+      setTimeseries(response.data);
+      console.log(`✅ Series COVID cargadas: ${response.data.count} comunidades x ${response.data.fechas.length} fechas`);
 
     } catch (error) {
-      console.error('Error cargando datos completos:', error);
+      console.error('Error cargando series temporales:', error);
     } finally {
       setIsFiltering(false);
     }
-  }, [fullData.length]);
+  }, [timeseries]);
 
   useEffect(() => {
-    if (activeTab === 'chart' && fullData.length === 0) {
-      loadFullData();
+    if (activeTab === 'chart' && !timeseries) {
+      loadTimeseries();
     }
-  }, [activeTab, fullData.length, loadFullData]);
+  }, [activeTab, timeseries, loadTimeseries]);
 
   // ============ APLICAR FILTROS (MANUAL) ============
   const applyFilters = useCallback(() => {
@@ -515,10 +511,10 @@ function CovidDatasetView() {
                 {isFiltering ? (
                   <div className="text-center py-5">
                     <FaSpinner className="fa-spin text-primary" size={48} />
-                    <p className="mt-3">Cargando datos completos para gráficos...</p>
+                    <p className="mt-3">Cargando series temporales para gráficos...</p>
                   </div>
                 ) : (
-                  <CovidChart data={fullData} />
+                  <CovidChart data={timeseries} />
                 )}
               </div>
             </div>
@@ -26,7 +26,7 @@ export default function CovidTable() {
   const [data, setData] = useState<CovidData[]>([]);
   const [loading, setLoading] = useState(false);
   const [hasMore, setHasMore] = useState(true);
-  const [offset, setOffset] = useState(0);
+  const [cursor, setCursor] = useState<string | null>(null);
   const [total, setTotal] = useState(0);
   const [sortField, setSortField] = useState<keyof CovidData>('fecha');
   const [sortDirection, setSortDirection] = useState<'asc' | 'desc'>('desc');
@@ -49,7 +49,9 @@ export default function CovidTable() {
       const response = await api.get('/api/covid/data', {
         params: {
           limit: ITEMS_PER_PAGE,
-          offset: offset,
+          cursor: cursor ?? undefined,
+          // El total exacto solo se pide en la primera página
+          include_total: cursor === null,
           light: false
         },
         signal: abortControllerRef.current.signal
@@ -58,9 +60,11 @@ export default function CovidTable() {
       const newData = response.data.data;
       
       setData(prev => [...prev, ...newData]);
-      setTotal(response.data.total);
+      if (response.data.total !== null) {
+        setTotal(response.data.total);
+      }
       setHasMore(response.data.has_more);
-      setOffset(prev => prev + ITEMS_PER_PAGE);
+      setCursor(response.data.next_cursor);
 
     } catch (error: any) {
       if (error.name !== 'AbortError') {
@@ -69,7 +73,7 @@ export default function CovidTable() {
     } finally {
       setLoading(false);
     }
-  }, [loading, hasMore, offset]);
+  }, [loading, hasMore, cursor]);
 
   useEffect(() => {
     const observer = new IntersectionObserver(
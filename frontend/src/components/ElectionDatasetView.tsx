@@ -117,11 +117,7 @@ function ElectionDatasetView() {
         abortControllerRef.current = new AbortController();
 
         const [lightResponse, statsResponse] = await Promise.all([
-          api.get('/api/elections/data', {
-            params: { 
-              limit: 8200,
-              light: true
-            },
+          api.get('/api/elections/map', {
             signal: abortControllerRef.current.signal
           }),
           api.get('/api/elections/stats', {